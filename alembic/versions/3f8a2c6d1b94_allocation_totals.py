@@ -0,0 +1,57 @@
+"""allocation totals
+
+Revision ID: 3f8a2c6d1b94
+Revises: 9d4e6b1c2a07
+Create Date: 2026-10-19 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f8a2c6d1b94'
+down_revision = '9d4e6b1c2a07'
+branch_labels = None
+depends_on = None
+
+TABLES = ('charityproject', 'donation')
+
+
+def upgrade():
+    for table in TABLES:
+        for column in ('open_count', 'free_amount'):
+            op.add_column('allocationstate', sa.Column(
+                f'{table}_{column}', sa.Integer(), nullable=False,
+                server_default='0',
+            ))
+    # Итоги по уже записанным объектам считаются один раз здесь,
+    # дальше их поддерживает приложение.
+    allocation_state = sa.table(
+        'allocationstate',
+        *(sa.column(f'{table}_{column}') for table in TABLES
+          for column in ('open_count', 'free_amount')),
+    )
+    values = {}
+    for name in TABLES:
+        table = sa.table(
+            name,
+            sa.column('full_amount'),
+            sa.column('invested_amount'),
+            sa.column('fully_invested', sa.Boolean),
+        )
+        open_rows = table.c.fully_invested == sa.false()
+        values[f'{name}_open_count'] = sa.select(
+            sa.func.count()
+        ).select_from(table).where(open_rows).scalar_subquery()
+        values[f'{name}_free_amount'] = sa.select(sa.func.coalesce(
+            sa.func.sum(table.c.full_amount - table.c.invested_amount), 0
+        )).where(open_rows).scalar_subquery()
+    op.execute(sa.update(allocation_state).values(values))
+
+
+def downgrade():
+    with op.batch_alter_table('allocationstate') as batch_op:
+        for table in TABLES:
+            for column in ('open_count', 'free_amount'):
+                batch_op.drop_column(f'{table}_{column}')
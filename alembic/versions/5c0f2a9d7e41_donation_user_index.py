@@ -0,0 +1,26 @@
+"""donation user index
+
+Revision ID: 5c0f2a9d7e41
+Revises: e791011f32dc
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '5c0f2a9d7e41'
+down_revision = 'e791011f32dc'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(
+        'ix_donation_user_id_create_date', 'donation',
+        ['user_id', 'create_date', 'id'],
+    )
+
+
+def downgrade():
+    op.drop_index('ix_donation_user_id_create_date', table_name='donation')
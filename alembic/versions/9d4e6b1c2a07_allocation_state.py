@@ -0,0 +1,30 @@
+"""allocation state
+
+Revision ID: 9d4e6b1c2a07
+Revises: 5c0f2a9d7e41
+Create Date: 2026-10-18 18:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9d4e6b1c2a07'
+down_revision = '5c0f2a9d7e41'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    allocation_state = op.create_table(
+        'allocationstate',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('generation', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.bulk_insert(allocation_state, [{'id': 1, 'generation': 0}])
+
+
+def downgrade():
+    op.drop_table('allocationstate')
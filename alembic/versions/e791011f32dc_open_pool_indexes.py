@@ -0,0 +1,42 @@
+"""open pool indexes
+
+Revision ID: e791011f32dc
+Revises: b1911a3b629c
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e791011f32dc'
+down_revision = 'b1911a3b629c'
+branch_labels = None
+depends_on = None
+
+TABLES = ('charityproject', 'donation')
+PARTIAL_INDEX_DIALECTS = ('sqlite', 'postgresql')
+
+
+def upgrade():
+    # Частичный индекс покрывает только открытые объекты. Там, где частичных
+    # индексов нет, строим составной индекс с fully_invested впереди.
+    dialect = op.get_bind().dialect.name
+    for table in TABLES:
+        if dialect in PARTIAL_INDEX_DIALECTS:
+            op.create_index(
+                f'ix_{table}_open_pool', table, ['create_date', 'id'],
+                sqlite_where=sa.text('fully_invested = 0'),
+                postgresql_where=sa.text('fully_invested = false'),
+            )
+        else:
+            op.create_index(
+                f'ix_{table}_open_pool', table,
+                ['fully_invested', 'create_date', 'id'],
+            )
+
+
+def downgrade():
+    for table in TABLES:
+        op.drop_index(f'ix_{table}_open_pool', table_name=table)
@@ -1,3 +1,4 @@
 from .user import router as user_router # noqa
 from .charity_project import router as charity_router # noqa
 from .donation import router as donation_router # noqa
+from .monitoring import router as monitoring_router # noqa
@@ -1,14 +1,23 @@
-from typing import List
+from typing import List, Optional
 
+from app.api.pagination import Pagination
+from app.api.projection import Projection
+from app.api.responses import encode_list, next_cursor_headers
+from app.api.streaming import stream_media_type, stream_objects
 from app.api.validators import ValidatorsClass
-from app.core.db import get_async_session
+from app.core.db import (READ_REPLICA_KEY, get_async_read_session,
+                         get_async_session)
 from app.core.user import current_superuser
 from app.crud.charity_project import charity_crud
-from app.models import Donation
-from app.schemas.charity_project import CharityCreate, CharityDB, CharityUpdate
-from app.services.investing import investing_process
+from app.models import CharityProject, Donation
+from app.schemas.charity_project import (CharityCreate, CharityDB,
+                                         CharityFunding, CharityUpdate)
+from app.services.allocation_worker import allocation_worker
+from app.services.funding import get_project_funding
+from app.services.investing import delete_and_release
+from app.services.response_cache import CachedResponse, response_cache
 
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Request, Response
 from sqlalchemy.ext.asyncio import AsyncSession
 
 router = APIRouter()
@@ -19,16 +28,88 @@ router = APIRouter()
     response_model=List[CharityDB],
     response_model_exclude_none=True
 )
-async def get_all_charity_projects(session: AsyncSession = Depends(get_async_session)) -> List[CharityDB]:
+async def get_all_charity_projects(
+        request: Request,
+        response: Response,
+        pagination: Pagination = Depends(),
+        projection: Projection = Depends(),
+        media_type: Optional[str] = Depends(stream_media_type),
+        session: AsyncSession = Depends(get_async_read_session)
+) -> List[CharityDB]:
     """
     Получает список всех благотворительных проектов из базы данных.
+    Закодированный JSON-список кешируется до следующего изменения проектов;
+    по If-None-Match с текущим ETag возвращается 304 без запроса к БД.
+    Список, прочитанный с реплики, не кешируется и отдается без ETag.
     Args:
-        session (AsyncSession, optional): Сессия базы данных. Defaults to Depends(get_async_session).
+        request (Request): Запрос; из него читается заголовок If-None-Match.
+        response (Response): Ответ, в заголовок которого пишется курсор следующей страницы.
+        pagination (Pagination): Параметры страницы; без них возвращается весь список.
+        projection (Projection): Поля ответа; без них возвращаются полные объекты.
+        media_type (Optional[str]): NDJSON или CSV из заголовка Accept; тогда список отдается потоком.
+        session (AsyncSession, optional): Сессия для чтения, с реплики, если она настроена. Defaults to Depends(get_async_read_session).
     Returns:
         List[CharityDB]: Список объектов благотворительных проектов из базы данных.
     """
-    all_charity_projects = await charity_crud.get_all_objects(session)
-    return all_charity_projects
+    schema = projection.schema(CharityDB)
+    columns = projection.columns(schema, 'id')
+    if media_type is not None:
+        return stream_objects(
+            charity_crud.all_objects_query(
+                pagination.limit, pagination.after_id, columns
+            ),
+            session, schema, media_type, rows=columns is not None,
+            exclude_none=True
+        )
+    if response_cache.matches(CharityProject, request.headers.get('if-none-match')):
+        return Response(
+            status_code=304, headers={'ETag': response_cache.etag(CharityProject)}
+        )
+    key = (pagination.limit, pagination.after_id, projection.fields)
+    cached = response_cache.get(CharityProject, key)
+    replica = False
+    if cached is None:
+        replica = bool(session.info.get(READ_REPLICA_KEY))
+        version = response_cache.version(CharityProject)
+        all_charity_projects = pagination.page(
+            await charity_crud.get_all_objects(
+                session, pagination.fetch_limit, pagination.after_id, columns
+            ),
+            response
+        )
+        cached = CachedResponse(
+            version,
+            encode_list(all_charity_projects, schema, exclude_none=True),
+            next_cursor_headers(response)
+        )
+        if not replica:
+            response_cache.set(CharityProject, key, cached)
+    headers = dict(cached.headers)
+    if not replica:
+        # Реплика может отставать: ее ответ не получает ETag текущей
+        # версии, иначе клиент получал бы 304 на устаревшие данные.
+        headers['ETag'] = response_cache.etag(CharityProject, cached.version)
+    return Response(cached.body, media_type='application/json', headers=headers)
+
+
+@router.get(
+    '/{project_id}/funding',
+    response_model=List[CharityFunding]
+)
+async def get_charity_project_funding(
+        project_id: int,
+        session: AsyncSession = Depends(get_async_session)
+) -> List[CharityFunding]:
+    """
+    Получает пожертвования, из которых профинансирован проект.
+    Args:
+        project_id (int): Идентификатор благотворительного проекта.
+        session (AsyncSession, optional): Сессия базы данных. Defaults to Depends(get_async_session).
+    Returns:
+        List[CharityFunding]: Идентификаторы пожертвований и переданные из них суммы.
+    """
+    await ValidatorsClass.check_charity_project_exists(project_id, session)
+    return await get_project_funding(project_id, session)
 
 
 @router.post(
@@ -50,12 +131,9 @@ async def create_charity_project(
          CharityDB: Объект созданного благотворительного проекта.
     """
     await ValidatorsClass.check_name_duplicate(charity_project.name, session)
-    new_charity = await charity_crud.create(
-        charity_project,
-        session
+    return await allocation_worker.create_and_invest(
+        charity_crud, charity_project, Donation, CharityDB, session
     )
-    await investing_process(new_charity, Donation, session)
-    return new_charity
 
 
 @router.delete(
@@ -77,8 +155,7 @@ async def delete_charity_project(
     """
     delete_charity = await ValidatorsClass.check_charity_project_exists(project_id, session)
     ValidatorsClass.check_invested_amount_in_project(delete_charity)
-    delete_charity = await charity_crud.delete(delete_charity, session)
-    return delete_charity
+    return await delete_and_release(charity_crud, delete_charity, session)
 
 
 @router.patch(
@@ -93,6 +170,8 @@ async def update_charity_project(
 ) -> CharityDB:
     """
     Обновляет информацию о благотворительном проекте в базе данных.
+    Если изменилась требуемая сумма, проект в той же транзакции забирает
+    свободные деньги пожертвований или закрывается при равенстве вложенной.
     Args:
         project_id (int): Идентификатор благотворительного проекта для обновления.
         obj_in (CharityUpdate): Объект с информацией для обновления благотворительного проекта.
@@ -112,7 +191,6 @@ async def update_charity_project(
         ValidatorsClass.count_sum_in_invested_amount(
             charity_project, obj_in.full_amount
         )
-    charity_project = await charity_crud.update(
-        charity_project, obj_in, session
+    return await allocation_worker.update_and_invest(
+        charity_crud, charity_project, obj_in, Donation, CharityDB, session
     )
-    return charity_project
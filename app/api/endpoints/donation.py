@@ -1,13 +1,19 @@
-from typing import List
+from datetime import datetime
+from typing import List, Optional
 
-from app.core.db import get_async_session
+from app.api.pagination import Pagination
+from app.api.projection import Projection
+from app.api.responses import list_response
+from app.api.streaming import stream_media_type, stream_objects
+from app.core.db import get_async_read_session, get_async_session
 from app.core.user import current_user
 from app.crud.donation import donation_crud
 from app.models import CharityProject, User
-from app.schemas.donation import DonationCreate, DonationDB, DonationUser
-from app.services.investing import investing_process
+from app.schemas.donation import (DonationBatchCreate, DonationCreate,
+                                  DonationDB, DonationUser)
+from app.services.allocation_worker import allocation_worker
 
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Response
 from sqlalchemy.ext.asyncio import AsyncSession
 
 router = APIRouter()
@@ -18,16 +24,43 @@ router = APIRouter()
     response_model=List[DonationDB],
     response_model_exclude_none=True
 )
-async def get_all_donation(session: AsyncSession = Depends(get_async_session)) -> List[DonationDB]:
+async def get_all_donation(
+        response: Response,
+        pagination: Pagination = Depends(),
+        projection: Projection = Depends(),
+        media_type: Optional[str] = Depends(stream_media_type),
+        session: AsyncSession = Depends(get_async_read_session)
+) -> List[DonationDB]:
     """
     Получение всех пожертвований.
     Args:
-        session: Сессия базы данных.
+        response (Response): Ответ, в заголовок которого пишется курсор следующей страницы.
+        pagination (Pagination): Параметры страницы; без них возвращается весь список.
+        projection (Projection): Поля ответа; без них возвращаются полные объекты.
+        media_type (Optional[str]): NDJSON или CSV из заголовка Accept; тогда список отдается потоком.
+        session: Сессия для чтения, с реплики, если она настроена.
     Returns:
         List[DonationDB]: Список всех пожертвований.
     """
-    all_donations = await donation_crud.get_all_objects(session)
-    return all_donations
+    schema = projection.schema(DonationDB)
+    columns = projection.columns(schema, 'id')
+    if media_type is not None:
+        return stream_objects(
+            donation_crud.all_objects_query(
+                pagination.limit, pagination.after_id, columns
+            ),
+            session, schema, media_type, rows=columns is not None,
+            exclude_none=True
+        )
+    all_donations = pagination.page(
+        await donation_crud.get_all_objects(
+            session, pagination.fetch_limit, pagination.after_id, columns
+        ),
+        response
+    )
+    if columns is None:
+        return all_donations
+    return list_response(all_donations, schema, response, exclude_none=True)
 
 
 @router.post(
@@ -49,9 +82,35 @@ async def create_donation(
     Returns:
         DonationUser: Информация о пожертвовании и его авторе.
     """
-    send_donation = await donation_crud.create(donation_create, session, user)
-    await investing_process(send_donation, CharityProject, session)
-    return send_donation
+    return await allocation_worker.create_and_invest(
+        donation_crud, donation_create, CharityProject, DonationUser,
+        session, user
+    )
+
+
+@router.post(
+    '/batch',
+    response_model=List[DonationUser],
+    response_model_exclude_none=True
+)
+async def create_donation_batch(
+        donations_create: DonationBatchCreate,
+        session: AsyncSession = Depends(get_async_session),
+        user: User = Depends(current_user)
+) -> List[DonationUser]:
+    """
+    Создание пачки пожертвований одним запросом.
+    Args:
+        donations_create (DonationBatchCreate): Список новых пожертвований.
+        session (AsyncSession, optional): Сессия базы данных. По умолчанию `Depends(get_async_session)`.
+        user (User, optional): Текущий пользователь. По умолчанию `Depends(current_user)`.
+    Returns:
+        List[DonationUser]: Созданные пожертвования в порядке запроса.
+    """
+    return await allocation_worker.create_batch_and_invest(
+        donation_crud, donations_create, CharityProject, DonationUser,
+        session, user
+    )
 
 
 @router.get(
@@ -60,16 +119,49 @@ async def create_donation(
     response_model_exclude={'user_id'},
 )
 async def get_my_donation(
-        session: AsyncSession = Depends(get_async_session),
+        response: Response,
+        pagination: Pagination = Depends(),
+        date_from: Optional[datetime] = None,
+        date_to: Optional[datetime] = None,
+        projection: Projection = Depends(),
+        media_type: Optional[str] = Depends(stream_media_type),
+        session: AsyncSession = Depends(get_async_read_session),
         user: User = Depends(current_user)
 ) -> List[DonationUser]:
     """
-    Получение всех пожертвований, сделанных текущим пользователем.
+    Получение всех пожертвований, сделанных текущим пользователем,
+    в порядке создания.
     Args:
-        session: Сессия базы данных.
+        response (Response): Ответ, в заголовок которого пишется курсор следующей страницы.
+        pagination (Pagination): Параметры страницы; без них возвращается весь список.
+        date_from (Optional[datetime]): Начало периода по дате создания, включительно.
+        date_to (Optional[datetime]): Конец периода по дате создания, включительно.
+        projection (Projection): Поля ответа; без них возвращаются полные объекты.
+        media_type (Optional[str]): NDJSON или CSV из заголовка Accept; тогда список отдается потоком.
+        session: Сессия для чтения, с реплики, если она настроена.
         user (User, optional): Текущий пользователь. По умолчанию `Depends(current_user)`.
     Returns:
         List[DonationUser]: Список всех пожертвований, сделанных текущим пользователем.
     """
-    donations = await donation_crud.get_my_donation(session, user)
-    return donations
+    after = pagination.after(datetime.fromisoformat, int)
+    schema = projection.schema(DonationUser)
+    columns = projection.columns(schema, 'create_date', 'id')
+    if media_type is not None:
+        return stream_objects(
+            donation_crud.my_donation_query(
+                user, pagination.limit, after, date_from, date_to, columns
+            ),
+            session, schema, media_type, exclude={'user_id'},
+            rows=columns is not None
+        )
+    donations = pagination.page(
+        await donation_crud.get_my_donation(
+            session, user, pagination.fetch_limit, after, date_from, date_to,
+            columns
+        ),
+        response,
+        key=lambda donation: (donation.create_date, donation.id)
+    )
+    if columns is None:
+        return donations
+    return list_response(donations, schema, response, exclude={'user_id'})
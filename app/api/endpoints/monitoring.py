@@ -0,0 +1,64 @@
+from app.core.db import get_async_session
+from app.core.user import current_superuser
+from app.schemas.monitoring import (AllocationMonitoring,
+                                    PasswordHashingMonitoring,
+                                    UserCacheMonitoring)
+from app.services.allocation_pool import allocation_pool
+from app.services.investing import allocation_stats
+from app.services.password_pool import password_pool
+from app.services.user_cache import user_cache
+
+from fastapi import APIRouter, Depends
+from sqlalchemy.ext.asyncio import AsyncSession
+
+router = APIRouter()
+
+
+@router.get(
+    '/allocation',
+    response_model=AllocationMonitoring,
+    dependencies=[Depends(current_superuser)]
+)
+async def get_allocation_monitoring(
+        session: AsyncSession = Depends(get_async_session)
+) -> AllocationMonitoring:
+    """
+    Возвращает итоги открытых объектов из строки allocationstate
+    и статистику распределения этого процесса. Только чтение.
+    Args:
+        session (AsyncSession, optional): Сессия базы данных. Defaults to Depends(get_async_session).
+    Returns:
+        AllocationMonitoring: Итоги открытых объектов и статистика распределения.
+    """
+    return AllocationMonitoring(
+        **await allocation_pool.read_totals(session),
+        **allocation_stats.as_dict()
+    )
+
+
+@router.get(
+    '/user_cache',
+    response_model=UserCacheMonitoring,
+    dependencies=[Depends(current_superuser)]
+)
+async def get_user_cache_monitoring() -> UserCacheMonitoring:
+    """
+    Возвращает размер кеша пользователей и счетчики попаданий и промахов.
+    Returns:
+        UserCacheMonitoring: Счетчики кеша пользователей.
+    """
+    return UserCacheMonitoring(**user_cache.counters())
+
+
+@router.get(
+    '/password_hashing',
+    response_model=PasswordHashingMonitoring,
+    dependencies=[Depends(current_superuser)]
+)
+async def get_password_hashing_monitoring() -> PasswordHashingMonitoring:
+    """
+    Возвращает загрузку пула хеширования паролей и время ожидания в очереди.
+    Returns:
+        PasswordHashingMonitoring: Счетчики пула хеширования паролей.
+    """
+    return PasswordHashingMonitoring(**password_pool.counters())
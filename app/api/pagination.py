@@ -0,0 +1,102 @@
+import binascii
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from typing import Callable, List, Optional, Sequence, Tuple
+
+from app.core.config import settings
+
+from fastapi import HTTPException, Query, Response
+from fastapi.encoders import jsonable_encoder
+
+NEXT_CURSOR_HEADER = 'X-Next-Cursor'
+
+
+def encode_cursor(values: Sequence) -> str:
+    """
+    Упаковывает значения ключа последней строки страницы в непрозрачную строку.
+    """
+    payload = json.dumps(jsonable_encoder(list(values)), separators=(',', ':'))
+    return urlsafe_b64encode(payload.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> list:
+    try:
+        values = json.loads(urlsafe_b64decode(cursor.encode()))
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        values = None
+    if not isinstance(values, list):
+        raise HTTPException(status_code=400, detail='Некорректный курсор!')
+    return values
+
+
+class Pagination:
+    """
+    Зависимость для постраничного (keyset) чтения списков.
+    Атрибуты:
+        ---------
+        limit : Optional[int]
+            Размер страницы; None, если клиент не просил пагинацию,
+            и тогда список отдается целиком, как раньше.
+        cursor : Optional[list]
+            Значения ключа последней строки предыдущей страницы.
+
+    Курсор следующей страницы передается в заголовке X-Next-Cursor,
+    поэтому тело ответа остается списком.
+    """
+
+    def __init__(
+            self,
+            limit: Optional[int] = Query(
+                None, ge=1, le=settings.page_max_size,
+                description='Размер страницы'
+            ),
+            cursor: Optional[str] = Query(
+                None, description='Курсор из заголовка X-Next-Cursor'
+            ),
+    ):
+        self.cursor = decode_cursor(cursor) if cursor is not None else None
+        if limit is None and cursor is not None:
+            limit = settings.page_default_size
+        self.limit = limit
+
+    @property
+    def fetch_limit(self) -> Optional[int]:
+        """
+        Сколько строк читать из БД: на одну больше страницы,
+        чтобы узнать, есть ли следующая.
+        """
+        return self.limit + 1 if self.limit is not None else None
+
+    def after(self, *types: Callable) -> Optional[Tuple]:
+        """
+        Возвращает ключ курсора, приведенный к типам types,
+        или None для первой страницы.
+        """
+        if self.cursor is None:
+            return None
+        if len(self.cursor) != len(types):
+            raise HTTPException(status_code=400, detail='Некорректный курсор!')
+        try:
+            return tuple(type_(value) for type_, value in zip(types, self.cursor))
+        except (TypeError, ValueError):
+            raise HTTPException(status_code=400, detail='Некорректный курсор!')
+
+    @property
+    def after_id(self) -> Optional[int]:
+        after = self.after(int)
+        return after[0] if after is not None else None
+
+    def page(
+            self,
+            objects: List,
+            response: Response,
+            key: Callable = lambda obj: (obj.id,),
+    ) -> List:
+        """
+        Обрезает лишнюю строку и, если она была, выставляет курсор
+        следующей страницы.
+        """
+        if self.limit is not None and len(objects) > self.limit:
+            objects = objects[:self.limit]
+            response.headers[NEXT_CURSOR_HEADER] = encode_cursor(key(objects[-1]))
+        return objects
@@ -0,0 +1,84 @@
+from functools import lru_cache
+from typing import Optional, Tuple, Type
+
+from app.core.config import settings
+
+from fastapi import HTTPException, Query
+from pydantic import BaseConfig, BaseModel, create_model
+
+
+class ProjectionConfig(BaseConfig):
+    orm_mode = True
+
+
+@lru_cache(maxsize=None)
+def projected_schema(schema: Type[BaseModel], fields: Tuple[str, ...]) -> Type[BaseModel]:
+    """
+    Возвращает схему только с полями fields схемы schema.
+    Схемы создаются один раз на набор полей и переиспользуются.
+    """
+    return create_model(
+        f'{schema.__name__}Fields',
+        __config__=ProjectionConfig,
+        **{
+            name: (Optional[schema.__fields__[name].outer_type_], None)
+            for name in fields
+        }
+    )
+
+
+class Projection:
+    """
+    Зависимость для выбора полей ответа списка.
+    Атрибуты:
+        ---------
+        fields : Optional[Tuple[str, ...]]
+            Запрошенные поля в порядке запроса; None, если клиент
+            просит полные объекты.
+
+    С fields из БД читаются только нужные столбцы в виде строк,
+    без создания ORM-объектов.
+    """
+
+    def __init__(
+            self,
+            fields: Optional[str] = Query(
+                None, description='Поля ответа через запятую, например id,name'
+            ),
+    ):
+        self.fields = None
+        if fields:
+            self.fields = tuple(dict.fromkeys(
+                field.strip() for field in fields.split(',') if field.strip()
+            )) or None
+
+    def schema(self, schema: Type[BaseModel]) -> Type[BaseModel]:
+        """
+        Возвращает схему ответа: исходную или урезанную до fields.
+        """
+        if self.fields is None:
+            return schema
+        unknown = [field for field in self.fields if field not in schema.__fields__]
+        if unknown:
+            raise HTTPException(
+                status_code=400,
+                detail=f'Неизвестные поля: {", ".join(unknown)}!'
+            )
+        return projected_schema(schema, self.fields)
+
+    def columns(
+            self,
+            schema: Type[BaseModel],
+            *keys: str
+    ) -> Optional[Tuple[str, ...]]:
+        """
+        Столбцы для запроса: запрошенные поля и ключи курсора keys.
+        Без fields столбцы выбираются, только если включен быстрый
+        путь orjson_responses: тогда берутся все поля схемы schema.
+        """
+        fields = self.fields
+        if fields is None:
+            if not settings.orjson_responses:
+                return None
+            fields = tuple(schema.__fields__)
+        return fields + tuple(key for key in keys if key not in fields)
@@ -0,0 +1,78 @@
+from typing import Iterable, Optional, Set, Type
+
+from app.api.pagination import NEXT_CURSOR_HEADER
+from app.core.config import settings
+
+from fastapi import Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def encode_rows(
+        rows: Iterable,
+        schema: Type[BaseModel],
+        exclude: Optional[Set[str]] = None,
+        exclude_none: bool = False
+) -> bytes:
+    """
+    Кодирует строки, выбранные по полям схемы, прямо в JSON через orjson,
+    без проверки каждой строки схемой. Имена и порядок полей, пропуск None
+    и формат дат совпадают с ответом FastAPI.
+    """
+    fields = [field for field in schema.__fields__ if field not in (exclude or ())]
+    objects = []
+    for row in rows:
+        data = {field: getattr(row, field) for field in fields}
+        if exclude_none:
+            data = {field: value for field, value in data.items() if value is not None}
+        objects.append(data)
+    return orjson.dumps(objects)
+
+
+def encode_list(
+        objects: Iterable,
+        schema: Type[BaseModel],
+        exclude: Optional[Set[str]] = None,
+        exclude_none: bool = False
+) -> bytes:
+    """
+    Кодирует объекты или строки так же, как FastAPI кодирует
+    response_model=List[schema]. С orjson_responses на вход приходят
+    строки из Projection.columns, и они кодируются через encode_rows.
+    """
+    if settings.orjson_responses:
+        return encode_rows(objects, schema, exclude, exclude_none)
+    return JSONResponse(jsonable_encoder(
+        [schema.from_orm(obj) for obj in objects],
+        exclude=exclude,
+        exclude_none=exclude_none
+    )).body
+
+
+def next_cursor_headers(response: Response) -> dict:
+    """
+    Заголовок курсора, выставленный Pagination.page, для ответа,
+    который возвращается из эндпоинта напрямую.
+    """
+    next_cursor = response.headers.get(NEXT_CURSOR_HEADER)
+    return {NEXT_CURSOR_HEADER: next_cursor} if next_cursor else {}
+
+
+def list_response(
+        objects: Iterable,
+        schema: Type[BaseModel],
+        response: Response,
+        exclude: Optional[Set[str]] = None,
+        exclude_none: bool = False
+) -> Response:
+    return Response(
+        encode_list(objects, schema, exclude, exclude_none),
+        media_type='application/json',
+        headers=next_cursor_headers(response)
+    )
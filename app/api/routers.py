@@ -1,8 +1,10 @@
-from app.api.endpoints import charity_router, donation_router, user_router
+from app.api.endpoints import (charity_router, donation_router,
+                               monitoring_router, user_router)
+from app.services.allocation_lock import sync_shared_state
 
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends
 
-main_router = APIRouter()
+main_router = APIRouter(dependencies=[Depends(sync_shared_state)])
 
 main_router.include_router(user_router)
 
@@ -17,3 +19,9 @@ main_router.include_router(
     prefix='/donation',
     tags=['donation']
 )
+
+main_router.include_router(
+    monitoring_router,
+    prefix='/monitoring',
+    tags=['monitoring']
+)
@@ -0,0 +1,120 @@
+import csv
+import io
+from datetime import datetime
+from typing import AsyncIterator, Iterable, Optional, Set, Type
+
+from app.core.config import settings
+
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql import Select
+
+NDJSON_MEDIA_TYPE = 'application/x-ndjson'
+CSV_MEDIA_TYPE = 'text/csv'
+STREAM_MEDIA_TYPES = (NDJSON_MEDIA_TYPE, CSV_MEDIA_TYPE)
+
+
+def stream_media_type(request: Request) -> Optional[str]:
+    """
+    Зависимость: потоковый формат из заголовка Accept или None,
+    если клиент ждет обычный JSON-список.
+    """
+    accept = request.headers.get('accept', '')
+    for media_type in STREAM_MEDIA_TYPES:
+        if media_type in accept:
+            return media_type
+    return None
+
+
+def csv_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def encode_ndjson(
+        objects: Iterable,
+        schema: Type[BaseModel],
+        exclude: Set[str],
+        exclude_none: bool = False
+) -> bytes:
+    return ''.join(
+        schema.from_orm(obj).json(
+            exclude=exclude, exclude_none=exclude_none
+        ) + '\n'
+        for obj in objects
+    ).encode()
+
+
+def encode_csv(
+        objects: Iterable,
+        schema: Type[BaseModel],
+        exclude: Set[str],
+        header: bool = False
+) -> bytes:
+    columns = [field for field in schema.__fields__ if field not in exclude]
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(columns)
+    for obj in objects:
+        data = schema.from_orm(obj).dict(include=set(columns))
+        writer.writerow([csv_value(data[column]) for column in columns])
+    return buffer.getvalue().encode()
+
+
+async def encode_partitions(
+        query: Select,
+        session: AsyncSession,
+        schema: Type[BaseModel],
+        media_type: str,
+        exclude: Set[str],
+        rows: bool = False,
+        exclude_none: bool = False
+) -> AsyncIterator[bytes]:
+    """
+    Читает строки из БД порциями по stream_chunk_size и отдает
+    каждую порцию одним куском ответа. Если rows, запрос выбирает
+    отдельные столбцы, и порции состоят из строк, а не ORM-объектов.
+    exclude_none повторяет response_model_exclude_none эндпоинта,
+    чтобы строки NDJSON совпадали с элементами обычного ответа.
+    """
+    if media_type == CSV_MEDIA_TYPE:
+        yield encode_csv((), schema, exclude, header=True)
+    query = query.execution_options(yield_per=settings.stream_chunk_size)
+    if rows:
+        result = await session.stream(query)
+    else:
+        result = await session.stream_scalars(query)
+    async for partition in result.partitions():
+        if media_type == CSV_MEDIA_TYPE:
+            yield encode_csv(partition, schema, exclude)
+        else:
+            yield encode_ndjson(partition, schema, exclude, exclude_none)
+
+
+def stream_objects(
+        query: Select,
+        session: AsyncSession,
+        schema: Type[BaseModel],
+        media_type: str,
+        exclude: Optional[Set[str]] = None,
+        rows: bool = False,
+        exclude_none: bool = False
+) -> StreamingResponse:
+    """
+    Возвращает список объектов потоком NDJSON или CSV. Сессия остается
+    открытой до конца ответа: зависимость get_async_session закрывает
+    ее только после отправки ответа.
+    """
+    return StreamingResponse(
+        encode_partitions(
+            query, session, schema, media_type, exclude or set(), rows,
+            exclude_none
+        ),
+        media_type=media_type,
+    )
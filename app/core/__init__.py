@@ -1,2 +1,2 @@
 from app.core.db import Base  # noqa
-from app.models import CharityProject, Donation, User  # noqa
+from app.models import AllocationState, CharityProject, Donation, User  # noqa
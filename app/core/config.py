@@ -10,6 +10,33 @@ class Settings(BaseSettings):
     secret: str = 'SECRET'
     first_superuser_email: Optional[EmailStr] = None
     first_superuser_password: Optional[str] = None
+    allocation_pool: bool = True
+    allocation_page_size: int = 100
+    donation_batch_max_size: int = 1000
+    page_default_size: int = 100
+    page_max_size: int = 1000
+    stream_chunk_size: int = 1000
+    orjson_responses: bool = False
+    allocation_worker: bool = False
+    allocation_worker_window: float = 0.005
+    allocation_worker_batch_size: int = 100
+    allocation_lock: str = 'none'
+    allocation_lock_path: str = './allocation.lock'
+    allocation_sync_interval: float = 1
+    engine_pool_size: Optional[int] = None
+    engine_max_overflow: Optional[int] = None
+    engine_pool_pre_ping: bool = False
+    engine_statement_cache_size: Optional[int] = None
+    sqlite_journal_mode: Optional[str] = None
+    sqlite_synchronous: Optional[str] = None
+    sqlite_mmap_size: Optional[int] = None
+    sqlite_cache_size: Optional[int] = None
+    sqlite_busy_timeout: Optional[int] = None
+    replica_url: Optional[str] = None
+    read_your_writes_seconds: int = 5
+    user_cache_size: int = 1024
+    user_cache_ttl: float = 60
+    password_hash_workers: int = 2
 
     class Config:
         env_file = '.env'
@@ -1,8 +1,22 @@
-from app.core.config import settings
+from functools import partial
+from typing import Dict, Optional
 
-from sqlalchemy import Column, Integer
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from app.core.config import Settings, settings
+
+from fastapi import Depends, Request, Response
+from sqlalchemy import Column, Integer, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
 from sqlalchemy.orm import declarative_base, declared_attr, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+SQLITE_PRAGMAS = (
+    'journal_mode', 'synchronous', 'mmap_size', 'cache_size', 'busy_timeout',
+)
+READ_PRIMARY_HEADER = 'X-Read-Primary'
+READ_PRIMARY_COOKIE = 'read_primary'
+READ_REPLICA_KEY = 'read_replica'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
 
 
 class PreBase:
@@ -18,8 +32,80 @@ class PreBase:
 
 
 Base = declarative_base(cls=PreBase)
-engine = create_async_engine(settings.database_url)
+
+
+def engine_options(config: Settings) -> dict:
+    """
+    Параметры движка из настроек. Передаются только заданные параметры,
+    чтобы для остальных действовали значения по умолчанию диалекта.
+    Размер пула или переполнение для SQLite включают пул соединений:
+    без него aiosqlite открывает новое соединение на каждую сессию,
+    а NullPool этих параметров не принимает.
+    """
+    options = {}
+    if config.engine_pool_size is not None:
+        options['pool_size'] = config.engine_pool_size
+    if config.engine_max_overflow is not None:
+        options['max_overflow'] = config.engine_max_overflow
+    if options and make_url(config.database_url).get_backend_name() == 'sqlite':
+        options['poolclass'] = AsyncAdaptedQueuePool
+    if config.engine_pool_pre_ping:
+        options['pool_pre_ping'] = True
+    if config.engine_statement_cache_size is not None:
+        options['query_cache_size'] = config.engine_statement_cache_size
+    return options
+
+
+def sqlite_pragmas(config: Settings) -> Dict[str, object]:
+    return {
+        name: getattr(config, f'sqlite_{name}')
+        for name in SQLITE_PRAGMAS
+        if getattr(config, f'sqlite_{name}') is not None
+    }
+
+
+def set_sqlite_pragmas(pragmas: Dict[str, object], dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for name, value in pragmas.items():
+        cursor.execute(f'PRAGMA {name}={value}')
+    cursor.close()
+
+
+def build_engine(config: Settings = settings) -> AsyncEngine:
+    """
+    Создает движок по настройкам config. Прагмы SQLite выполняются
+    на каждом новом соединении через событие connect.
+    """
+    engine = create_async_engine(config.database_url, **engine_options(config))
+    pragmas = sqlite_pragmas(config)
+    if pragmas and engine.dialect.name == 'sqlite':
+        event.listen(
+            engine.sync_engine, 'connect', partial(set_sqlite_pragmas, pragmas)
+        )
+    return engine
+
+
+def build_read_engine(config: Settings = settings) -> Optional[AsyncEngine]:
+    """
+    Создает движок только для чтения по replica_url или None,
+    если реплика не настроена. Режим журнала SQLite на нем не меняется:
+    соединение только для чтения не может его записать.
+    """
+    if config.replica_url is None:
+        return None
+    return build_engine(config.copy(update={
+        'database_url': config.replica_url,
+        'sqlite_journal_mode': None,
+    }))
+
+
+engine = build_engine()
 AsyncSessionLocal = sessionmaker(engine, class_=AsyncSession)
+read_engine = build_read_engine()
+ReadSessionLocal = (
+    sessionmaker(read_engine, class_=AsyncSession, info={READ_REPLICA_KEY: True})
+    if read_engine is not None else None
+)
 
 
 async def get_async_session():
@@ -29,3 +115,49 @@ async def get_async_session():
     """
     async with AsyncSessionLocal() as async_session:
         yield async_session
+
+
+def reads_primary(request: Request) -> bool:
+    """
+    Проверяет, просит ли клиент читать с основной БД: заголовком
+    X-Read-Primary или cookie, выставленной после его записи.
+    """
+    return bool(
+        request.headers.get(READ_PRIMARY_HEADER) or
+        request.cookies.get(READ_PRIMARY_COOKIE)
+    )
+
+
+async def get_async_read_session(
+        request: Request,
+        session: AsyncSession = Depends(get_async_session)
+):
+    """
+    Сессия для эндпоинтов, которые только читают. Если настроена реплика
+    и клиент недавно ничего не записывал, сессия читает с реплики,
+    иначе используется обычная сессия основной БД.
+    """
+    if ReadSessionLocal is None or reads_primary(request):
+        yield session
+        return
+    async with ReadSessionLocal() as read_session:
+        yield read_session
+
+
+async def read_your_writes(request: Request, call_next) -> Response:
+    """
+    Middleware: после успешного изменяющего запроса выставляет cookie,
+    по которой следующие чтения клиента в течение read_your_writes_seconds
+    идут на основную БД и видят его запись.
+    """
+    response = await call_next(request)
+    if (
+        ReadSessionLocal is not None and
+        request.method not in SAFE_METHODS and
+        response.status_code < 400
+    ):
+        response.set_cookie(
+            READ_PRIMARY_COOKIE, '1',
+            max_age=settings.read_your_writes_seconds, httponly=True
+        )
+    return response
@@ -1,14 +1,21 @@
-from typing import Optional, Union
+from typing import Any, Dict, Optional, Union
+
+import jwt
 
 from app.core.config import settings
 from app.core.db import get_async_session
 from app.models.user import User
 from app.schemas.user import UserCreate
+from app.services.allocation_lock import allocation_lock
+from app.services.password_pool import PooledPasswordHelper
+from app.services.user_cache import user_cache
 from fastapi import Depends, Request
+from fastapi.security import OAuth2PasswordRequestForm
 from fastapi_users import (BaseUserManager, FastAPIUsers, IntegerIDMixin,
-                           InvalidPasswordException)
+                           InvalidPasswordException, exceptions)
 from fastapi_users.authentication import (AuthenticationBackend,
                                           BearerTransport, JWTStrategy)
+from fastapi_users.jwt import decode_jwt
 from fastapi_users_db_sqlalchemy import SQLAlchemyUserDatabase
 from sqlalchemy.ext.asyncio import AsyncSession
 
@@ -19,8 +26,41 @@ async def get_user_db(session: AsyncSession = Depends(get_async_session)):
 bearer_transport = BearerTransport(tokenUrl='auth/jwt/login')
 
 
+class CachingJWTStrategy(JWTStrategy):
+    """
+    JWT-стратегия, которая после проверки токена берет пользователя
+    из user_cache и идет в БД только при промахе. Подпись и срок
+    действия токена проверяются на каждом запросе.
+    """
+
+    async def read_token(
+            self,
+            token: Optional[str],
+            user_manager: BaseUserManager[User, int]
+    ) -> Optional[User]:
+        if token is None:
+            return None
+        try:
+            data = decode_jwt(
+                token, self.decode_key, self.token_audience,
+                algorithms=[self.algorithm]
+            )
+            user_id = user_manager.parse_id(data['user_id'])
+        except (jwt.PyJWTError, KeyError, exceptions.InvalidID):
+            return None
+        user = user_cache.get(user_id)
+        if user is not None:
+            return user
+        try:
+            user = await user_manager.get(user_id)
+        except exceptions.UserNotExists:
+            return None
+        user_cache.set(user)
+        return user
+
+
 def get_jwt_strategy() -> JWTStrategy:
-    return JWTStrategy(settings.secret, lifetime_seconds=3600)
+    return CachingJWTStrategy(settings.secret, lifetime_seconds=3600)
 
 
 auth_backend = AuthenticationBackend(
@@ -31,6 +71,73 @@ auth_backend = AuthenticationBackend(
 
 
 class UserManager(IntegerIDMixin, BaseUserManager[User, int]):
+    """
+    Менеджер пользователей с PooledPasswordHelper: перед методами
+    библиотеки, которые хешируют или проверяют пароль, менеджер готовит
+    результат в password_pool, а не в цикле событий. Один bcrypt-хеш
+    занимает десятки миллисекунд, и на это время встали бы все остальные
+    запросы.
+    """
+    password_helper: PooledPasswordHelper
+
+    async def create(
+        self,
+        user_create: UserCreate,
+        safe: bool = False,
+        request: Optional[Request] = None,
+    ) -> User:
+        # Повторяет BaseUserManager.create, но хеш считается в пуле и только
+        # после проверки пароля и email: отклоненная регистрация не должна
+        # стоить целого bcrypt.
+        await self.validate_password(user_create.password, user_create)
+        if await self.user_db.get_by_email(user_create.email) is not None:
+            raise exceptions.UserAlreadyExists()
+        user_dict = (
+            user_create.create_update_dict()
+            if safe
+            else user_create.create_update_dict_superuser()
+        )
+        password = user_dict.pop('password')
+        await self.password_helper.prepare_hash(password)
+        user_dict['hashed_password'] = self.password_helper.hash(password)
+        created_user = await self.user_db.create(user_dict)
+        await self.on_after_register(created_user, request)
+        return created_user
+
+    async def authenticate(
+        self, credentials: OAuth2PasswordRequestForm
+    ) -> Optional[User]:
+        # Повторяет BaseUserManager.authenticate с одним запросом за
+        # пользователем. Хеш считается и для несуществующего email, как
+        # в библиотеке, чтобы по времени ответа нельзя было узнать,
+        # зарегистрирован ли он.
+        try:
+            user = await self.get_by_email(credentials.username)
+        except exceptions.UserNotExists:
+            await self.password_helper.prepare_hash(credentials.password)
+            self.password_helper.hash(credentials.password)
+            return None
+        await self.password_helper.prepare_verify(
+            credentials.password, user.hashed_password
+        )
+        verified, updated_password_hash = (
+            self.password_helper.verify_and_update(
+                credentials.password, user.hashed_password
+            )
+        )
+        if not verified:
+            return None
+        if updated_password_hash is not None:
+            await self.user_db.update(
+                user, {'hashed_password': updated_password_hash}
+            )
+        return user
+
+    async def _update(self, user: User, update_dict: Dict[str, Any]) -> User:
+        if update_dict.get('password') is not None:
+            await self.password_helper.prepare_hash(update_dict['password'])
+        return await super()._update(user, update_dict)
+
     async def validate_password(
             self,
             password: str,
@@ -50,9 +157,38 @@ class UserManager(IntegerIDMixin, BaseUserManager[User, int]):
     ) -> None:
         print(f'Пользователь {user.email} зарегистрирован.')
 
+    async def on_after_update(
+        self,
+        user: User,
+        update_dict: Dict[str, Any],
+        request: Optional[Request] = None,
+    ) -> None:
+        user_cache.invalidate(user.id)
+        await allocation_lock.bump(self.user_db.session)
+
+    async def on_after_verify(
+        self, user: User, request: Optional[Request] = None
+    ) -> None:
+        user_cache.invalidate(user.id)
+        await allocation_lock.bump(self.user_db.session)
+
+    async def on_after_reset_password(
+        self, user: User, request: Optional[Request] = None
+    ) -> None:
+        user_cache.invalidate(user.id)
+        await allocation_lock.bump(self.user_db.session)
+
+    async def delete(self, user: User) -> None:
+        # В этой версии fastapi-users нет хука on_after_delete, а удаленный
+        # пользователь не должен входить по токену из кеша.
+        user_id = user.id
+        await super().delete(user)
+        user_cache.invalidate(user_id)
+        await allocation_lock.bump(self.user_db.session)
+
 
 async def get_user_manager(user_db=Depends(get_user_db)):
-    yield UserManager(user_db)
+    yield UserManager(user_db, PooledPasswordHelper())
 
 
 fastapi_users = FastAPIUsers[User, int](
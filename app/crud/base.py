@@ -1,10 +1,14 @@
-from typing import Optional
+from typing import List, Optional, Sequence
 
 from app.models import User
+from app.services.allocation_pool import allocation_pool, open_totals
+from app.services.funding import funding_index
+from app.services.response_cache import response_cache
 
 from fastapi.encoders import jsonable_encoder
-from sqlalchemy import select
+from sqlalchemy import bindparam, func, insert, select
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql import Select
 
 
 class CRUDBase:
@@ -21,42 +25,141 @@ class CRUDBase:
 
     def __init__(self, model):
         self.model = model
+        self.object_query = select(self.model).where(
+            self.model.id == bindparam('obj_id')
+        )
 
     async def get_object(
             self,
             obj_id: int,
             session: AsyncSession
     ):
-        object_ = await session.execute(select(self.model).where(self.model.id == obj_id))
+        object_ = await session.execute(self.object_query, {'obj_id': obj_id})
         return object_.scalars().first()
 
+    def select_columns(
+            self,
+            columns: Optional[Sequence[str]] = None
+    ) -> Select:
+        """
+        SELECT объектов модели или, если заданы columns, только этих
+        столбцов: тогда результатом будут легкие строки, а не ORM-объекты.
+        """
+        if columns is None:
+            return select(self.model)
+        return select(*(getattr(self.model, column) for column in columns))
+
+    def all_objects_query(
+            self,
+            limit: Optional[int] = None,
+            after_id: Optional[int] = None,
+            columns: Optional[Sequence[str]] = None
+    ) -> Select:
+        query = self.select_columns(columns).order_by(self.model.id)
+        if after_id is not None:
+            query = query.where(self.model.id > after_id)
+        if limit is not None:
+            query = query.limit(limit)
+        return query
+
     async def get_all_objects(
             self,
-            session: AsyncSession
+            session: AsyncSession,
+            limit: Optional[int] = None,
+            after_id: Optional[int] = None,
+            columns: Optional[Sequence[str]] = None
     ):
-        all_objects = await session.execute(select(self.model))
+        all_objects = await session.execute(
+            self.all_objects_query(limit, after_id, columns)
+        )
+        if columns is not None:
+            return all_objects.all()
         return all_objects.scalars().all()
 
-    async def create(
+    def build(
             self,
             obj_in,
-            session: AsyncSession,
             user: Optional[User] = None
     ):
         obj_in_data = obj_in.dict()
         if user is not None:
             obj_in_data['user_id'] = user.id
-        db_obj = self.model(**obj_in_data)
+        return self.model(**obj_in_data)
+
+    async def create(
+            self,
+            obj_in,
+            session: AsyncSession,
+            user: Optional[User] = None,
+            commit: bool = True
+    ):
+        db_obj = self.build(obj_in, user)
         session.add(db_obj)
+        if not commit:
+            await session.flush()
+            return db_obj
         await session.commit()
         await session.refresh(db_obj)
         return db_obj
 
+    async def insert_many(
+            self,
+            db_objs: List,
+            session: AsyncSession
+    ):
+        """
+        Записывает собранные, но не добавленные в сессию объекты одним
+        executemany INSERT в текущей транзакции. Идентификаторы читаются
+        через RETURNING, если диалект умеет его в executemany. На SQLite
+        пачка занимает непрерывный диапазон rowid, который заканчивается
+        на max(id) сразу после вставки: вставка идет под блокировкой
+        распределения, а до конца транзакции SQLite не дает писать
+        другим соединениям. События маппера core INSERT не вызывает,
+        поэтому пул, итоги открытых объектов, индекс /funding и кеш
+        ответов получают новые строки явно. Для остальных диалектов
+        объекты записываются через flush сессии.
+        """
+        dialect = session.bind.dialect
+        if not dialect.insert_executemany_returning and dialect.name != 'sqlite':
+            session.add_all(db_objs)
+            await session.flush()
+            return db_objs
+        table = self.model.__table__
+        columns = [
+            column.key for column in table.columns if not column.primary_key
+        ]
+        rows = [
+            {key: getattr(db_obj, key) for key in columns}
+            for db_obj in db_objs
+        ]
+        if dialect.insert_executemany_returning:
+            ids = (await session.execute(
+                insert(table).returning(table.c.id), rows
+            )).scalars().all()
+        else:
+            await session.execute(insert(table), rows)
+            last_id = (await session.execute(
+                select(func.max(table.c.id))
+            )).scalar_one()
+            ids = range(last_id - len(rows) + 1, last_id + 1)
+        sync_session = session.sync_session
+        for db_obj, obj_id in zip(db_objs, ids):
+            db_obj.id = obj_id
+            allocation_pool.stage(db_obj, session=sync_session, model=self.model)
+            allocation_pool.stage_totals(
+                db_obj, open_totals(db_obj),
+                session=sync_session, model=self.model
+            )
+            funding_index.stage_insert(db_obj, sync_session, self.model)
+        response_cache.touch(sync_session, self.model)
+        return db_objs
+
     async def update(
             self,
             db_obj,
             obj_in,
-            session: AsyncSession
+            session: AsyncSession,
+            commit: bool = True
     ):
         obj_data = jsonable_encoder(db_obj)
         update_data = obj_in.dict(exclude_unset=True)
@@ -64,6 +167,9 @@ class CRUDBase:
             if field in update_data:
                 setattr(db_obj, field, update_data[field])
         session.add(db_obj)
+        if not commit:
+            await session.flush()
+            return db_obj
         await session.commit()
         await session.refresh(db_obj)
         return db_obj
@@ -3,9 +3,13 @@ from typing import Optional
 from app.crud.base import CRUDBase
 from app.models.charity_project import CharityProject
 
-from sqlalchemy import select
+from sqlalchemy import bindparam, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
+CHARITY_ID_BY_NAME = select(CharityProject.id).where(
+    CharityProject.name == bindparam('charity_name')
+)
+
 
 class CRUDCharityProject(CRUDBase):
     """
@@ -16,9 +20,9 @@ class CRUDCharityProject(CRUDBase):
             charity_name: str,
             session: AsyncSession,
     ) -> Optional[int]:
-        charity_id = await session.execute(select(CharityProject.id).where(
-            CharityProject.name == charity_name
-        ))
+        charity_id = await session.execute(
+            CHARITY_ID_BY_NAME, {'charity_name': charity_name}
+        )
         charity_id = charity_id.scalars().first()
         return charity_id
 
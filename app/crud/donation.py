@@ -1,23 +1,105 @@
+from datetime import datetime
+from functools import lru_cache
+from typing import Optional, Sequence, Tuple
+
 from app.crud.base import CRUDBase
 from app.models import User
 from app.models.donation import Donation
 
-from sqlalchemy import select
+from sqlalchemy import DateTime, Integer, bindparam, tuple_
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql import Select
 
 
 class DonationCRUD(CRUDBase):
     """
     DonationCRUD - класс для взаимодействия с моделью Donation в базе данных
     """
+    @lru_cache(maxsize=None)
+    def my_donation_statement(
+            self,
+            limit: bool,
+            after: bool,
+            date_from: bool,
+            date_to: bool,
+            columns: Optional[Tuple[str, ...]] = None
+    ) -> Select:
+        """
+        Пожертвования пользователя в порядке (create_date, id). Фильтр,
+        порядок и курсор идут по индексу ix_donation_user_id_create_date.
+        Запрос с параметрами собирается один раз на набор условий.
+        """
+        query = self.select_columns(columns).where(
+            Donation.user_id == bindparam('user_id')
+        ).order_by(Donation.create_date, Donation.id)
+        if date_from:
+            query = query.where(Donation.create_date >= bindparam('date_from'))
+        if date_to:
+            query = query.where(Donation.create_date <= bindparam('date_to'))
+        if after:
+            query = query.where(
+                tuple_(Donation.create_date, Donation.id) > tuple_(
+                    bindparam('after_date', type_=DateTime),
+                    bindparam('after_id', type_=Integer),
+                )
+            )
+        if limit:
+            query = query.limit(bindparam('limit', type_=Integer))
+        return query
+
+    def prepared_my_donation(
+            self,
+            user: User,
+            limit: Optional[int] = None,
+            after: Optional[Tuple[datetime, int]] = None,
+            date_from: Optional[datetime] = None,
+            date_to: Optional[datetime] = None,
+            columns: Optional[Sequence[str]] = None
+    ) -> Tuple[Select, dict]:
+        params = {
+            'user_id': user.id, 'limit': limit,
+            'date_from': date_from, 'date_to': date_to,
+        }
+        if after is not None:
+            params['after_date'], params['after_id'] = after
+        query = self.my_donation_statement(
+            limit is not None, after is not None,
+            date_from is not None, date_to is not None,
+            tuple(columns) if columns is not None else None
+        )
+        return query, {
+            name: value for name, value in params.items() if value is not None
+        }
+
+    def my_donation_query(
+            self,
+            user: User,
+            limit: Optional[int] = None,
+            after: Optional[Tuple[datetime, int]] = None,
+            date_from: Optional[datetime] = None,
+            date_to: Optional[datetime] = None,
+            columns: Optional[Sequence[str]] = None
+    ) -> Select:
+        query, params = self.prepared_my_donation(
+            user, limit, after, date_from, date_to, columns
+        )
+        return query.params(params)
+
     async def get_my_donation(
             self,
             session: AsyncSession,
-            user: User
+            user: User,
+            limit: Optional[int] = None,
+            after: Optional[Tuple[datetime, int]] = None,
+            date_from: Optional[datetime] = None,
+            date_to: Optional[datetime] = None,
+            columns: Optional[Sequence[str]] = None
     ):
-        my_donation = await session.execute(select(Donation).where(
-            Donation.user_id == user.id
+        my_donation = await session.execute(*self.prepared_my_donation(
+            user, limit, after, date_from, date_to, columns
         ))
+        if columns is not None:
+            return my_donation.all()
         return my_donation.scalars().all()
 
 
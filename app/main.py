@@ -1,7 +1,18 @@
 from fastapi import FastAPI
 from app.core.config import settings
 from app.api.routers import main_router
+from app.core.db import read_your_writes
+from app.services.allocation_pool import warm_allocation_pool
+from app.services.allocation_worker import (
+    start_allocation_worker, stop_allocation_worker
+)
+from app.services.warm_up import warm_up_database
 
 
 app = FastAPI(title=settings.app_title, description=settings.description)
 app.include_router(main_router)
+app.middleware('http')(read_your_writes)
+app.add_event_handler('startup', warm_up_database)
+app.add_event_handler('startup', warm_allocation_pool)
+app.add_event_handler('startup', start_allocation_worker)
+app.add_event_handler('shutdown', stop_allocation_worker)
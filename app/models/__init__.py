@@ -1,3 +1,4 @@
 from .user import User # noqa
 from .charity_project import CharityProject # noqa
 from .donation import Donation # noqa
+from .allocation_state import AllocationState # noqa
@@ -0,0 +1,31 @@
+from app.core.db import Base
+from sqlalchemy import Column, Integer, event
+
+ALLOCATION_STATE_ID = 1
+
+
+class AllocationState(Base):
+    """
+    Единственная строка со счетчиком распределений и итогами открытых
+    объектов. Блокировка строки сериализует распределение между
+    процессами, а счетчик показывает процессу, что открытые объекты
+    менял кто-то другой. Итоги (число открытых проектов и пожертвований
+    и их свободные суммы) меняются в той же транзакции, что и сами
+    объекты, поэтому по ним можно пропустить чтение пустой стороны.
+    """
+    generation = Column(Integer, nullable=False, default=0)
+    charityproject_open_count = Column(Integer, nullable=False, default=0)
+    charityproject_free_amount = Column(Integer, nullable=False, default=0)
+    donation_open_count = Column(Integer, nullable=False, default=0)
+    donation_free_amount = Column(Integer, nullable=False, default=0)
+
+
+def seed_allocation_state(target, connection, **kw):
+    """
+    Создает единственную строку сразу после таблицы, как это делает
+    миграция, чтобы и базы из create_all ее не создавали на ходу.
+    """
+    connection.execute(target.insert().values(id=ALLOCATION_STATE_ID))
+
+
+event.listen(AllocationState.__table__, 'after_create', seed_allocation_state)
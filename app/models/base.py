@@ -1,7 +1,32 @@
 from datetime import datetime
+from typing import Optional
 
+from app.core.config import settings
 from app.core.db import Base
-from sqlalchemy import Boolean, Column, DateTime, Integer
+from sqlalchemy import Boolean, Column, DateTime, Index, Integer, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import declared_attr
+
+PARTIAL_INDEX_DIALECTS = ('sqlite', 'postgresql')
+
+
+def open_pool_index(table: str, dialect: Optional[str] = None) -> Index:
+    """
+    Индекс открытых объектов таблицы в том виде, в каком его создает
+    миграция e791011f32dc: частичный по (create_date, id) там, где диалект
+    поддерживает частичные индексы, иначе составной с fully_invested впереди.
+    Диалект по умолчанию берется из database_url, как и в миграциях.
+    """
+    dialect = dialect or make_url(settings.database_url).get_backend_name()
+    if dialect in PARTIAL_INDEX_DIALECTS:
+        return Index(
+            f'ix_{table}_open_pool', 'create_date', 'id',
+            sqlite_where=text('fully_invested = 0'),
+            postgresql_where=text('fully_invested = false'),
+        )
+    return Index(
+        f'ix_{table}_open_pool', 'fully_invested', 'create_date', 'id'
+    )
 
 
 class AbstractCharityAndDonation(Base):
@@ -15,3 +40,7 @@ class AbstractCharityAndDonation(Base):
     fully_invested = Column(Boolean, nullable=False, default=False)
     create_date = Column(DateTime, nullable=False, default=datetime.utcnow)
     close_date = Column(DateTime)
+
+    @declared_attr
+    def __table_args__(cls):
+        return (open_pool_index(cls.__tablename__),)
@@ -1,7 +1,15 @@
 from app.models.base import AbstractCharityAndDonation
-from sqlalchemy import Column, ForeignKey, Integer, Text
+from sqlalchemy import Column, ForeignKey, Index, Integer, Text
 
 
 class Donation(AbstractCharityAndDonation):
     user_id = Column(Integer, ForeignKey('user.id'))
     comment = Column(Text, nullable=True)
+
+
+Index(
+    'ix_donation_user_id_create_date',
+    Donation.user_id,
+    Donation.create_date,
+    Donation.id,
+)
@@ -91,3 +91,17 @@ class CharityUpdate(CharityBase):
     Наследует атрибуты из класса `CharityBase`.
     """
     pass
+
+
+class CharityFunding(BaseModel):
+    """
+    Модель пожертвования, из которого профинансирован проект.
+    Атрибуты:
+        ---------
+        donation_id : int
+            Идентификатор пожертвования.
+        amount : int
+            Сумма, переданная из пожертвования в проект.
+    """
+    donation_id: int
+    amount: int
@@ -1,7 +1,9 @@
 from datetime import datetime
 from typing import Optional
 
-from pydantic import BaseModel, Field, PositiveInt, Extra
+from app.core.config import settings
+
+from pydantic import BaseModel, Field, PositiveInt, Extra, conlist
 
 
 class DonationCreate(BaseModel):
@@ -21,6 +23,11 @@ class DonationCreate(BaseModel):
         extra = Extra.forbid
 
 
+DonationBatchCreate = conlist(
+    DonationCreate, min_items=1, max_items=settings.donation_batch_max_size
+)
+
+
 class DonationUser(DonationCreate):
     """
     Модель записи о пожертвовании с дополнительными атрибутами,
@@ -0,0 +1,81 @@
+from pydantic import BaseModel
+
+
+class OpenPoolCounters(BaseModel):
+    """
+    Счетчики открытых объектов одной стороны распределения.
+    Атрибуты:
+        ---------
+        open_count : int
+            Количество открытых проектов или пожертвований.
+        free_amount : int
+            Нераспределенная сумма пожертвований или недостающая сумма проектов.
+    """
+    open_count: int
+    free_amount: int
+
+
+class AllocationMonitoring(BaseModel):
+    """
+    Состояние распределения средств для мониторинга.
+    Атрибуты:
+        ---------
+        charityproject : OpenPoolCounters
+            Счетчики открытых проектов.
+        donation : OpenPoolCounters
+            Счетчики открытых пожертвований.
+        allocations : int
+            Количество запусков распределения с момента старта процесса.
+        rows_fetched : int
+            Сколько строк встречных объектов прочитано из БД.
+        rows_touched : int
+            Сколько из прочитанных строк получили или отдали средства.
+        scans_skipped : int
+            Сколько распределений обошлись без чтения встречных объектов.
+    """
+    charityproject: OpenPoolCounters
+    donation: OpenPoolCounters
+    allocations: int
+    rows_fetched: int
+    rows_touched: int
+    scans_skipped: int
+
+
+class UserCacheMonitoring(BaseModel):
+    """
+    Счетчики кеша пользователей.
+    Атрибуты:
+        ---------
+        size : int
+            Сколько пользователей сейчас в кеше.
+        hits : int
+            Сколько запросов получили пользователя из кеша.
+        misses : int
+            Сколько запросов читали пользователя из БД.
+    """
+    size: int
+    hits: int
+    misses: int
+
+
+class PasswordHashingMonitoring(BaseModel):
+    """
+    Счетчики пула потоков для хеширования паролей.
+    Атрибуты:
+        ---------
+        max_workers : int
+            Сколько хешей считается одновременно; 0 — пул выключен.
+        tasks : int
+            Сколько хешей посчитано через пул.
+        pending : int
+            Сколько хешей сейчас ждут потока или считаются.
+        wait_avg_ms : float
+            Среднее время ожидания свободного потока, мс.
+        wait_max_ms : float
+            Наибольшее время ожидания свободного потока, мс.
+    """
+    max_workers: int
+    tasks: int
+    pending: int
+    wait_avg_ms: float
+    wait_max_ms: float
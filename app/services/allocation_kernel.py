@@ -0,0 +1,87 @@
+"""
+Синхронное ядро распределения по принципу FIFO.
+
+Если выстроить пожертвования и проекты по (create_date, id) и отложить
+их суммы на числовой оси подряд, пожертвование j займет отрезок
+[donation_sums[j], donation_sums[j + 1]), а проект k — отрезок
+[project_sums[k], project_sums[k + 1]). Распределение FIFO — это
+пересечения этих отрезков в пределах меньшей из двух общих сумм.
+"""
+from array import array
+from bisect import bisect_right
+from itertools import accumulate
+from typing import Iterable, List, Sequence, Tuple
+
+
+def prefix_sums(amounts: Iterable[int]) -> array:
+    """
+    Возвращает массив накопленных сумм, начинающийся с нуля.
+    """
+    sums = array('q', [0])
+    sums.extend(accumulate(amounts))
+    return sums
+
+
+def invested_amounts(
+    own_sums: Sequence[int],
+    other_sums: Sequence[int],
+) -> List[int]:
+    """
+    Возвращает вложенную сумму каждого объекта одной стороны,
+    если другая сторона имеет накопленные суммы other_sums.
+    """
+    total = other_sums[-1]
+    return [
+        max(0, min(own_sums[index + 1], total) - own_sums[index])
+        for index in range(len(own_sums) - 1)
+    ]
+
+
+def allocate(
+    own_sums: Sequence[int],
+    other_sums: Sequence[int],
+) -> List[Tuple[int, int, int]]:
+    """
+    Возвращает все переводы (индекс объекта одной стороны, индекс
+    объекта другой стороны, сумма) за один проход по обоим массивам.
+    Стороны равноправны: для пожертвований и проектов это
+    (индекс пожертвования, индекс проекта, сумма).
+    """
+    transfers = []
+    own, other = 0, 0
+    total = min(own_sums[-1], other_sums[-1])
+    while own < len(own_sums) - 1 and other < len(other_sums) - 1:
+        start = max(own_sums[own], other_sums[other])
+        end = min(own_sums[own + 1], other_sums[other + 1], total)
+        if end <= start:
+            break
+        transfers.append((own, other, end - start))
+        own_end = own_sums[own + 1]
+        other_end = other_sums[other + 1]
+        if own_end <= other_end:
+            own += 1
+        if other_end <= own_end:
+            other += 1
+    return transfers
+
+
+def funding(
+    project: int,
+    project_sums: Sequence[int],
+    donation_sums: Sequence[int],
+) -> List[Tuple[int, int]]:
+    """
+    Возвращает пары (индекс пожертвования, сумма), из которых
+    профинансирован проект с индексом project. Работает за O(log n + k),
+    где k — число таких пожертвований.
+    """
+    start = project_sums[project]
+    end = min(project_sums[project + 1], donation_sums[-1])
+    transfers = []
+    donation = bisect_right(donation_sums, start) - 1
+    while start < end:
+        donation_end = min(donation_sums[donation + 1], end)
+        transfers.append((donation, donation_end - start))
+        start = donation_end
+        donation += 1
+    return transfers
@@ -0,0 +1,285 @@
+import asyncio
+import time
+from abc import ABC, abstractmethod
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+
+from app.core.config import settings
+from app.core.db import get_async_session
+from app.models import AllocationState
+from app.models.allocation_state import ALLOCATION_STATE_ID
+from app.services.allocation_pool import allocation_pool
+from app.services.funding import funding_index
+from app.services.response_cache import response_cache
+from app.services.user_cache import user_cache
+
+from fastapi import Depends
+from sqlalchemy import select, update
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncSession
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+def invalidate_caches():
+    """
+    Сбрасывает все кеши процесса, построенные по данным БД.
+    """
+    allocation_pool.invalidate()
+    funding_index.invalidate()
+    response_cache.clear()
+    user_cache.invalidate_all()
+
+
+class AllocationLock(ABC):
+    """
+    Блокировка распределения средств между процессами.
+    Атрибуты:
+        ---------
+        generation : Optional[int]
+            Общий номер записи, до которого кеши этого процесса актуальны.
+        sync_interval : float
+            Как часто, в секундах, сверять номер перед запросом; 0 — перед
+            каждым запросом.
+
+    Пока блокировка удержана, распределение в других процессах ждет.
+    Каждая запись под блокировкой увеличивает общий номер. Если при захвате
+    или при сверке перед запросом (`sync`) номер отличается от известного
+    процессу, данные менял другой процесс, и все кеши процесса
+    сбрасываются. Внутри процесса распределения дополнительно идут
+    по одному.
+
+    Сверка перед запросом идет не чаще раза в sync_interval секунд, чтобы
+    ответы из кеша (в том числе 304) и запросы пользователей из кеша
+    не читали номер из БД каждый раз. Цена — до sync_interval секунд
+    процесс может отдавать данные, которые другой процесс уже изменил.
+    Распределение под блокировкой сверяет номер всегда.
+    """
+
+    def __init__(self, sync_interval: float = 0):
+        self.generation: Optional[int] = None
+        self.sync_interval = sync_interval
+        self.synced_at = 0.0
+        self._local = None
+        self._loop = None
+
+    def local(self) -> asyncio.Lock:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._local = asyncio.Lock()
+            self._loop = loop
+        return self._local
+
+    @abstractmethod
+    async def acquire(self, session: AsyncSession) -> int:
+        """
+        Захватывает блокировку и возвращает общий номер записи.
+        """
+
+    @abstractmethod
+    async def read(self, session: AsyncSession) -> int:
+        """
+        Возвращает общий номер записи без захвата блокировки.
+        """
+
+    async def release(self):
+        pass
+
+    @asynccontextmanager
+    async def hold(self, session: AsyncSession) -> AsyncIterator[None]:
+        async with self.local():
+            generation = await self.acquire(session)
+            try:
+                if generation != self.generation:
+                    invalidate_caches()
+                self.generation = generation + 1
+                yield
+            finally:
+                await self.release()
+
+    async def sync(self, session: AsyncSession):
+        """
+        Сбрасывает кеши процесса, если с прошлой сверки другой процесс
+        записал данные под блокировкой. Номер читается не чаще раза
+        в sync_interval секунд.
+        """
+        now = time.monotonic()
+        if self.generation is not None and now - self.synced_at < self.sync_interval:
+            return
+        self.synced_at = now
+        generation = await self.read(session)
+        if self.generation is None or generation > self.generation:
+            invalidate_caches()
+            self.generation = generation
+
+    async def bump(self, session: AsyncSession):
+        """
+        Отмечает запись, сделанную вне распределения (например, изменение
+        пользователя), чтобы другие процессы сбросили свои кеши.
+        """
+        async with self.hold(session):
+            await session.commit()
+
+    @abstractmethod
+    def bump_sync(self, connection: Connection):
+        """
+        Увеличивает общий номер записи из синхронного соединения.
+        Для команд, которые пишут в БД мимо приложения (сверка с --fix):
+        вызывается после их commit, чтобы процессы приложения сбросили
+        кеши и перечитали уже исправленные данные.
+        """
+
+
+class NullAllocationLock(AllocationLock):
+    """
+    Без блокировки: приложение работает в одном процессе.
+    """
+
+    @asynccontextmanager
+    async def hold(self, session: AsyncSession) -> AsyncIterator[None]:
+        yield
+
+    async def acquire(self, session: AsyncSession) -> int:
+        return 0
+
+    async def read(self, session: AsyncSession) -> int:
+        return 0
+
+    async def sync(self, session: AsyncSession):
+        pass
+
+    async def bump(self, session: AsyncSession):
+        pass
+
+    def bump_sync(self, connection: Connection):
+        pass
+
+
+class FileAllocationLock(AllocationLock):
+    """
+    Блокировка flock на файле для развертываний на SQLite, где все
+    процессы работают на одной машине. Номер записи хранится в самом
+    файле блокировки и увеличивается при освобождении, то есть после
+    commit распределения.
+    """
+
+    def __init__(self, path: str, sync_interval: float = 0):
+        if fcntl is None:
+            raise RuntimeError('Файловая блокировка недоступна на этой платформе!')
+        super().__init__(sync_interval)
+        self.path = path
+        self.file = None
+
+    def open(self):
+        if self.file is None:
+            self.file = open(self.path, 'a+b')
+        return self.file
+
+    def read_file(self) -> int:
+        self.file.seek(0)
+        return int(self.file.read() or 0)
+
+    async def acquire(self, session: AsyncSession) -> int:
+        self.open()
+        await asyncio.get_running_loop().run_in_executor(
+            None, fcntl.flock, self.file.fileno(), fcntl.LOCK_EX
+        )
+        return self.read_file()
+
+    async def read(self, session: AsyncSession) -> int:
+        self.open()
+        return self.read_file()
+
+    def write_file(self, generation: int):
+        self.file.seek(0)
+        self.file.truncate()
+        self.file.write(str(generation).encode())
+        self.file.flush()
+
+    async def release(self):
+        self.write_file(self.generation)
+        fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+
+    def bump_sync(self, connection: Connection):
+        self.open()
+        fcntl.flock(self.file.fileno(), fcntl.LOCK_EX)
+        try:
+            self.write_file(self.read_file() + 1)
+        finally:
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+
+
+class RowAllocationLock(AllocationLock):
+    """
+    Блокировка строки allocationstate через SELECT ... FOR UPDATE для
+    серверных БД. Строка блокируется в транзакции распределения
+    и освобождается ее commit или rollback; номер записи
+    увеличивается в той же транзакции. Строку создают миграция
+    и create_all, сама блокировка ее не вставляет: два процесса,
+    вставляющие ее одновременно, столкнулись бы на первичном ключе.
+    """
+
+    async def acquire(self, session: AsyncSession) -> int:
+        generation = (await session.execute(
+            select(AllocationState.generation).where(
+                AllocationState.id == ALLOCATION_STATE_ID
+            ).with_for_update()
+        )).scalar()
+        if generation is None:
+            raise RuntimeError(
+                'Нет строки allocationstate: примените миграции!'
+            )
+        await session.execute(
+            update(AllocationState).where(
+                AllocationState.id == ALLOCATION_STATE_ID
+            ).values(generation=generation + 1)
+        )
+        return generation
+
+    async def read(self, session: AsyncSession) -> int:
+        generation = (await session.execute(
+            select(AllocationState.generation).where(
+                AllocationState.id == ALLOCATION_STATE_ID
+            )
+        )).scalar()
+        return generation or 0
+
+    def bump_sync(self, connection: Connection):
+        connection.execute(
+            update(AllocationState).where(
+                AllocationState.id == ALLOCATION_STATE_ID
+            ).values(generation=AllocationState.generation + 1)
+        )
+
+
+def get_allocation_lock() -> AllocationLock:
+    """
+    Создает блокировку, выбранную настройкой allocation_lock:
+    none, file или row.
+    """
+    if settings.allocation_lock == 'file':
+        return FileAllocationLock(
+            settings.allocation_lock_path, settings.allocation_sync_interval
+        )
+    if settings.allocation_lock == 'row':
+        return RowAllocationLock(settings.allocation_sync_interval)
+    if settings.allocation_lock == 'none':
+        return NullAllocationLock()
+    raise ValueError(
+        f'Неизвестная блокировка распределения: {settings.allocation_lock}!'
+    )
+
+
+allocation_lock = get_allocation_lock()
+
+
+async def sync_shared_state(session: AsyncSession = Depends(get_async_session)):
+    """
+    Зависимость запросов: сверяет номер записи с общим, чтобы кеши
+    процесса не отдавали данные, которые изменил другой процесс.
+    Чаще раза в allocation_sync_interval секунд номер не читается.
+    """
+    await allocation_lock.sync(session)
@@ -0,0 +1,443 @@
+from bisect import bisect_left
+from datetime import datetime
+from functools import lru_cache
+from typing import Dict, Iterator, List, Optional, Tuple, Type, Union
+
+from app.core.db import AsyncSessionLocal
+from app.models import AllocationState, CharityProject, Donation
+from app.models.allocation_state import ALLOCATION_STATE_ID
+
+from sqlalchemy import event, false, func, inspect, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, object_session
+from sqlalchemy.sql import Select, Update
+
+ModelType = Type[Union[CharityProject, Donation]]
+Totals = Tuple[int, int]
+
+POOL_CHANGES_KEY = 'allocation_pool_changes'
+TOTALS_CHANGES_KEY = 'allocation_totals_changes'
+TOTALS_FIELDS = ('open_count', 'free_amount')
+
+
+def totals_columns(model: ModelType) -> List[str]:
+    """
+    Столбцы allocationstate с итогами открытых объектов модели.
+    """
+    return [f'{model.__tablename__}_{field}' for field in TOTALS_FIELDS]
+
+
+def open_totals(obj) -> Totals:
+    """
+    Вклад объекта в итоги: (число открытых объектов, свободная сумма).
+    """
+    if obj.fully_invested:
+        return 0, 0
+    return 1, obj.full_amount - obj.invested_amount
+
+
+def committed_open_totals(obj) -> Totals:
+    """
+    Вклад объекта в итоги по значениям, которые были в БД до flush.
+    """
+    attrs = inspect(obj).attrs
+    values = {}
+    for name in ('full_amount', 'invested_amount', 'fully_invested'):
+        deleted = attrs[name].history.deleted
+        values[name] = deleted[0] if deleted else getattr(obj, name)
+    if values['fully_invested']:
+        return 0, 0
+    return 1, values['full_amount'] - values['invested_amount']
+
+
+@lru_cache(maxsize=None)
+def totals_query() -> Select:
+    """
+    Итоги открытых объектов обеих моделей из строки allocationstate.
+    """
+    table = AllocationState.__table__
+    return select(*(
+        table.c[column]
+        for model in (CharityProject, Donation)
+        for column in totals_columns(model)
+    )).where(table.c.id == ALLOCATION_STATE_ID)
+
+
+def recount_totals() -> Update:
+    """
+    UPDATE, который пересчитывает итоги allocationstate по всем открытым
+    строкам. Читает все открытые объекты, поэтому нужен только там, где
+    строки писали в обход приложения: при сверке и генерации данных.
+    """
+    values = {}
+    for model in (CharityProject, Donation):
+        count_column, free_column = totals_columns(model)
+        open_rows = model.fully_invested == false()
+        values[count_column] = select(
+            func.count(model.id)
+        ).where(open_rows).scalar_subquery()
+        values[free_column] = select(func.coalesce(
+            func.sum(model.full_amount - model.invested_amount), 0
+        )).where(open_rows).scalar_subquery()
+    table = AllocationState.__table__
+    return update(table).where(
+        table.c.id == ALLOCATION_STATE_ID
+    ).values(values)
+
+
+class OpenItem:
+    """
+    Компактная запись об открытом проекте или пожертвовании.
+    Хранит только то, что нужно для распределения средств.
+    """
+    __slots__ = ('id', 'create_date', 'full_amount', 'invested_amount')
+
+    def __init__(
+            self,
+            obj_id: int,
+            create_date: datetime,
+            full_amount: int,
+            invested_amount: int,
+    ):
+        self.id = obj_id
+        self.create_date = create_date
+        self.full_amount = full_amount
+        self.invested_amount = invested_amount
+
+    @property
+    def key(self) -> Tuple[datetime, int]:
+        return self.create_date, self.id
+
+    @property
+    def free_amount(self) -> int:
+        return self.full_amount - self.invested_amount
+
+    def matches(self, obj: Union[CharityProject, Donation, None]) -> bool:
+        """
+        Проверяет, что строка из БД совпадает с закешированной записью.
+        """
+        return (
+            obj is not None and
+            not obj.fully_invested and
+            obj.full_amount == self.full_amount and
+            obj.invested_amount == self.invested_amount
+        )
+
+
+class OpenQueue:
+    """
+    Очередь открытых объектов одной модели, упорядоченная по (create_date, id).
+    Закрытые объекты удаляются лениво: запись пропадает из словаря `_by_id`,
+    а голова очереди сдвигается при следующем обращении.
+    """
+    compact_threshold = 1024
+
+    def __init__(self):
+        self.clear()
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+    def __iter__(self) -> Iterator[OpenItem]:
+        for position in range(self._head, len(self._items)):
+            item = self._items[position]
+            if self._by_id.get(item.id) is item:
+                yield item
+
+    def get(self, obj_id: int) -> Optional[OpenItem]:
+        return self._by_id.get(obj_id)
+
+    def clear(self):
+        self._items: List[OpenItem] = []
+        self._keys: List[Tuple[datetime, int]] = []
+        self._by_id: Dict[int, OpenItem] = {}
+        self._head = 0
+        self.free_total = 0
+
+    def upsert(
+            self,
+            obj_id: int,
+            create_date: datetime,
+            full_amount: int,
+            invested_amount: int,
+    ):
+        item = self._by_id.get(obj_id)
+        if item is not None and item.create_date == create_date:
+            self.free_total += full_amount - invested_amount - item.free_amount
+            item.full_amount = full_amount
+            item.invested_amount = invested_amount
+            return
+        if item is not None:
+            self.remove(obj_id)
+        item = OpenItem(obj_id, create_date, full_amount, invested_amount)
+        if not self._keys or self._keys[-1] < item.key:
+            self._items.append(item)
+            self._keys.append(item.key)
+        else:
+            position = bisect_left(self._keys, item.key, self._head)
+            self._items.insert(position, item)
+            self._keys.insert(position, item.key)
+        self._by_id[obj_id] = item
+        self.free_total += item.free_amount
+
+    def remove(self, obj_id: int):
+        item = self._by_id.pop(obj_id, None)
+        if item is None:
+            return
+        self.free_total -= item.free_amount
+        self._drop_dead_head()
+
+    def _drop_dead_head(self):
+        while (
+            self._head < len(self._items) and
+            self._by_id.get(self._items[self._head].id) is not self._items[self._head]
+        ):
+            self._head += 1
+        if self._head > self.compact_threshold and self._head * 2 > len(self._items):
+            del self._items[:self._head]
+            del self._keys[:self._head]
+            self._head = 0
+
+
+class AllocationPool:
+    """
+    Держит в памяти очереди открытых проектов и пожертвований,
+    чтобы распределение средств не перечитывало все открытые строки.
+
+    Пул прогревается из БД при старте приложения и обновляется по
+    зафиксированным изменениям: события маппера складывают изменения
+    в `session.info`, а после commit они применяются к очередям
+    (после rollback отбрасываются). Если строки в БД расходятся
+    с пулом, пул сбрасывается и распределение идёт по БД.
+
+    Те же изменения в той же транзакции прибавляются к итогам в строке
+    allocationstate (`stage_totals`, запись перед commit). Счетчики
+    свободных денег (`totals`) один раз читаются из этой строки
+    и дальше обновляются после commit теми же разницами, поэтому
+    пропуск пустой стороны не читает открытые объекты и не требует
+    прогретых очередей. Записи других процессов пул замечает
+    по общему номеру записи блокировки распределения
+    (`allocation_lock`), который сбрасывает пул; после записей в обход
+    приложения в этом же процессе нужно вызвать `invalidate`.
+    """
+
+    def __init__(self, models: Tuple[ModelType, ...]):
+        self.queues: Dict[ModelType, OpenQueue] = {
+            model: OpenQueue() for model in models
+        }
+        self.bind = None
+        self.warmed = False
+        self.totals: Optional[Dict[ModelType, Totals]] = None
+        self.totals_bind = None
+
+    def invalidate(self):
+        for queue in self.queues.values():
+            queue.clear()
+        self.bind = None
+        self.warmed = False
+        self.totals = None
+        self.totals_bind = None
+
+    async def warm(self, session: AsyncSession):
+        for queue in self.queues.values():
+            queue.clear()
+        for model, queue in self.queues.items():
+            rows = await session.execute(
+                select(
+                    model.id,
+                    model.create_date,
+                    model.full_amount,
+                    model.invested_amount,
+                ).where(
+                    model.fully_invested == false()
+                ).order_by(model.create_date, model.id)
+            )
+            for row in rows:
+                queue.upsert(*row)
+        self.bind = session.bind
+        self.warmed = True
+
+    async def ensure_warm(self, session: AsyncSession):
+        if not self.warmed or self.bind is not session.bind:
+            await self.warm(session)
+
+    async def read_totals(self, session: AsyncSession) -> Dict[str, Dict[str, int]]:
+        """
+        Итоги открытых объектов из строки allocationstate в том же виде,
+        что и `counters`. Для мониторинга: счетчики пула не меняет.
+        """
+        row = (await session.execute(totals_query())).mappings().one()
+        return {
+            model.__tablename__: {
+                field: row[column]
+                for field, column in zip(TOTALS_FIELDS, totals_columns(model))
+            }
+            for model in (CharityProject, Donation)
+        }
+
+    async def ensure_totals(self, session: AsyncSession):
+        """
+        Загружает счетчики свободных денег из строки allocationstate,
+        если они сброшены или были прочитаны из другой БД.
+        """
+        if self.totals is not None and self.totals_bind is session.bind:
+            return
+        totals = await self.read_totals(session)
+        self.totals = {
+            model: tuple(totals[model.__tablename__][field] for field in TOTALS_FIELDS)
+            for model in self.queues
+        }
+        self.totals_bind = session.bind
+
+    async def has_free_money(self, session: AsyncSession, model: ModelType) -> bool:
+        """
+        Проверяет, есть ли у модели свободные деньги: непотраченные
+        деньги пожертвований или недостающие деньги проектов.
+        """
+        await self.ensure_totals(session)
+        return self.free_amount(model) > 0
+
+    def open_count(self, model: ModelType) -> int:
+        return self.totals[model][0] if self.totals else 0
+
+    def free_amount(self, model: ModelType) -> int:
+        return self.totals[model][1] if self.totals else 0
+
+    def candidates(self, model: ModelType, amount: int) -> List[OpenItem]:
+        """
+        Возвращает голову очереди модели, покрывающую сумму `amount`.
+        """
+        picked = []
+        for item in self.queues[model]:
+            if amount <= 0:
+                break
+            picked.append(item)
+            amount -= item.free_amount
+        return picked
+
+    def stage(
+            self,
+            obj: Union[CharityProject, Donation],
+            deleted: bool = False,
+            session: Optional[Session] = None,
+            model: Optional[ModelType] = None,
+    ):
+        """
+        Запоминает состояние объекта до commit сессии. Для объектов,
+        записанных в обход ORM, сессию и модель нужно передать явно.
+        """
+        session = session or object_session(obj)
+        model = model or type(obj)
+        if session is None or model not in self.queues:
+            return
+        changes = session.info.setdefault(POOL_CHANGES_KEY, {})
+        if deleted or obj.fully_invested:
+            changes[model, obj.id] = None
+        else:
+            changes[model, obj.id] = (
+                obj.create_date, obj.full_amount, obj.invested_amount
+            )
+
+    @staticmethod
+    def stage_totals(
+            obj,
+            totals: Totals,
+            previous: Totals = (0, 0),
+            session: Optional[Session] = None,
+            model: Optional[ModelType] = None,
+    ):
+        """
+        Запоминает, на сколько объект изменил итоги открытых объектов
+        своей модели. Накопленные разницы записываются в allocationstate
+        перед commit сессии (`write_totals`).
+        """
+        session = session or object_session(obj)
+        model = model or type(obj)
+        count = totals[0] - previous[0]
+        free_amount = totals[1] - previous[1]
+        if session is None or not (count or free_amount):
+            return
+        changes = session.info.setdefault(TOTALS_CHANGES_KEY, {})
+        staged_count, staged_free_amount = changes.get(model, (0, 0))
+        changes[model] = staged_count + count, staged_free_amount + free_amount
+
+    @staticmethod
+    def write_totals(session: Session):
+        """
+        Перед commit прибавляет накопленные разницы к строке итогов
+        в той же транзакции. Сначала сбрасывает сессию, чтобы изменения
+        из последнего flush тоже попали в итоги.
+        """
+        session.flush()
+        changes = session.info.get(TOTALS_CHANGES_KEY)
+        if not changes:
+            return
+        table = AllocationState.__table__
+        values = {}
+        for model, staged in changes.items():
+            for column, delta in zip(totals_columns(model), staged):
+                values[column] = table.c[column] + delta
+        session.execute(
+            update(table).where(
+                table.c.id == ALLOCATION_STATE_ID
+            ).values(values)
+        )
+
+    def apply(self, session: Session):
+        totals = session.info.pop(TOTALS_CHANGES_KEY, None)
+        if totals and self.totals is not None:
+            for model, (count, free_amount) in totals.items():
+                open_count, free_total = self.totals[model]
+                self.totals[model] = open_count + count, free_total + free_amount
+        changes = session.info.pop(POOL_CHANGES_KEY, None)
+        if not changes or not self.warmed:
+            return
+        for (model, obj_id), state in changes.items():
+            if state is None:
+                self.queues[model].remove(obj_id)
+            else:
+                self.queues[model].upsert(obj_id, *state)
+
+    @staticmethod
+    def discard(session: Session):
+        session.info.pop(POOL_CHANGES_KEY, None)
+        session.info.pop(TOTALS_CHANGES_KEY, None)
+
+
+allocation_pool = AllocationPool((CharityProject, Donation))
+
+
+def _stage_insert(mapper, connection, target):
+    allocation_pool.stage(target)
+    allocation_pool.stage_totals(target, open_totals(target))
+
+
+def _stage_update(mapper, connection, target):
+    allocation_pool.stage(target)
+    allocation_pool.stage_totals(
+        target, open_totals(target), committed_open_totals(target)
+    )
+
+
+def _stage_delete(mapper, connection, target):
+    allocation_pool.stage(target, deleted=True)
+    allocation_pool.stage_totals(
+        target, (0, 0), committed_open_totals(target)
+    )
+
+
+for _model in allocation_pool.queues:
+    event.listen(_model, 'after_insert', _stage_insert)
+    event.listen(_model, 'after_update', _stage_update)
+    event.listen(_model, 'after_delete', _stage_delete)
+event.listen(Session, 'before_commit', allocation_pool.write_totals)
+event.listen(Session, 'after_commit', allocation_pool.apply)
+event.listen(Session, 'after_rollback', allocation_pool.discard)
+
+
+async def warm_allocation_pool():
+    """
+    Прогревает пул открытых объектов при старте приложения.
+    """
+    async with AsyncSessionLocal() as session:
+        await allocation_pool.warm(session)
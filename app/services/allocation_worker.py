@@ -0,0 +1,267 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, List, Optional, Type, Union
+
+from app.core.config import settings
+from app.core.db import AsyncSessionLocal
+from app.crud.base import CRUDBase
+from app.models import CharityProject, Donation, User
+from app.services.allocation_lock import allocation_lock
+from app.services.allocation_pool import allocation_pool
+from app.services.investing import (create_and_allocate, create_and_invest,
+                                    create_batch_and_allocate,
+                                    create_batch_and_invest,
+                                    update_and_allocate, update_and_invest)
+
+from pydantic import BaseModel
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+logger = logging.getLogger(__name__)
+
+
+Write = Callable[[AsyncSession], Awaitable[BaseModel]]
+
+
+class AllocationJob:
+    """
+    Запись с распределением средств, ожидающая воркера.
+    write выполняет ее в сессии воркера без commit, а обработчик
+    запроса ждет future своей задачи.
+    """
+    __slots__ = ('write', 'future')
+
+    def __init__(self, write: Write, future: asyncio.Future):
+        self.write = write
+        self.future = future
+
+
+class AllocationWorker:
+    """
+    Единственный писатель распределения средств.
+    Атрибуты:
+        ---------
+        session_factory : sessionmaker
+            Фабрика сессий, в которых воркер пишет в БД.
+        window : float
+            Сколько секунд после первой задачи ждать остальные задачи пачки.
+        batch_size : int
+            Наибольшее число задач в одной транзакции.
+        batches : int
+            Сколько пачек обработано.
+
+    Записи, которые распределяют средства, складываются в очередь.
+    Воркер забирает задачи, пришедшие в пределах окна window, и выполняет
+    их по очереди в одной транзакции, так что конкурирующие
+    запросы не читают и не перезаписывают одни и те же открытые объекты.
+    Если пачка не записалась, каждая ее задача повторяется в отдельной
+    транзакции, чтобы ошибка одной задачи не отменяла остальные.
+    """
+
+    def __init__(
+            self,
+            session_factory: sessionmaker = AsyncSessionLocal,
+            window: Optional[float] = None,
+            batch_size: Optional[int] = None,
+    ):
+        self.session_factory = session_factory
+        self.window = settings.allocation_worker_window if window is None else window
+        self.batch_size = batch_size or settings.allocation_worker_batch_size
+        self.batches = 0
+        self.queue: Optional[asyncio.Queue] = None
+        self.task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self.task is not None and not self.task.done()
+
+    async def start(self):
+        if self.running:
+            return
+        self.queue = asyncio.Queue()
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        """
+        Дожидается задач, уже стоящих в очереди, и останавливает воркер.
+        """
+        if not self.running:
+            return
+        await self.queue.join()
+        self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+        self.task = None
+
+    async def enqueue(self, write: Write):
+        """
+        Ставит запись в очередь и возвращает ее результат, когда пачка
+        с ней зафиксирована.
+        """
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put(AllocationJob(write, future))
+        return await future
+
+    async def submit(
+            self,
+            crud: CRUDBase,
+            obj_in: BaseModel,
+            model_add: Union[CharityProject, Donation],
+            response_schema: Type[BaseModel],
+            user: Optional[User] = None,
+    ) -> BaseModel:
+        """
+        Ставит создание объекта в очередь и возвращает ответ, когда пачка
+        с ним зафиксирована.
+        """
+        return await self.enqueue(
+            lambda session: create_and_allocate(
+                crud, obj_in, model_add, response_schema, session, user
+            )
+        )
+
+    async def create_and_invest(
+            self,
+            crud: CRUDBase,
+            obj_in: BaseModel,
+            model_add: Union[CharityProject, Donation],
+            response_schema: Type[BaseModel],
+            session: AsyncSession,
+            user: Optional[User] = None,
+    ) -> BaseModel:
+        """
+        Создает объект и распределяет его средства через воркер, а если
+        воркер не запущен — сразу в сессии запроса.
+        """
+        if not self.running:
+            return await create_and_invest(
+                crud, obj_in, model_add, response_schema, session, user
+            )
+        return await self.submit(crud, obj_in, model_add, response_schema, user)
+
+    async def create_batch_and_invest(
+            self,
+            crud: CRUDBase,
+            objs_in: List[BaseModel],
+            model_add: Union[CharityProject, Donation],
+            response_schema: Type[BaseModel],
+            session: AsyncSession,
+            user: Optional[User] = None,
+    ) -> List[BaseModel]:
+        """
+        Создает пачку объектов и распределяет их средства через воркер,
+        а если воркер не запущен — сразу в сессии запроса.
+        """
+        if not self.running:
+            return await create_batch_and_invest(
+                crud, objs_in, model_add, response_schema, session, user
+            )
+        return await self.enqueue(
+            lambda worker_session: create_batch_and_allocate(
+                crud, objs_in, model_add, response_schema, worker_session,
+                user
+            )
+        )
+
+    async def update_and_invest(
+            self,
+            crud: CRUDBase,
+            db_obj: Union[CharityProject, Donation],
+            obj_in: BaseModel,
+            model_add: Union[CharityProject, Donation],
+            response_schema: Type[BaseModel],
+            session: AsyncSession,
+    ) -> BaseModel:
+        """
+        Обновляет объект и досчитывает его распределение через воркер,
+        а если воркер не запущен — сразу в сессии запроса. Воркер заново
+        читает объект в своей сессии.
+        """
+        if not self.running:
+            return await update_and_invest(
+                crud, db_obj, obj_in, model_add, response_schema, session
+            )
+        obj_id = db_obj.id
+
+        async def write(worker_session: AsyncSession) -> BaseModel:
+            return await update_and_allocate(
+                crud, await crud.get_object(obj_id, worker_session), obj_in,
+                model_add, response_schema, worker_session
+            )
+
+        return await self.enqueue(write)
+
+    async def collect(self) -> List[AllocationJob]:
+        jobs = [await self.queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.window
+        while len(jobs) < self.batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                jobs.append(
+                    await asyncio.wait_for(self.queue.get(), timeout)
+                )
+            except asyncio.TimeoutError:
+                break
+        return jobs
+
+    async def run(self):
+        while True:
+            jobs = await self.collect()
+            try:
+                await self.process(jobs)
+            finally:
+                for _ in jobs:
+                    self.queue.task_done()
+
+    async def process(self, jobs: List[AllocationJob]):
+        """
+        Выполняет пачку задач в одной транзакции.
+        Пул открытых объектов обновляется после каждой задачи, чтобы
+        следующая задача пачки видела ее остатки.
+        """
+        try:
+            async with self.session_factory() as session:
+                async with allocation_lock.hold(session):
+                    responses = []
+                    for job in jobs:
+                        responses.append(await job.write(session))
+                        await session.flush()
+                        allocation_pool.apply(session.sync_session)
+                    await session.commit()
+        except Exception as error:
+            allocation_pool.invalidate()
+            if len(jobs) == 1:
+                if not jobs[0].future.done():
+                    jobs[0].future.set_exception(error)
+                return
+            logger.warning(
+                'Пачка из %s задач распределения не записана, '
+                'задачи повторяются по одной', len(jobs), exc_info=True
+            )
+            for job in jobs:
+                await self.process([job])
+            return
+        self.batches += 1
+        for job, response in zip(jobs, responses):
+            if not job.future.done():
+                job.future.set_result(response)
+
+
+allocation_worker = AllocationWorker()
+
+
+async def start_allocation_worker():
+    """
+    Запускает воркер распределения при старте приложения, если он включен.
+    """
+    if settings.allocation_worker:
+        await allocation_worker.start()
+
+
+async def stop_allocation_worker():
+    await allocation_worker.stop()
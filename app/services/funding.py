@@ -0,0 +1,168 @@
+from array import array
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from app.models import CharityProject, Donation
+from app.services.allocation_kernel import funding
+
+from sqlalchemy import event, inspect, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, object_session
+
+FUNDING_CHANGES_KEY = 'funding_index_changes'
+
+
+class PrefixIndex:
+    """
+    Накопленные суммы full_amount одной модели в порядке (create_date, id).
+    Новые объекты дописываются в конец; всё остальное требует перестроения.
+    """
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.ids = array('q')
+        self.sums = array('q', [0])
+        self.positions: Dict[int, int] = {}
+        self.last_key: Optional[Tuple[datetime, int]] = None
+
+    def append(self, obj_id: int, create_date: datetime, full_amount: int) -> bool:
+        key = create_date, obj_id
+        if self.last_key is not None and key <= self.last_key:
+            return False
+        self.positions[obj_id] = len(self.ids)
+        self.ids.append(obj_id)
+        self.sums.append(self.sums[-1] + full_amount)
+        self.last_key = key
+        return True
+
+
+class FundingIndex:
+    """
+    Кеш накопленных сумм проектов и пожертвований, по которому
+    ядро распределения отвечает, какие пожертвования профинансировали
+    проект, не воспроизводя историю распределения.
+
+    Как и пул открытых объектов, индекс получает изменения из событий
+    маппера и применяет их после commit. Созданные объекты дописываются
+    в конец, удаление или смена full_amount сбрасывает индекс, и он
+    перестраивается при следующем запросе.
+    """
+
+    def __init__(self):
+        self.indexes = {
+            CharityProject: PrefixIndex(),
+            Donation: PrefixIndex(),
+        }
+        self.bind = None
+        self.built = False
+
+    def invalidate(self):
+        for index in self.indexes.values():
+            index.clear()
+        self.bind = None
+        self.built = False
+
+    async def build(self, session: AsyncSession):
+        self.invalidate()
+        for model, index in self.indexes.items():
+            rows = await session.stream(
+                select(
+                    model.id, model.create_date, model.full_amount
+                ).order_by(model.create_date, model.id)
+            )
+            async for row in rows:
+                index.append(*row)
+        self.bind = session.bind
+        self.built = True
+
+    async def ensure_built(self, session: AsyncSession):
+        if not self.built or self.bind is not session.bind:
+            await self.build(session)
+
+    def project_funding(self, project_id: int) -> Optional[List[Tuple[int, int]]]:
+        """
+        Возвращает пары (id пожертвования, сумма) для проекта
+        или None, если проекта нет в индексе.
+        """
+        projects = self.indexes[CharityProject]
+        donations = self.indexes[Donation]
+        position = projects.positions.get(project_id)
+        if position is None:
+            return None
+        return [
+            (donations.ids[donation], amount)
+            for donation, amount in funding(
+                position, projects.sums, donations.sums
+            )
+        ]
+
+    @staticmethod
+    def stage(session: Session, change: Optional[tuple]):
+        session.info.setdefault(FUNDING_CHANGES_KEY, []).append(change)
+
+    def stage_insert(self, obj, session: Session, model=None):
+        self.stage(session, (
+            model or type(obj), obj.id, obj.create_date, obj.full_amount
+        ))
+
+    def apply(self, session: Session):
+        changes = session.info.pop(FUNDING_CHANGES_KEY, None)
+        if not changes or not self.built:
+            return
+        for change in changes:
+            if change is None:
+                self.invalidate()
+                return
+            model, obj_id, create_date, full_amount = change
+            if not self.indexes[model].append(obj_id, create_date, full_amount):
+                self.invalidate()
+                return
+
+    @staticmethod
+    def discard(session: Session):
+        session.info.pop(FUNDING_CHANGES_KEY, None)
+
+
+funding_index = FundingIndex()
+
+
+def _stage_insert(mapper, connection, target):
+    funding_index.stage_insert(target, object_session(target))
+
+
+def _stage_update(mapper, connection, target):
+    if inspect(target).attrs.full_amount.history.has_changes():
+        funding_index.stage(object_session(target), None)
+
+
+def _stage_delete(mapper, connection, target):
+    funding_index.stage(object_session(target), None)
+
+
+for _model in funding_index.indexes:
+    event.listen(_model, 'after_insert', _stage_insert)
+    event.listen(_model, 'after_update', _stage_update)
+    event.listen(_model, 'after_delete', _stage_delete)
+event.listen(Session, 'after_commit', funding_index.apply)
+event.listen(Session, 'after_rollback', funding_index.discard)
+
+
+async def get_project_funding(
+    project_id: int,
+    session: AsyncSession
+) -> List[Dict[str, int]]:
+    """
+    Возвращает пожертвования, из которых профинансирован проект.
+    Если проекта нет в индексе, индекс перестраивается из БД.
+    """
+    await funding_index.ensure_built(session)
+    transfers = funding_index.project_funding(project_id)
+    if transfers is None:
+        await funding_index.build(session)
+        transfers = funding_index.project_funding(project_id) or []
+    return [
+        {'donation_id': donation_id, 'amount': amount}
+        for donation_id, amount in transfers
+    ]
@@ -1,26 +1,309 @@
+import logging
 from datetime import datetime
-from typing import List, Union
+from functools import lru_cache
+from typing import AsyncIterator, List, Optional, Tuple, Type, Union
 
-from app.models import CharityProject, Donation
+from app.core.config import settings
+from app.crud.base import CRUDBase
+from app.models import CharityProject, Donation, User
+from app.services import allocation_kernel
+from app.services.allocation_lock import allocation_lock
+from app.services.allocation_pool import allocation_pool, open_totals
+from app.services.response_cache import response_cache
 
-from sqlalchemy import select
+from pydantic import BaseModel
+from sqlalchemy import (DateTime, Integer, bindparam, false, select, tuple_,
+                        update)
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql import Select
+
+logger = logging.getLogger(__name__)
+
+
+class AllocationStats:
+    """
+    Счётчики распределения средств.
+    Атрибуты:
+        ---------
+        allocations : int
+            Количество запусков распределения.
+        rows_fetched : int
+            Сколько строк встречных объектов прочитано из БД.
+        rows_touched : int
+            Сколько из прочитанных строк получили или отдали средства.
+        scans_skipped : int
+            Сколько распределений не читали встречные объекты, потому что
+            по итогам открытых объектов свободных денег на другой стороне нет.
+    """
+    __slots__ = (
+        'allocations', 'rows_fetched', 'rows_touched', 'scans_skipped', 'last'
+    )
+
+    def __init__(self):
+        self.allocations = 0
+        self.rows_fetched = 0
+        self.rows_touched = 0
+        self.scans_skipped = 0
+        self.last = None
+
+    def add(self, run: 'AllocationStats'):
+        self.allocations += 1
+        self.rows_fetched += run.rows_fetched
+        self.rows_touched += run.rows_touched
+        self.scans_skipped += run.scans_skipped
+        self.last = run
+
+    def as_dict(self) -> dict:
+        return {
+            'allocations': self.allocations,
+            'rows_fetched': self.rows_fetched,
+            'rows_touched': self.rows_touched,
+            'scans_skipped': self.scans_skipped,
+        }
+
+
+allocation_stats = AllocationStats()
+
+ALLOCATION_COLUMNS = (
+    'id', 'create_date', 'full_amount', 'invested_amount',
+    'fully_invested', 'close_date',
+)
+
+
+class AllocationRecord:
+    """
+    Облегченная запись встречного объекта, которую меняет распределение.
+    В отличие от ORM-объекта не отслеживается сессией: итоги распределения
+    записываются в БД одним пакетным UPDATE. read_totals хранит вклад
+    записи в итоги открытых объектов на момент чтения из БД.
+    """
+    __slots__ = ALLOCATION_COLUMNS + ('read_totals',)
+
+    def __init__(
+            self,
+            obj_id: int,
+            create_date: datetime,
+            full_amount: int,
+            invested_amount: int,
+            fully_invested: bool,
+            close_date: Optional[datetime],
+    ):
+        self.id = obj_id
+        self.create_date = create_date
+        self.full_amount = full_amount
+        self.invested_amount = invested_amount
+        self.fully_invested = fully_invested
+        self.close_date = close_date
+        self.read_totals = open_totals(self)
+
+
+def allocation_columns(model: Union[CharityProject, Donation]) -> list:
+    return [getattr(model, name) for name in ALLOCATION_COLUMNS]
+
+
+def select_not_full_invested(
+    obj_in: Union[CharityProject, Donation],
+    after: Optional[Tuple[datetime, int]] = None,
+    limit: Optional[int] = None,
+) -> Select:
+    """
+    Строит запрос открытых объектов, упорядоченных по (create_date, id).
+    Условие по fully_invested записано литералом, чтобы запрос совпадал
+    с условием частичного индекса `ix_<таблица>_open_pool`.
+    """
+    query = select(*allocation_columns(obj_in)).where(
+        obj_in.fully_invested == false()
+    ).order_by(obj_in.create_date, obj_in.id)
+    if after is not None:
+        query = query.where(
+            tuple_(obj_in.create_date, obj_in.id) > tuple_(*after)
+        )
+    if limit is not None:
+        query = query.limit(limit)
+    return query
+
+
+@lru_cache(maxsize=None)
+def prepared_not_full_invested(
+    model: Union[CharityProject, Donation],
+    after: bool,
+    limit: bool,
+) -> Select:
+    """
+    Запрос открытых объектов с параметрами after_date, after_id и limit.
+    Собирается один раз на вариант, поэтому при выполнении не строится
+    заново и не пересчитывает ключ кеша скомпилированных запросов.
+    """
+    return select_not_full_invested(
+        model,
+        (
+            bindparam('after_date', type_=DateTime),
+            bindparam('after_id', type_=Integer),
+        ) if after else None,
+        bindparam('limit', type_=Integer) if limit else None,
+    )
 
 
 async def get_not_full_invested(
     obj_in: Union[CharityProject, Donation],
-    session: AsyncSession
-) -> List[Union[CharityProject, Donation]]:
+    session: AsyncSession,
+    after: Optional[Tuple[datetime, int]] = None,
+    limit: Optional[int] = None,
+) -> List[AllocationRecord]:
     """
-    Возвращает список объектов типа CharityProject или Donation,
+    Возвращает список записей объектов типа CharityProject или Donation,
     у которых не полностью покрыт запрашиваемый объем инвестиций.
+    Записи упорядочены по (create_date, id); after и limit задают
+    страницу: записи строго после ключа after, не больше limit штук.
+    """
+    params = {}
+    if after is not None:
+        params['after_date'], params['after_id'] = after
+    if limit is not None:
+        params['limit'] = limit
+    rows = await session.execute(
+        prepared_not_full_invested(
+            obj_in, after is not None, limit is not None
+        ),
+        params
+    )
+    return [AllocationRecord(*row) for row in rows]
+
+
+async def stream_not_full_invested(
+    model: Union[CharityProject, Donation],
+    session: AsyncSession,
+    run: AllocationStats,
+    page_size: Optional[int] = None,
+) -> AsyncIterator[AllocationRecord]:
+    """
+    Отдает записи открытых объектов модели по одной, читая их из БД страницами.
+    Следующая страница читается, только когда потребитель дошел до конца
+    предыдущей.
+    """
+    page_size = page_size or settings.allocation_page_size
+    after = None
+    while True:
+        page = await get_not_full_invested(model, session, after, page_size)
+        run.rows_fetched += len(page)
+        for obj in page:
+            yield obj
+        if len(page) < page_size:
+            return
+        after = page[-1].create_date, page[-1].id
+
+
+async def get_records_by_ids(
+    model: Union[CharityProject, Donation],
+    ids: List[int],
+    session: AsyncSession
+) -> List[Optional[AllocationRecord]]:
+    """
+    Возвращает записи объектов модели в порядке переданных идентификаторов.
+    Для отсутствующих в БД идентификаторов возвращается None.
+    """
+    if not ids:
+        return []
+    rows = await session.execute(
+        select(*allocation_columns(model)).where(model.id.in_(ids))
+    )
+    records_by_id = {row.id: AllocationRecord(*row) for row in rows}
+    return [records_by_id.get(obj_id) for obj_id in ids]
+
+
+async def write_allocations(
+    model: Union[CharityProject, Donation],
+    records: List[AllocationRecord],
+    session: AsyncSession,
+):
     """
-    objects = await session.execute(
-        select(obj_in).where(
-            obj_in.fully_invested == 0
-        ).order_by(obj_in.create_date)
+    Записывает итоги распределения одним executemany UPDATE по id
+    и передает новые состояния записей в пул открытых объектов
+    и в итоги allocationstate.
+    """
+    if not records:
+        return
+    table = model.__table__
+    await session.execute(
+        update(table).where(
+            table.c.id == bindparam('record_id')
+        ).values(
+            invested_amount=bindparam('record_invested_amount'),
+            fully_invested=bindparam('record_fully_invested'),
+            close_date=bindparam('record_close_date'),
+        ),
+        [
+            {
+                'record_id': record.id,
+                'record_invested_amount': record.invested_amount,
+                'record_fully_invested': record.fully_invested,
+                'record_close_date': record.close_date,
+            }
+            for record in records
+        ]
     )
-    return objects.scalars().all()
+    for record in records:
+        allocation_pool.stage(record, session=session.sync_session, model=model)
+        allocation_pool.stage_totals(
+            record, open_totals(record), record.read_totals,
+            session=session.sync_session, model=model
+        )
+    response_cache.touch(session.sync_session, model)
+
+
+async def get_pooled_counterparts(
+    amount: int,
+    model_add: Union[CharityProject, Donation],
+    session: AsyncSession,
+    run: AllocationStats,
+) -> List[AllocationRecord]:
+    """
+    Возвращает записи открытых объектов модели model_add, которых хватит,
+    чтобы покрыть сумму amount. Кандидаты берутся из пула
+    открытых объектов; если строки кандидатов в БД разошлись с пулом,
+    пул заново читается из БД.
+    """
+    candidates = allocation_pool.candidates(model_add, amount)
+    records = await get_records_by_ids(
+        model_add, [item.id for item in candidates], session
+    )
+    run.rows_fetched += len(candidates)
+    if all(
+        item.matches(record) for item, record in zip(candidates, records)
+    ):
+        return records
+    await allocation_pool.warm(session)
+    candidates = allocation_pool.candidates(model_add, amount)
+    run.rows_fetched += len(candidates)
+    return await get_records_by_ids(
+        model_add, [item.id for item in candidates], session
+    )
+
+
+async def get_open_counterparts(
+    amount: int,
+    model_add: Union[CharityProject, Donation],
+    session: AsyncSession,
+    run: AllocationStats,
+) -> AsyncIterator[AllocationRecord]:
+    """
+    Отдает записи открытых объектов модели model_add в порядке create_date:
+    из пула открытых объектов ровно столько, сколько нужно для суммы
+    amount, а если пул выключен — страницами из БД, пока их читают.
+    Если по итогам открытых объектов (счетчикам прогретого пула или
+    строке allocationstate) у model_add нет свободных денег, встречные
+    объекты не читаются вовсе.
+    """
+    if not await allocation_pool.has_free_money(session, model_add):
+        run.scans_skipped = 1
+        return
+    if not settings.allocation_pool:
+        async for obj in stream_not_full_invested(model_add, session, run):
+            yield obj
+        return
+    await allocation_pool.ensure_warm(session)
+    for obj in await get_pooled_counterparts(amount, model_add, session, run):
+        yield obj
 
 
 async def close_donation(obj_in: Union[CharityProject, Donation]):
@@ -59,21 +342,217 @@ async def invest_money(
     return obj_in, obj_model
 
 
-async def investing_process(
+async def allocate(
     obj_in: Union[CharityProject, Donation],
     model_add: Union[CharityProject, Donation],
     session: AsyncSession,
 ) -> Union[CharityProject, Donation]:
     """
-    Распределяет средства между не полностью покрытыми проектами и пожертвованиями.
+    Распределяет свободную сумму obj_in между открытыми объектами model_add.
+    Изменения остаются в текущей транзакции, commit не выполняется.
     """
-    objects_model = await get_not_full_invested(model_add, session)
+    run = AllocationStats()
+    touched = []
+    free_amount = obj_in.full_amount - obj_in.invested_amount
+    async for record in get_open_counterparts(
+        free_amount, model_add, session, run
+    ):
+        obj_in, record = await invest_money(obj_in, record)
+        touched.append(record)
+        if obj_in.fully_invested:
+            break
+    run.rows_touched = len(touched)
+    session.add(obj_in)
+    await write_allocations(model_add, touched, session)
+    allocation_stats.add(run)
+    logger.debug(
+        'Распределение %s #%s: прочитано %s, затронуто %s',
+        type(obj_in).__name__, obj_in.id, run.rows_fetched, run.rows_touched
+    )
+    return obj_in
 
-    for model in objects_model:
-        obj_in, model = await invest_money(obj_in, model)
-        session.add(obj_in)
-        session.add(model)
 
-    await session.commit()
+async def investing_process(
+    obj_in: Union[CharityProject, Donation],
+    model_add: Union[CharityProject, Donation],
+    session: AsyncSession,
+) -> Union[CharityProject, Donation]:
+    """
+    Распределяет средства между не полностью покрытыми проектами и пожертвованиями.
+    """
+    async with allocation_lock.hold(session):
+        await allocate(obj_in, model_add, session)
+        await session.commit()
     await session.refresh(obj_in)
     return obj_in
+
+
+async def create_and_allocate(
+    crud: CRUDBase,
+    obj_in: BaseModel,
+    model_add: Union[CharityProject, Donation],
+    response_schema: Type[BaseModel],
+    session: AsyncSession,
+    user: Optional[User] = None,
+) -> BaseModel:
+    """
+    Создает объект и распределяет его средства в текущей транзакции,
+    commit не выполняется. Ответ собирается из состояния сессии,
+    поэтому созданную строку не нужно перечитывать из БД.
+    """
+    db_obj = await crud.create(obj_in, session, user, commit=False)
+    await allocate(db_obj, model_add, session)
+    return response_schema.from_orm(db_obj)
+
+
+async def create_and_invest(
+    crud: CRUDBase,
+    obj_in: BaseModel,
+    model_add: Union[CharityProject, Donation],
+    response_schema: Type[BaseModel],
+    session: AsyncSession,
+    user: Optional[User] = None,
+) -> BaseModel:
+    """
+    Создает объект и распределяет его средства в одной транзакции.
+    """
+    async with allocation_lock.hold(session):
+        response = await create_and_allocate(
+            crud, obj_in, model_add, response_schema, session, user
+        )
+        await session.commit()
+    return response
+
+
+async def delete_and_release(
+    crud: CRUDBase,
+    db_obj: Union[CharityProject, Donation],
+    session: AsyncSession,
+) -> Union[CharityProject, Donation]:
+    """
+    Удаляет объект под блокировкой распределения: удаление не пересекается
+    с распределением, а общий номер записи меняется, и другие процессы
+    сбрасывают кеш списков, пул и индекс /funding.
+    """
+    async with allocation_lock.hold(session):
+        await crud.delete(db_obj, session)
+    return db_obj
+
+
+async def update_and_allocate(
+    crud: CRUDBase,
+    db_obj: Union[CharityProject, Donation],
+    obj_in: BaseModel,
+    model_add: Union[CharityProject, Donation],
+    response_schema: Type[BaseModel],
+    session: AsyncSession,
+) -> BaseModel:
+    """
+    Обновляет объект и досчитывает распределение в текущей транзакции,
+    если изменилась full_amount: при равенстве вложенной сумме объект
+    закрывается, иначе он забирает из открытых объектов model_add
+    только недостающую разницу. Commit не выполняется.
+    """
+    full_amount = db_obj.full_amount
+    db_obj = await crud.update(db_obj, obj_in, session, commit=False)
+    if db_obj.full_amount != full_amount:
+        if db_obj.full_amount == db_obj.invested_amount:
+            await close_donation(db_obj)
+        else:
+            await allocate(db_obj, model_add, session)
+    return response_schema.from_orm(db_obj)
+
+
+async def update_and_invest(
+    crud: CRUDBase,
+    db_obj: Union[CharityProject, Donation],
+    obj_in: BaseModel,
+    model_add: Union[CharityProject, Donation],
+    response_schema: Type[BaseModel],
+    session: AsyncSession,
+) -> BaseModel:
+    """
+    Обновляет объект и досчитывает его распределение в одной транзакции.
+    """
+    async with allocation_lock.hold(session):
+        response = await update_and_allocate(
+            crud, db_obj, obj_in, model_add, response_schema, session
+        )
+        await session.commit()
+    return response
+
+
+async def create_batch_and_allocate(
+    crud: CRUDBase,
+    objs_in: List[BaseModel],
+    model_add: Union[CharityProject, Donation],
+    response_schema: Type[BaseModel],
+    session: AsyncSession,
+    user: Optional[User] = None,
+) -> List[BaseModel]:
+    """
+    Создает пачку объектов и распределяет их средства за один проход
+    в текущей транзакции, commit не выполняется: открытые объекты
+    model_add читаются один раз на всю сумму пачки, а переводы между
+    пачкой и ними считает ядро на накопленных суммах. Объекты пачки
+    получают общую create_date до распределения, чтобы close_date
+    закрытых сразу объектов не оказалась раньше нее.
+    """
+    create_date = datetime.utcnow()
+    db_objs = [crud.build(obj_in, user) for obj_in in objs_in]
+    for db_obj in db_objs:
+        db_obj.create_date = create_date
+        db_obj.invested_amount = 0
+        db_obj.fully_invested = False
+    run = AllocationStats()
+    amount = sum(db_obj.full_amount for db_obj in db_objs)
+    counterparts = []
+    async for record in get_open_counterparts(
+        amount, model_add, session, run
+    ):
+        counterparts.append(record)
+        amount -= record.full_amount - record.invested_amount
+        if amount <= 0:
+            break
+    transfers = allocation_kernel.allocate(
+        allocation_kernel.prefix_sums(
+            db_obj.full_amount for db_obj in db_objs
+        ),
+        allocation_kernel.prefix_sums(
+            record.full_amount - record.invested_amount
+            for record in counterparts
+        ),
+    )
+    for position, counterpart, transferred in transfers:
+        db_objs[position].invested_amount += transferred
+        counterparts[counterpart].invested_amount += transferred
+    run.rows_touched = transfers[-1][1] + 1 if transfers else 0
+    for obj in [*db_objs, *counterparts[:run.rows_touched]]:
+        if obj.invested_amount == obj.full_amount:
+            await close_donation(obj)
+    allocation_stats.add(run)
+
+    await write_allocations(
+        model_add, counterparts[:run.rows_touched], session
+    )
+    await crud.insert_many(db_objs, session)
+    return [response_schema.from_orm(db_obj) for db_obj in db_objs]
+
+
+async def create_batch_and_invest(
+    crud: CRUDBase,
+    objs_in: List[BaseModel],
+    model_add: Union[CharityProject, Donation],
+    response_schema: Type[BaseModel],
+    session: AsyncSession,
+    user: Optional[User] = None,
+) -> List[BaseModel]:
+    """
+    Создает пачку объектов и распределяет их средства в одной транзакции.
+    """
+    async with allocation_lock.hold(session):
+        response = await create_batch_and_allocate(
+            crud, objs_in, model_add, response_schema, session, user
+        )
+        await session.commit()
+    return response
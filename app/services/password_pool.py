@@ -0,0 +1,129 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional, Tuple, TypeVar
+
+from app.core.config import settings
+from fastapi_users.password import PasswordHelper
+from passlib.context import CryptContext
+
+T = TypeVar('T')
+
+
+class PasswordPool:
+    """
+    Ограниченный пул потоков для хеширования и проверки паролей.
+    Атрибуты:
+        ---------
+        max_workers : int
+            Сколько хешей считается одновременно; 0 — считать прямо
+            в цикле событий, как без пула.
+        tasks : int
+            Сколько хешей посчитано через пул.
+        pending : int
+            Сколько хешей сейчас ждут свободного потока или считаются.
+        wait_total, wait_max : float
+            Суммарное и наибольшее время ожидания свободного потока, секунды.
+
+    bcrypt отпускает GIL, поэтому, пока поток считает хеш, цикл событий
+    продолжает обслуживать остальные запросы.
+    """
+
+    def __init__(self, max_workers: int):
+        self.executor: Optional[ThreadPoolExecutor] = None
+        self.lock = threading.Lock()
+        self.configure(max_workers)
+
+    def configure(self, max_workers: int):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+        self.max_workers = max_workers
+        self.executor = ThreadPoolExecutor(
+            max_workers, thread_name_prefix='password'
+        ) if max_workers else None
+        self.tasks = 0
+        self.pending = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def record_wait(self, wait: float):
+        with self.lock:
+            self.tasks += 1
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+
+    async def run(self, func: Callable[..., T], *args) -> T:
+        if self.executor is None:
+            return func(*args)
+        submitted = time.perf_counter()
+
+        def call():
+            self.record_wait(time.perf_counter() - submitted)
+            return func(*args)
+
+        self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(
+                self.executor, call
+            )
+        finally:
+            self.pending -= 1
+
+    def counters(self) -> Dict[str, float]:
+        with self.lock:
+            return {
+                'max_workers': self.max_workers,
+                'tasks': self.tasks,
+                'pending': self.pending,
+                'wait_avg_ms': round(
+                    self.wait_total / self.tasks * 1000, 3
+                ) if self.tasks else 0.0,
+                'wait_max_ms': round(self.wait_max * 1000, 3),
+            }
+
+
+password_pool = PasswordPool(settings.password_hash_workers)
+password_context = CryptContext(schemes=['bcrypt'], deprecated='auto')
+
+
+class PooledPasswordHelper(PasswordHelper):
+    """
+    PasswordHelper, который считает хеши паролей в password_pool.
+
+    Менеджер пользователей fastapi-users вызывает hash и verify_and_update
+    синхронно, поэтому перед его методами результат готовится заранее
+    (prepare_hash, prepare_verify), а синхронный вызов забирает готовое
+    значение. Если результат не подготовлен, хеш считается на месте,
+    как в PasswordHelper.
+    """
+
+    def __init__(self, pool: PasswordPool = password_pool):
+        super().__init__(password_context)
+        self.pool = pool
+        self.hashes: Dict[str, str] = {}
+        self.verified: Dict[Tuple[str, str], Tuple[bool, Optional[str]]] = {}
+
+    async def prepare_hash(self, password: str):
+        self.hashes[password] = await self.pool.run(
+            super().hash, password
+        )
+
+    async def prepare_verify(self, plain_password: str, hashed_password: str):
+        self.verified[plain_password, hashed_password] = await self.pool.run(
+            super().verify_and_update, plain_password, hashed_password
+        )
+
+    def hash(self, password: str) -> str:
+        hashed_password = self.hashes.pop(password, None)
+        if hashed_password is None:
+            return super().hash(password)
+        return hashed_password
+
+    def verify_and_update(
+        self, plain_password: str, hashed_password: str
+    ) -> Tuple[bool, Optional[str]]:
+        result = self.verified.pop((plain_password, hashed_password), None)
+        if result is None:
+            return super().verify_and_update(plain_password, hashed_password)
+        return result
@@ -0,0 +1,238 @@
+"""
+Сверка invested_amount, fully_invested и close_date с тем, что следует
+из правила FIFO.
+
+Обе таблицы читаются по столбцам в массивы NumPy, ожидаемое состояние
+считается через накопленные суммы (как в app.services.allocation_kernel),
+расхождения выводятся в отчет и по флагу --fix исправляются пакетным UPDATE.
+После исправления увеличивается общий номер записи блокировки
+распределения (ALLOCATION_LOCK), чтобы процессы приложения сбросили кеши.
+
+    python -m app.services.reconcile [--fix] [--database-url URL]
+"""
+import argparse
+from datetime import datetime
+from typing import Dict, List
+
+import numpy as np
+
+from app.core.config import settings
+from app.models import CharityProject, Donation
+from app.services.allocation_lock import allocation_lock
+from app.services.allocation_pool import allocation_pool, recount_totals
+
+from sqlalchemy import (Boolean, DateTime, bindparam, case, create_engine,
+                        func, select, update)
+from sqlalchemy.engine import Connection, make_url
+
+CHUNK_SIZE = 100000
+IN_CHUNK_SIZE = 500
+
+
+class TableState:
+    """
+    Столбцы одной таблицы в порядке (create_date, id) и ожидаемое состояние.
+    Атрибуты:
+        ---------
+        ids, full_amount, invested_amount, fully_invested, has_close_date
+            Столбцы таблицы, прочитанные из БД.
+        sums : np.ndarray
+            Накопленные суммы full_amount, начиная с нуля.
+        expected_invested, expected_closed
+            Состояние, которое следует из правила FIFO.
+        mismatched : np.ndarray
+            Позиции строк, расходящихся с ожидаемым состоянием.
+    """
+
+    def __init__(self, columns: np.ndarray):
+        (
+            self.ids, self.full_amount, self.invested_amount,
+            self.fully_invested, self.has_close_date,
+        ) = columns
+        self.sums = np.concatenate(([0], np.cumsum(self.full_amount)))
+
+    def expect(self, other: 'TableState'):
+        total = min(self.sums[-1], other.sums[-1])
+        self.expected_invested = np.clip(
+            np.minimum(self.sums[1:], total) - self.sums[:-1], 0, None
+        )
+        self.expected_closed = self.expected_invested == self.full_amount
+        self.mismatched = np.flatnonzero(
+            (self.invested_amount != self.expected_invested) |
+            (self.fully_invested.astype(bool) != self.expected_closed) |
+            (self.has_close_date.astype(bool) != self.expected_closed)
+        )
+
+    def closing_positions(self, other: 'TableState', positions: np.ndarray) -> np.ndarray:
+        """
+        Для закрытых строк возвращает позиции встречных объектов,
+        на которых закончилась их сумма.
+        """
+        return np.searchsorted(
+            other.sums, self.sums[positions + 1], side='left'
+        ) - 1
+
+    def report(self) -> Dict[str, int]:
+        return {
+            'rows': len(self.ids),
+            'mismatched': len(self.mismatched),
+            'invested_amount': int(np.count_nonzero(
+                self.invested_amount != self.expected_invested
+            )),
+            'fully_invested': int(np.count_nonzero(
+                self.fully_invested.astype(bool) != self.expected_closed
+            )),
+            'close_date': int(np.count_nonzero(
+                self.has_close_date.astype(bool) != self.expected_closed
+            )),
+        }
+
+
+def load_table(connection: Connection, model) -> TableState:
+    """
+    Читает таблицу кусками по CHUNK_SIZE строк в один массив int64.
+    Строки берутся прямо с курсора драйвера: обработка строк SQLAlchemy
+    здесь стоила бы дороже самого запроса.
+    """
+    query = select(
+        model.id,
+        model.full_amount,
+        model.invested_amount,
+        model.fully_invested,
+        model.close_date.isnot(None),
+    ).order_by(model.create_date, model.id)
+    chunks = [np.empty((0, 5), dtype=np.int64)]
+    cursor = connection.connection.cursor()
+    try:
+        cursor.execute(str(query.compile(connection)))
+        rows = cursor.fetchmany(CHUNK_SIZE)
+        while rows:
+            chunks.append(np.array(rows, dtype=np.int64))
+            rows = cursor.fetchmany(CHUNK_SIZE)
+    finally:
+        cursor.close()
+    return TableState(np.concatenate(chunks).T)
+
+
+def fetch_create_dates(connection: Connection, model, ids: List[int]) -> Dict[int, datetime]:
+    create_dates = {}
+    for start in range(0, len(ids), IN_CHUNK_SIZE):
+        rows = connection.execute(
+            select(model.id, model.create_date).where(
+                model.id.in_(ids[start:start + IN_CHUNK_SIZE])
+            )
+        )
+        create_dates.update(rows.all())
+    return create_dates
+
+
+def write_corrections(
+    connection: Connection,
+    model,
+    state: TableState,
+    other_model,
+    other: TableState,
+):
+    """
+    Исправляет расходящиеся строки одним executemany UPDATE.
+    Уже проставленная close_date закрытых объектов сохраняется; недостающая
+    равна create_date объекта или закрывшего его встречного объекта,
+    смотря что позже.
+    """
+    positions = state.mismatched
+    if not len(positions):
+        return
+    closed = positions[state.expected_closed[positions]]
+    counterparts = state.closing_positions(other, closed)
+    own_dates = fetch_create_dates(
+        connection, model, state.ids[closed].tolist()
+    )
+    other_dates = fetch_create_dates(
+        connection, other_model, other.ids[counterparts].tolist()
+    )
+    close_dates = {
+        int(state.ids[position]): max(
+            own_dates[int(state.ids[position])],
+            other_dates[int(other.ids[counterpart])],
+        )
+        for position, counterpart in zip(closed, counterparts)
+    }
+    table = model.__table__
+    connection.execute(
+        update(table).where(
+            table.c.id == bindparam('row_id')
+        ).values(
+            invested_amount=bindparam('row_invested_amount'),
+            fully_invested=bindparam('row_fully_invested'),
+            close_date=case(
+                (
+                    bindparam('row_fully_invested', type_=Boolean),
+                    func.coalesce(
+                        table.c.close_date,
+                        bindparam('row_close_date', type_=DateTime),
+                    ),
+                ),
+                else_=None,
+            ),
+        ),
+        [
+            {
+                'row_id': int(state.ids[position]),
+                'row_invested_amount': int(state.expected_invested[position]),
+                'row_fully_invested': bool(state.expected_closed[position]),
+                'row_close_date': close_dates.get(int(state.ids[position])),
+            }
+            for position in positions
+        ]
+    )
+
+
+def reconcile(connection: Connection, fix: bool = False) -> Dict[str, dict]:
+    """
+    Сверяет обе таблицы и, если fix, исправляет расхождения, пересчитывает
+    итоги открытых объектов в allocationstate и сбрасывает пул открытых
+    объектов этого процесса. Возвращает отчет по каждой таблице с примерами расходящихся id.
+    """
+    projects = load_table(connection, CharityProject)
+    donations = load_table(connection, Donation)
+    projects.expect(donations)
+    donations.expect(projects)
+    report = {}
+    for model, state in ((CharityProject, projects), (Donation, donations)):
+        report[model.__tablename__] = dict(
+            state.report(), sample=state.ids[state.mismatched[:10]].tolist()
+        )
+    if fix:
+        write_corrections(connection, CharityProject, projects, Donation, donations)
+        write_corrections(connection, Donation, donations, CharityProject, projects)
+        connection.execute(recount_totals())
+        allocation_pool.invalidate()
+    return report
+
+
+def sync_url(database_url: str) -> str:
+    url = make_url(database_url)
+    return str(url.set(drivername=url.get_backend_name()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--database-url', default=settings.database_url)
+    parser.add_argument(
+        '--fix', action='store_true', help='записать исправления в БД'
+    )
+    args = parser.parse_args()
+    engine = create_engine(sync_url(args.database_url))
+    with engine.begin() as connection:
+        report = reconcile(connection, fix=args.fix)
+    if args.fix:
+        # Номер записи увеличивается после commit исправлений: процессы
+        # приложения сбросят кеши и перечитают уже исправленные строки.
+        with engine.begin() as connection:
+            allocation_lock.bump_sync(connection)
+    for table, table_report in report.items():
+        print(table, table_report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+from secrets import token_hex
+from typing import Dict, Hashable, Optional, Tuple
+
+from app.models import CharityProject, Donation
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+CACHE_CHANGES_KEY = 'response_cache_changes'
+
+
+class CachedResponse:
+    """
+    Готовое тело ответа и его заголовки.
+    """
+    __slots__ = ('version', 'body', 'headers')
+
+    def __init__(self, version: int, body: bytes, headers: Dict[str, str]):
+        self.version = version
+        self.body = body
+        self.headers = headers
+
+
+class ResponseCache:
+    """
+    Кеш закодированных ответов списков, разбитый по таблицам.
+
+    У каждой таблицы есть версия. Изменения через ORM отмечаются
+    в сессии событиями маппера, пакетные UPDATE мимо ORM (запись итогов
+    распределения) отмечают таблицу сами. После commit версии отмеченных таблиц увеличиваются,
+    и старые ответы перестают отдаваться. ETag строится из версии,
+    поэтому If-None-Match проверяется без обращения к БД.
+
+    Версии живут в памяти процесса: записи, сделанные другим процессом,
+    этот кеш не видит.
+    """
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        # Новый токен не дает ETag, выданным до сброса, совпасть
+        # с ETag новых данных.
+        self.token = token_hex(4)
+        self.versions: Dict[str, int] = {}
+        self.entries: Dict[Tuple[str, Hashable], CachedResponse] = {}
+
+    def version(self, model) -> int:
+        return self.versions.get(model.__tablename__, 0)
+
+    def etag(self, model, version: Optional[int] = None) -> str:
+        if version is None:
+            version = self.version(model)
+        return f'"{self.token}-{model.__tablename__}-{version}"'
+
+    def matches(self, model, if_none_match: Optional[str]) -> bool:
+        """
+        Проверяет заголовок If-None-Match по текущей версии таблицы.
+        """
+        if not if_none_match:
+            return False
+        etags = {etag.strip() for etag in if_none_match.split(',')}
+        return '*' in etags or self.etag(model) in etags
+
+    def get(self, model, key: Hashable) -> Optional[CachedResponse]:
+        cached = self.entries.get((model.__tablename__, key))
+        if cached is None or cached.version != self.version(model):
+            return None
+        return cached
+
+    def set(self, model, key: Hashable, cached: CachedResponse):
+        # Ответ, собранный по данным старой версии, не сохраняется:
+        # пока его читали, таблица успела измениться.
+        if cached.version == self.version(model):
+            self.entries[(model.__tablename__, key)] = cached
+
+    @staticmethod
+    def touch(session: Session, *models):
+        session.info.setdefault(CACHE_CHANGES_KEY, set()).update(
+            model.__tablename__ for model in models
+        )
+
+    def apply(self, session: Session):
+        for table in session.info.pop(CACHE_CHANGES_KEY, ()):
+            self.versions[table] = self.versions.get(table, 0) + 1
+            for key in [key for key in self.entries if key[0] == table]:
+                del self.entries[key]
+
+    @staticmethod
+    def discard(session: Session):
+        session.info.pop(CACHE_CHANGES_KEY, None)
+
+
+response_cache = ResponseCache()
+
+
+def _touch(mapper, connection, target):
+    response_cache.touch(object_session(target), type(target))
+
+
+for _model in (CharityProject, Donation):
+    for _event in ('after_insert', 'after_update', 'after_delete'):
+        event.listen(_model, _event, _touch)
+event.listen(Session, 'after_commit', response_cache.apply)
+event.listen(Session, 'after_rollback', response_cache.discard)
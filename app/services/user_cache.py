@@ -0,0 +1,82 @@
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from app.core.config import settings
+from app.models import User
+
+from sqlalchemy import inspect
+from sqlalchemy.orm import make_transient_to_detached
+
+
+class UserCache:
+    """
+    Ограниченный по размеру и времени жизни кеш проверенных пользователей
+    по id.
+    Атрибуты:
+        ---------
+        max_size : int
+            Сколько пользователей хранится; самые давние вытесняются первыми.
+        ttl : float
+            Сколько секунд запись считается свежей; 0 выключает кеш.
+        hits, misses : int
+            Сколько раз пользователь нашелся в кеше и сколько раз его
+            пришлось читать из БД.
+
+    Хранятся значения столбцов, а не ORM-объекты: каждое попадание
+    получает свою отсоединенную копию, которую можно добавить в любую
+    сессию без повторной загрузки из БД.
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries: 'OrderedDict[int, Tuple[float, dict]]' = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def clear(self):
+        self.invalidate_all()
+        self.hits = 0
+        self.misses = 0
+
+    def invalidate_all(self):
+        self.entries.clear()
+
+    def get(self, user_id: int) -> Optional[User]:
+        entry = self.entries.get(user_id)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self.entries[user_id]
+            self.misses += 1
+            return None
+        self.entries.move_to_end(user_id)
+        self.hits += 1
+        user = User(**entry[1])
+        make_transient_to_detached(user)
+        return user
+
+    def set(self, user: User):
+        if not self.ttl or not self.max_size:
+            return
+        values = {
+            column.key: getattr(user, column.key)
+            for column in inspect(User).column_attrs
+        }
+        self.entries[user.id] = (time.monotonic() + self.ttl, values)
+        self.entries.move_to_end(user.id)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def invalidate(self, user_id: int):
+        self.entries.pop(user_id, None)
+
+    def counters(self) -> Dict[str, int]:
+        return {
+            'size': len(self.entries),
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+
+user_cache = UserCache(settings.user_cache_size, settings.user_cache_ttl)
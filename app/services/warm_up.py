@@ -0,0 +1,63 @@
+import asyncio
+from datetime import datetime
+from typing import Optional
+
+from app.core import db
+from app.crud.charity_project import charity_crud
+from app.crud.donation import donation_crud
+from app.models import CharityProject, Donation, User
+from app.services.investing import get_not_full_invested
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
+
+NO_USER = User(id=0)
+
+
+async def open_connections(engine: AsyncEngine):
+    """
+    Открывает столько соединений, сколько держит пул движка, и возвращает
+    их в пул. Движку без пула хватает одного соединения: оно загружает
+    модули диалекта и драйвера.
+    """
+    size = engine.pool.size() if isinstance(engine.pool, QueuePool) else 1
+
+    async def ping():
+        async with engine.connect() as connection:
+            await connection.execute(text('SELECT 1'))
+
+    await asyncio.gather(*(ping() for _ in range(size)))
+
+
+async def run_hot_statements(session: AsyncSession):
+    """
+    Выполняет по разу частые запросы, чтобы они попали в кеш
+    скомпилированных запросов движка. Параметры ничего не находят.
+    """
+    await charity_crud.get_object(0, session)
+    await donation_crud.get_object(0, session)
+    await charity_crud.get_charity_id_by_name('', session)
+    for model in (CharityProject, Donation):
+        await get_not_full_invested(model, session, limit=1)
+        await get_not_full_invested(model, session, (datetime.min, 0), 1)
+    await donation_crud.get_my_donation(session, NO_USER)
+    await donation_crud.get_my_donation(session, NO_USER, limit=1)
+
+
+async def warm_up(engine: AsyncEngine, session_factory: Optional[sessionmaker] = None):
+    await open_connections(engine)
+    session_factory = session_factory or sessionmaker(engine, class_=AsyncSession)
+    async with session_factory() as session:
+        await run_hot_statements(session)
+
+
+async def warm_up_database():
+    """
+    Прогревает соединения и частые запросы при старте приложения,
+    чтобы их стоимость не ложилась на первые запросы после деплоя.
+    """
+    await warm_up(db.engine, db.AsyncSessionLocal)
+    if db.read_engine is not None:
+        await warm_up(db.read_engine, db.ReadSessionLocal)
@@ -0,0 +1,104 @@
+"""
+Сравнение записи итогов распределения: пообъектный ORM flush против
+пакетного executemany UPDATE.
+
+Проект на N рублей забирает N открытых пожертвований по 1 рублю.
+
+    python -m benchmarks.bulk_update --donations 1000 10000
+"""
+import argparse
+import asyncio
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from app.core.config import settings
+from app.core.db import Base
+from app.models import CharityProject, Donation
+from app.services.investing import allocate, invest_money
+
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+
+async def seed(engine, donations: int):
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.drop_all)
+        await connection.run_sync(Base.metadata.create_all)
+        start = datetime(2020, 1, 1)
+        await connection.execute(insert(Donation), [
+            {
+                'full_amount': 1,
+                'invested_amount': 0,
+                'fully_invested': False,
+                'create_date': start + timedelta(seconds=number),
+            }
+            for number in range(donations)
+        ])
+
+
+def new_project(donations: int) -> CharityProject:
+    return CharityProject(
+        name='benchmark',
+        description='benchmark',
+        full_amount=donations,
+        invested_amount=0,
+        fully_invested=False,
+    )
+
+
+async def orm_flush(session: AsyncSession, project: CharityProject):
+    objects = await session.execute(
+        select(Donation).where(
+            Donation.fully_invested == 0
+        ).order_by(Donation.create_date)
+    )
+    for donation in objects.scalars().all():
+        project, donation = await invest_money(project, donation)
+        session.add(project)
+        session.add(donation)
+
+
+async def bulk_update(session: AsyncSession, project: CharityProject):
+    await allocate(project, Donation, session)
+
+
+async def measure(engine, donations: int, strategy) -> float:
+    await seed(engine, donations)
+    session_factory = sessionmaker(engine, class_=AsyncSession)
+    async with session_factory() as session:
+        project = new_project(donations)
+        session.add(project)
+        await session.flush()
+        started = time.perf_counter()
+        await strategy(session, project)
+        await session.commit()
+        elapsed = time.perf_counter() - started
+    return elapsed
+
+
+async def main(sizes):
+    settings.allocation_pool = False
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_async_engine(
+            f'sqlite+aiosqlite:///{Path(directory) / "bench.db"}'
+        )
+        print(f'{"donations":>10} {"orm flush, s":>14} {"bulk, s":>10} {"x":>6}')
+        for size in sizes:
+            orm_time = await measure(engine, size, orm_flush)
+            bulk_time = await measure(engine, size, bulk_update)
+            print(
+                f'{size:>10} {orm_time:>14.3f} {bulk_time:>10.3f} '
+                f'{orm_time / bulk_time:>6.1f}'
+            )
+        await engine.dispose()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        '--donations', type=int, nargs='+', default=[1000, 10000]
+    )
+    asyncio.run(main(parser.parse_args().donations))
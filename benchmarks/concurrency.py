@@ -0,0 +1,179 @@
+"""
+Нагрузочная проверка распределения в нескольких процессах.
+
+Каждый процесс-воркер со своим движком БД создает вперемешку проекты
+и пожертвования через create_and_invest, как это делают воркеры uvicorn.
+Воркеры стартуют одновременно; после них сверка app.services.reconcile
+проверяет, что итог совпадает с правилом FIFO.
+
+    python -m benchmarks.concurrency --workers 1 2 4 --count 200 --lock file
+
+С --lock none можно сравнить пропускную способность без блокировки.
+На SQLite запись и так сериализуется блокировкой самой базы, но пул
+открытых объектов каждого процесса не видит объекты других процессов;
+на серверных БД процессы к тому же читают одни и те же открытые объекты.
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List
+
+from app.core.db import Base
+from app.crud.charity_project import charity_crud
+from app.crud.donation import donation_crud
+from app.models import CharityProject, Donation
+from app.schemas.charity_project import CharityCreate, CharityDB
+from app.schemas.donation import DonationCreate, DonationDB
+from app.services.investing import create_and_invest
+from app.services.reconcile import reconcile, sync_url
+
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+PROJECT_RATIO = 0.5
+MAX_AMOUNT = 1000
+
+
+async def create_items(database_url: str, worker: int, count: int, seed: int) -> int:
+    """
+    Создает count объектов и возвращает число упавших запросов.
+    """
+    engine = create_async_engine(database_url)
+    session_factory = sessionmaker(engine, class_=AsyncSession)
+    rnd = random.Random(seed * 1000 + worker)
+    errors = 0
+    for number in range(count):
+        async with session_factory() as session:
+            try:
+                if rnd.random() < PROJECT_RATIO:
+                    await create_and_invest(
+                        charity_crud,
+                        CharityCreate(
+                            name=f'{worker}-{number}',
+                            description='stress',
+                            full_amount=rnd.randint(1, MAX_AMOUNT),
+                        ),
+                        Donation, CharityDB, session
+                    )
+                else:
+                    await create_and_invest(
+                        donation_crud,
+                        DonationCreate(full_amount=rnd.randint(1, MAX_AMOUNT)),
+                        CharityProject, DonationDB, session
+                    )
+            except Exception:
+                errors += 1
+    await engine.dispose()
+    return errors
+
+
+def run_worker(database_url: str, worker: int, count: int, seed: int, barrier, results):
+    barrier.wait()
+    started = time.time()
+    errors = asyncio.run(create_items(database_url, worker, count, seed))
+    results.put((started, time.time(), errors))
+
+
+@contextmanager
+def environment(**values: str) -> Iterator[None]:
+    """
+    Временно задает переменные окружения: запущенные процессы читают
+    из них настройки приложения.
+    """
+    saved = {key: os.environ.get(key) for key in values}
+    os.environ.update(values)
+    try:
+        yield
+    finally:
+        for key, value in saved.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+
+
+def prepare(database_url: str):
+    engine = create_engine(sync_url(database_url))
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    engine.dispose()
+
+
+def stress(
+    database_url: str,
+    workers: int,
+    count: int,
+    lock: str = 'file',
+    lock_path: str = './allocation.lock',
+    seed: int = 0,
+) -> Dict[str, float]:
+    """
+    Запускает workers процессов по count объектов на чистой базе
+    и возвращает пропускную способность и итог сверки.
+    """
+    prepare(database_url)
+    context = multiprocessing.get_context('spawn')
+    barrier = context.Barrier(workers)
+    results = context.Queue()
+    with environment(
+        DATABASE_URL=database_url,
+        ALLOCATION_LOCK=lock,
+        ALLOCATION_LOCK_PATH=str(lock_path),
+    ):
+        processes = [
+            context.Process(
+                target=run_worker,
+                args=(database_url, worker, count, seed, barrier, results)
+            )
+            for worker in range(workers)
+        ]
+        for process in processes:
+            process.start()
+    finished = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    seconds = max(end for _, end, _ in finished) - min(start for start, _, _ in finished)
+    engine = create_engine(sync_url(database_url))
+    with engine.begin() as connection:
+        report = reconcile(connection)
+    engine.dispose()
+    return {
+        'workers': workers,
+        'items': workers * count,
+        'errors': sum(errors for _, _, errors in finished),
+        'seconds': round(seconds, 3),
+        'throughput': round(workers * count / seconds, 1),
+        'mismatched': sum(table['mismatched'] for table in report.values()),
+    }
+
+
+def main(args: List[str] = None):
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('--database-url', help='по умолчанию временная база SQLite')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--count', type=int, default=200)
+    parser.add_argument('--lock', choices=('none', 'file', 'row'), default='file')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(args)
+    with tempfile.TemporaryDirectory() as directory:
+        database_url = args.database_url or (
+            f'sqlite+aiosqlite:///{Path(directory) / "concurrency.db"}'
+        )
+        for workers in args.workers:
+            print(stress(
+                database_url, workers, args.count, args.lock,
+                Path(directory) / 'allocation.lock', args.seed
+            ))
+
+
+if __name__ == '__main__':
+    main()
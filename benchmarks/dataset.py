@@ -0,0 +1,220 @@
+"""
+Генератор синтетической базы для нагрузочных замеров.
+
+Схема создается из app.models, строки пишутся пакетами executemany по
+одной транзакции на таблицу. Состояние распределения сразу согласовано
+с правилом FIFO: invested_amount, fully_invested и close_date считаются
+через накопленные суммы, как в app.services.allocation_kernel.
+Итоги открытых объектов в allocationstate пересчитываются после вставки.
+
+    python -m benchmarks.dataset --database-url sqlite:///load.db \\
+        --projects 20000 --donations 2000000 --open-ratio 0.2 --days 365
+
+Открытой остается доля --open-ratio объектов стороны --open-side;
+на другой стороне открытым может остаться не больше одного объекта.
+"""
+import argparse
+import random
+import time
+from bisect import bisect_left
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List
+
+from app.core.db import Base
+from app.models import CharityProject, Donation, User
+from app.services.allocation_kernel import invested_amounts, prefix_sums
+from app.services.allocation_pool import recount_totals
+from app.services.reconcile import sync_url
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.engine import Connection
+
+BATCH_SIZE = 10000
+MAX_DONATION = 1000
+UNUSABLE_PASSWORD = '!'
+OPEN_SIDES = {
+    CharityProject.__tablename__: CharityProject,
+    Donation.__tablename__: Donation,
+}
+
+
+def spread_dates(count: int, start: datetime, days: float, rnd: random.Random) -> List[datetime]:
+    """
+    Возвращает count возрастающих дат, равномерно разбросанных
+    по days дням начиная со start.
+    """
+    seconds = days * 24 * 60 * 60
+    return [
+        start + timedelta(seconds=offset)
+        for offset in sorted(rnd.uniform(0, seconds) for _ in range(count))
+    ]
+
+
+def fit_amounts(count: int, total: int, rnd: random.Random) -> List[int]:
+    """
+    Возвращает count случайных положительных сумм, в сумме дающих total
+    (если total не меньше count).
+    """
+    if not count:
+        return []
+    mean = max(total / count, 1)
+    amounts = [rnd.randint(1, max(1, int(2 * mean) - 1)) for _ in range(count)]
+    amounts[-1] = max(1, amounts[-1] + total - sum(amounts))
+    return amounts
+
+
+def generate_amounts(
+    projects: int,
+    donations: int,
+    open_side: str,
+    open_ratio: float,
+    rnd: random.Random,
+) -> Dict[type, List[int]]:
+    """
+    Подбирает суммы так, чтобы на стороне open_side осталась открытой
+    примерно доля open_ratio объектов, а другая сторона была закрыта.
+    """
+    counts = {CharityProject: projects, Donation: donations}
+    open_model = OPEN_SIDES[open_side]
+    closed_model = Donation if open_model is CharityProject else CharityProject
+    mean = MAX_DONATION / 2 * max(1, donations / max(projects, 1))
+    open_amounts = [
+        rnd.randint(1, int(2 * mean) if open_model is CharityProject else MAX_DONATION)
+        for _ in range(counts[open_model])
+    ]
+    funded = counts[open_model] - round(counts[open_model] * open_ratio)
+    total = prefix_sums(open_amounts)[funded]
+    return {
+        open_model: open_amounts,
+        closed_model: fit_amounts(counts[closed_model], total, rnd),
+    }
+
+
+def build_rows(
+    model,
+    amounts: List[int],
+    create_dates: List[datetime],
+    own_sums,
+    other_sums,
+    other_dates: List[datetime],
+    users: int,
+    rnd: random.Random,
+) -> Iterator[dict]:
+    invested = invested_amounts(own_sums, other_sums)
+    for number, amount in enumerate(amounts):
+        create_date = create_dates[number]
+        row = {
+            'full_amount': amount,
+            'invested_amount': invested[number],
+            'fully_invested': invested[number] == amount,
+            'create_date': create_date,
+            'close_date': None,
+        }
+        if row['fully_invested']:
+            # Объект закрылся на том встречном объекте, в отрезок
+            # которого попадает конец его собственного отрезка.
+            closing = bisect_left(other_sums, own_sums[number + 1]) - 1
+            row['close_date'] = max(create_date, other_dates[closing])
+        if model is CharityProject:
+            row['name'] = f'Проект {number}'
+            row['description'] = f'Синтетический проект {number}'
+        else:
+            row['user_id'] = rnd.randint(1, users) if users else None
+            row['comment'] = None
+        yield row
+
+
+def insert_batches(connection: Connection, model, rows: Iterator[dict], batch_size: int):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == batch_size:
+            connection.execute(insert(model), batch)
+            batch = []
+    if batch:
+        connection.execute(insert(model), batch)
+
+
+def generate(
+    database_url: str,
+    projects: int,
+    donations: int,
+    users: int = 100,
+    open_side: str = CharityProject.__tablename__,
+    open_ratio: float = 0.2,
+    days: float = 365,
+    start: datetime = datetime(2020, 1, 1),
+    batch_size: int = BATCH_SIZE,
+    seed: int = 0,
+) -> Dict[str, int]:
+    """
+    Создает схему и заполняет базу. Возвращает число открытых
+    объектов в каждой таблице.
+    """
+    rnd = random.Random(seed)
+    engine = create_engine(sync_url(database_url))
+    Base.metadata.create_all(engine)
+    amounts = generate_amounts(projects, donations, open_side, open_ratio, rnd)
+    sums = {model: prefix_sums(amounts[model]) for model in amounts}
+    dates = {
+        model: spread_dates(len(amounts[model]), start, days, rnd)
+        for model in amounts
+    }
+    summary = {}
+    with engine.begin() as connection:
+        insert_batches(connection, User, (
+            {
+                'email': f'user{number}@example.com',
+                'hashed_password': UNUSABLE_PASSWORD,
+                'is_active': True,
+                'is_superuser': False,
+                'is_verified': True,
+            }
+            for number in range(1, users + 1)
+        ), batch_size)
+    for model, other in ((CharityProject, Donation), (Donation, CharityProject)):
+        rows = build_rows(
+            model, amounts[model], dates[model], sums[model], sums[other],
+            dates[other], users, rnd,
+        )
+        with engine.begin() as connection:
+            insert_batches(connection, model, rows, batch_size)
+        summary[model.__tablename__] = sum(
+            invested != amount for invested, amount in zip(
+                invested_amounts(sums[model], sums[other]), amounts[model]
+            )
+        )
+    with engine.begin() as connection:
+        connection.execute(recount_totals())
+    engine.dispose()
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('--database-url', required=True)
+    parser.add_argument('--projects', type=int, default=10000)
+    parser.add_argument('--donations', type=int, default=1000000)
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument(
+        '--open-side', choices=sorted(OPEN_SIDES), default=CharityProject.__tablename__
+    )
+    parser.add_argument('--open-ratio', type=float, default=0.2)
+    parser.add_argument('--days', type=float, default=365)
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    summary = generate(
+        args.database_url, args.projects, args.donations, users=args.users,
+        open_side=args.open_side, open_ratio=args.open_ratio, days=args.days,
+        batch_size=args.batch_size, seed=args.seed,
+    )
+    print(f'Готово за {time.perf_counter() - started:.1f} с, открытых: {summary}')
+
+
+if __name__ == '__main__':
+    main()
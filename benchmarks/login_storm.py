@@ -0,0 +1,160 @@
+"""
+Задержка создания пожертвований во время волны входов в систему.
+
+Для каждого значения PASSWORD_HASH_WORKERS запускается сервер uvicorn
+на чистой базе SQLite. Сначала один клиент создает пожертвования без
+фоновой нагрузки, затем то же самое повторяется, пока --logins потоков
+непрерывно входят в систему через /auth/jwt/login. При 0 bcrypt считается
+прямо в цикле событий, как было до пула потоков.
+
+    python -m benchmarks.login_storm --workers 0 2 --seconds 5 --logins 8
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List
+
+from benchmarks.concurrency import prepare
+
+import requests
+
+HOST = '127.0.0.1'
+PASSWORD = 'chimichangas4life'
+
+
+def start_server(database_url: str, workers: int, port: int) -> subprocess.Popen:
+    env = dict(
+        os.environ,
+        DATABASE_URL=database_url,
+        PASSWORD_HASH_WORKERS=str(workers),
+    )
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'app.main:app',
+         '--host', HOST, '--port', str(port), '--log-level', 'warning'],
+        env=env,
+        stdout=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            requests.get(f'http://{HOST}:{port}/docs', timeout=1)
+            return server
+        except requests.ConnectionError:
+            time.sleep(0.1)
+    server.kill()
+    raise RuntimeError('Сервер не запустился за 30 секунд.')
+
+
+def register(base_url: str, email: str) -> None:
+    requests.post(
+        f'{base_url}/auth/register', json={'email': email, 'password': PASSWORD}
+    ).raise_for_status()
+
+
+def login(session: requests.Session, base_url: str, email: str) -> str:
+    response = session.post(
+        f'{base_url}/auth/jwt/login',
+        data={'username': email, 'password': PASSWORD},
+    )
+    response.raise_for_status()
+    return response.json()['access_token']
+
+
+def donate(base_url: str, token: str, seconds: float) -> List[float]:
+    """
+    Создает пожертвования одно за другим и возвращает задержки в мс.
+    """
+    latencies = []
+    with requests.Session() as session:
+        session.headers['Authorization'] = f'Bearer {token}'
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            session.post(
+                f'{base_url}/donation/', json={'full_amount': 100}
+            ).raise_for_status()
+            latencies.append((time.perf_counter() - started) * 1000)
+    return latencies
+
+
+def storm(base_url: str, emails: List[str], stop: threading.Event, counter: List[int]):
+    with requests.Session() as session:
+        while not stop.is_set():
+            for email in emails:
+                if stop.is_set():
+                    break
+                login(session, base_url, email)
+                counter.append(1)
+
+
+def summary(latencies: List[float]) -> Dict[str, float]:
+    latencies = sorted(latencies)
+    return {
+        'requests': len(latencies),
+        'p50_ms': round(statistics.median(latencies), 1),
+        'p99_ms': round(latencies[int(len(latencies) * 0.99)], 1),
+        'max_ms': round(latencies[-1], 1),
+    }
+
+
+def measure(
+    directory: Path, workers: int, port: int, seconds: float, logins: int
+) -> Dict[str, Dict[str, float]]:
+    database_url = f'sqlite+aiosqlite:///{directory / f"storm-{workers}.db"}'
+    prepare(database_url)
+    server = start_server(database_url, workers, port)
+    base_url = f'http://{HOST}:{port}'
+    try:
+        emails = [f'user{number}@storm.com' for number in range(logins + 1)]
+        for email in emails:
+            register(base_url, email)
+        with requests.Session() as session:
+            token = login(session, base_url, emails[0])
+        report = {'idle': summary(donate(base_url, token, seconds))}
+        stop = threading.Event()
+        counter: List[int] = []
+        threads = [
+            threading.Thread(
+                target=storm, args=(base_url, emails[1:], stop, counter)
+            )
+            for _ in range(logins)
+        ]
+        for thread in threads:
+            thread.start()
+        try:
+            report['storm'] = summary(donate(base_url, token, seconds))
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join()
+        report['storm']['logins_per_s'] = round(len(counter) / seconds, 1)
+        return report
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main(args: List[str] = None):
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('--workers', type=int, nargs='+', default=[0, 2])
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--logins', type=int, default=8)
+    parser.add_argument('--port', type=int, default=8765)
+    args = parser.parse_args(args)
+    with tempfile.TemporaryDirectory() as directory:
+        for workers in args.workers:
+            print(f'password_hash_workers={workers}', measure(
+                Path(directory), workers, args.port, args.seconds, args.logins
+            ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""
+Сравнение одновременного чтения и записи на SQLite с настройками движка
+по умолчанию и с производственным профилем: WAL, synchronous=NORMAL,
+busy_timeout и пул соединений.
+
+Писатели создают пожертвования через create_and_invest, читатели
+запрашивают список проектов. Для каждого профиля берется своя база
+из benchmarks.dataset, так как режим журнала сохраняется в файле.
+
+    python -m benchmarks.sqlite_profile --seconds 5 --writers 2 --readers 8
+"""
+import argparse
+import asyncio
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict
+
+from app.core.config import Settings
+from app.core.db import build_engine
+from app.crud.charity_project import charity_crud
+from app.crud.donation import donation_crud
+from app.models import CharityProject
+from app.schemas.donation import DonationCreate, DonationDB
+from app.services.investing import create_and_invest
+from benchmarks.dataset import generate
+
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+READ_LIMIT = 20
+PROFILES = {
+    'default': {},
+    'production': {
+        'sqlite_journal_mode': 'WAL',
+        'sqlite_synchronous': 'NORMAL',
+        'sqlite_busy_timeout': 5000,
+        'sqlite_cache_size': -64000,
+        'sqlite_mmap_size': 268435456,
+        'engine_pool_size': 10,
+        'engine_max_overflow': 10,
+    },
+}
+
+
+async def workload(
+    config: Settings,
+    seconds: float,
+    writers: int,
+    readers: int,
+) -> Dict[str, float]:
+    engine = build_engine(config)
+    session_factory = sessionmaker(engine, class_=AsyncSession)
+    counters = {'writes': 0, 'reads': 0, 'errors': 0}
+    deadline = time.perf_counter() + seconds
+
+    async def write():
+        while time.perf_counter() < deadline:
+            async with session_factory() as session:
+                try:
+                    await create_and_invest(
+                        donation_crud, DonationCreate(full_amount=100),
+                        CharityProject, DonationDB, session
+                    )
+                    counters['writes'] += 1
+                except OperationalError:
+                    counters['errors'] += 1
+
+    async def read():
+        while time.perf_counter() < deadline:
+            async with session_factory() as session:
+                try:
+                    await charity_crud.get_all_objects(session, limit=READ_LIMIT)
+                    counters['reads'] += 1
+                except OperationalError:
+                    counters['errors'] += 1
+
+    await asyncio.gather(
+        *(write() for _ in range(writers)),
+        *(read() for _ in range(readers)),
+    )
+    await engine.dispose()
+    return {
+        'writes_per_s': round(counters['writes'] / seconds, 1),
+        'reads_per_s': round(counters['reads'] / seconds, 1),
+        'errors': counters['errors'],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('--projects', type=int, default=1000)
+    parser.add_argument('--donations', type=int, default=10000)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--writers', type=int, default=2)
+    parser.add_argument('--readers', type=int, default=8)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as directory:
+        for name, profile in PROFILES.items():
+            path = Path(directory) / f'{name}.db'
+            generate(f'sqlite:///{path}', args.projects, args.donations, users=1)
+            config = Settings(
+                database_url=f'sqlite+aiosqlite:///{path}', **profile
+            )
+            print(name, asyncio.run(workload(
+                config, args.seconds, args.writers, args.readers
+            )))
+
+
+if __name__ == '__main__':
+    main()
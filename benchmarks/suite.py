@@ -0,0 +1,281 @@
+"""
+Бенчмарк распределения, приема пожертвований и списков на разных объемах.
+
+Для каждого размера создается отдельная база SQLite с N проектами и
+M пожертвованиями в согласованном состоянии FIFO. Приложение работает
+в том же процессе, через TestClient. Для каждой операции записываются
+p50/p99 задержки и среднее число запросов к БД.
+
+    python -m benchmarks.suite                     # сравнить с baseline.json
+    python -m benchmarks.suite --update-baseline   # перезаписать baseline.json
+
+Если p50 или p99 хуже базовых больше чем на --threshold, или запросов
+стало больше, команда завершается с кодом 1. Замеров по умолчанию 200:
+на 20 замерах p99 — это просто самый медленный из них, и он слишком
+шумный для сравнения.
+"""
+import argparse
+import asyncio
+import gc
+import json
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+from app.core.db import get_async_session
+from app.core.user import current_superuser, current_user
+from app.main import app
+from app.models import CharityProject, Donation, User
+from app.crud.charity_project import charity_crud
+from app.crud.donation import donation_crud
+from app.services.investing import allocate, get_not_full_invested
+from app.services.warm_up import warm_up
+from benchmarks.dataset import generate
+
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+BENCHMARKS_DIR = Path(__file__).resolve().parent
+DEFAULT_BASELINE = BENCHMARKS_DIR / 'baseline.json'
+DEFAULT_SIZES = ['100x1000', '1000x10000']
+
+superuser = User(id=1, is_active=True, is_verified=True, is_superuser=True)
+
+
+class QueryCounter:
+    """
+    Считает запросы, отправленные движком в БД.
+    """
+
+    def __init__(self, engine):
+        self.count = 0
+        event.listen(engine.sync_engine, 'before_cursor_execute', self.increment)
+
+    def increment(self, *args):
+        self.count += 1
+
+
+@contextmanager
+def gc_paused():
+    """
+    Отключает сборщик мусора на время замеров, как timeit: иначе p99
+    определяют паузы сборки, которые попадают в случайные замеры.
+    """
+    gc.collect()
+    gc.disable()
+    try:
+        yield
+    finally:
+        gc.enable()
+
+
+def percentiles(samples: List[float], queries: List[int]) -> Dict[str, float]:
+    samples = sorted(samples)
+    return {
+        'p50_ms': round(samples[len(samples) // 2] * 1000, 3),
+        'p99_ms': round(samples[min(len(samples) - 1, int(len(samples) * 0.99))] * 1000, 3),
+        'queries': round(sum(queries) / len(queries), 2),
+    }
+
+
+def measure(counter: QueryCounter, repeat: int, operation: Callable) -> Dict[str, float]:
+    samples, queries = [], []
+    with gc_paused():
+        for number in range(repeat):
+            before = counter.count
+            started = time.perf_counter()
+            operation(number)
+            samples.append(time.perf_counter() - started)
+            queries.append(counter.count - before)
+    return percentiles(samples, queries)
+
+
+async def measure_allocation(engine, counter: QueryCounter, repeat: int) -> Dict[str, float]:
+    """
+    Распределение нового проекта по открытым пожертвованиям без commit:
+    после каждого замера транзакция откатывается, и состояние не меняется.
+    """
+    session_factory = sessionmaker(engine, class_=AsyncSession)
+    samples, queries = [], []
+    with gc_paused():
+        for number in range(repeat):
+            async with session_factory() as session:
+                project = CharityProject(
+                    name=f'allocation {number}',
+                    description='benchmark',
+                    full_amount=5000,
+                    invested_amount=0,
+                    fully_invested=False,
+                )
+                session.add(project)
+                await session.flush()
+                before = counter.count
+                started = time.perf_counter()
+                await allocate(project, Donation, session)
+                samples.append(time.perf_counter() - started)
+                queries.append(counter.count - before)
+                await session.rollback()
+    return percentiles(samples, queries)
+
+
+async def first_requests(path: Path, warm: bool) -> Tuple[float, int]:
+    """
+    Время первых частых запросов на только что созданном движке:
+    без прогрева или после warm_up, как при старте приложения.
+    """
+    engine = create_async_engine(f'sqlite+aiosqlite:///{path}')
+    if warm:
+        await warm_up(engine)
+    session_factory = sessionmaker(engine, class_=AsyncSession)
+    counter = QueryCounter(engine)
+    started = time.perf_counter()
+    async with session_factory() as session:
+        await charity_crud.get_object(1, session)
+        await charity_crud.get_charity_id_by_name('Проект 1', session)
+        await get_not_full_invested(CharityProject, session, limit=100)
+        await donation_crud.get_my_donation(session, superuser, limit=100)
+    elapsed = time.perf_counter() - started
+    await engine.dispose()
+    return elapsed, counter.count
+
+
+def measure_cold_start(path: Path, repeat: int, warm: bool) -> Dict[str, float]:
+    with gc_paused():
+        samples, queries = zip(*(
+            asyncio.run(first_requests(path, warm)) for _ in range(repeat)
+        ))
+    return percentiles(list(samples), list(queries))
+
+
+@contextmanager
+def app_client(engine):
+    session_factory = sessionmaker(engine, class_=AsyncSession)
+
+    async def override_db():
+        async with session_factory() as session:
+            yield session
+
+    app.dependency_overrides = {
+        get_async_session: override_db,
+        current_user: lambda: superuser,
+        current_superuser: lambda: superuser,
+    }
+    try:
+        with TestClient(app) as client:
+            yield client
+    finally:
+        app.dependency_overrides = {}
+
+
+def run_size(size: str, repeat: int) -> Dict[str, Dict[str, float]]:
+    projects, donations = (int(part) for part in size.split('x'))
+    with tempfile.TemporaryDirectory() as directory:
+        path = Path(directory) / 'bench.db'
+        generate(f'sqlite:///{path}', projects, donations, users=1)
+        results = {
+            'cold_start': measure_cold_start(path, repeat, warm=False),
+            'cold_start_warmed': measure_cold_start(path, repeat, warm=True),
+        }
+        engine = create_async_engine(f'sqlite+aiosqlite:///{path}')
+        counter = QueryCounter(engine)
+        results.update({
+            'allocation': asyncio.run(
+                measure_allocation(engine, counter, repeat)
+            ),
+        })
+        with app_client(engine) as client:
+            results['donation_intake'] = measure(
+                counter, repeat,
+                lambda number: client.post(
+                    '/donation/', json={'full_amount': 100 + number}
+                ),
+            )
+            results['list_charity_projects'] = measure(
+                counter, repeat,
+                lambda number: client.get('/charity_project/'),
+            )
+            results['list_donations'] = measure(
+                counter, max(3, repeat // 10),
+                lambda number: client.get('/donation/'),
+            )
+            results['list_donations_fields'] = measure(
+                counter, max(3, repeat // 10),
+                lambda number: client.get(
+                    '/donation/', params={'fields': 'id,full_amount'}
+                ),
+            )
+            results['list_donations_page'] = measure(
+                counter, repeat,
+                lambda number: client.get('/donation/', params={'limit': 100}),
+            )
+        asyncio.run(engine.dispose())
+    return results
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> List[str]:
+    regressions = []
+    for size, operations in results.items():
+        for operation, metrics in operations.items():
+            base = baseline.get(size, {}).get(operation)
+            if base is None:
+                continue
+            for key in ('p50_ms', 'p99_ms'):
+                if metrics[key] > base[key] * (1 + threshold):
+                    regressions.append(
+                        f'{size} {operation} {key}: {metrics[key]} > {base[key]}'
+                    )
+            if metrics['queries'] > base['queries']:
+                regressions.append(
+                    f'{size} {operation} queries: {metrics["queries"]} > {base["queries"]}'
+                )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        '--sizes', nargs='+', default=DEFAULT_SIZES,
+        help='размеры в виде <проекты>x<пожертвования>'
+    )
+    parser.add_argument('--repeat', type=int, default=200)
+    parser.add_argument('--baseline', type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument(
+        '--threshold', type=float, default=0.25,
+        help='допустимое ухудшение задержек, доля от базовых'
+    )
+    parser.add_argument('--update-baseline', action='store_true')
+    args = parser.parse_args()
+
+    results = {size: run_size(size, args.repeat) for size in args.sizes}
+    print(f'{"size":>12} {"operation":>22} {"p50, ms":>10} {"p99, ms":>10} {"queries":>8}')
+    for size, operations in results.items():
+        for operation, metrics in operations.items():
+            print(
+                f'{size:>12} {operation:>22} {metrics["p50_ms"]:>10} '
+                f'{metrics["p99_ms"]:>10} {metrics["queries"]:>8}'
+            )
+
+    if args.update_baseline:
+        args.baseline.write_text(json.dumps(results, indent=2, sort_keys=True))
+        print(f'Базовые значения записаны в {args.baseline}')
+        return
+    if not args.baseline.exists():
+        print(f'Нет файла {args.baseline}, сравнивать не с чем')
+        return
+    regressions = compare(
+        results, json.loads(args.baseline.read_text()), args.threshold
+    )
+    for regression in regressions:
+        print(f'РЕГРЕССИЯ: {regression}')
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -31,6 +31,38 @@ except (NameError, ImportError):
         'Проверьте и поправьте: они должны быть доступны в модуле `app.code.user`',
     )
 
+try:
+    from app.services.allocation_pool import allocation_pool
+except (NameError, ImportError):
+    raise AssertionError(
+        'Не обнаружен пул открытых объектов `allocation_pool`. '
+        'Проверьте и поправьте: он должен быть доступен в модуле `app.services.allocation_pool`.',
+    )
+
+try:
+    from app.services.funding import funding_index
+except (NameError, ImportError):
+    raise AssertionError(
+        'Не обнаружен индекс накопленных сумм `funding_index`. '
+        'Проверьте и поправьте: он должен быть доступен в модуле `app.services.funding`.',
+    )
+
+try:
+    from app.services.response_cache import response_cache
+except (NameError, ImportError):
+    raise AssertionError(
+        'Не обнаружен кеш ответов `response_cache`. '
+        'Проверьте и поправьте: он должен быть доступен в модуле `app.services.response_cache`.',
+    )
+
+try:
+    from app.services.user_cache import user_cache
+except (NameError, ImportError):
+    raise AssertionError(
+        'Не обнаружен кеш пользователей `user_cache`. '
+        'Проверьте и поправьте: он должен быть доступен в модуле `app.services.user_cache`.',
+    )
+
 try:
     from app.schemas.user import UserCreate
 except (NameError, ImportError):
@@ -45,6 +77,7 @@ BASE_DIR = Path(__file__).resolve(strict=True).parent.parent
 pytest_plugins = [
     'fixtures.user',
     'fixtures.data',
+    'fixtures.lock',
 ]
 
 TEST_DB = BASE_DIR / 'test.db'
@@ -67,6 +100,10 @@ async def override_db():
 async def init_db():
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+    allocation_pool.invalidate()
+    funding_index.invalidate()
+    response_cache.clear()
+    user_cache.clear()
     yield
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.drop_all)
@@ -0,0 +1,12 @@
+import pytest
+
+from app.services import allocation_lock, allocation_worker, investing
+from app.services.allocation_lock import FileAllocationLock
+
+
+@pytest.fixture
+def file_lock(tmp_path, monkeypatch):
+    lock = FileAllocationLock(tmp_path / 'allocation.lock')
+    for module in (allocation_lock, allocation_worker, investing):
+        monkeypatch.setattr(module, 'allocation_lock', lock)
+    return lock
@@ -0,0 +1,117 @@
+import pytest
+from conftest import (TEST_DB, TestingSessionLocal, allocation_pool,
+                      funding_index, response_cache, user_cache)
+from sqlalchemy import create_engine, select
+
+from app.models import AllocationState, CharityProject, User
+from app.services.allocation_lock import (AllocationLock, FileAllocationLock,
+                                          RowAllocationLock)
+from benchmarks.concurrency import stress
+
+
+async def test_file_lock_invalidates_pool_after_other_process(tmp_path):
+    """Номер распределения в файле изменил другой процесс. Пул должен сброситься, а после своего распределения — сохраниться."""
+    lock = FileAllocationLock(tmp_path / 'allocation.lock')
+    async with TestingSessionLocal() as session:
+        async with lock.hold(session):
+            await allocation_pool.warm(session)
+        async with lock.hold(session):
+            assert allocation_pool.warmed, test_file_lock_invalidates_pool_after_other_process.__doc__
+        (tmp_path / 'allocation.lock').write_text('10')
+        async with lock.hold(session):
+            assert not allocation_pool.warmed, test_file_lock_invalidates_pool_after_other_process.__doc__
+    assert (tmp_path / 'allocation.lock').read_text() == '11', test_file_lock_invalidates_pool_after_other_process.__doc__
+
+
+def test_allocation_lock_is_abstract():
+    with pytest.raises(TypeError):
+        AllocationLock()
+
+
+async def test_sync_drops_caches_after_other_process(tmp_path):
+    """Другой процесс записал данные под блокировкой. При сверке перед запросом все кеши процесса должны сброситься."""
+    lock = FileAllocationLock(tmp_path / 'allocation.lock')
+    other = FileAllocationLock(tmp_path / 'allocation.lock')
+    async with TestingSessionLocal() as session:
+        async with lock.hold(session):
+            await allocation_pool.warm(session)
+            await funding_index.build(session)
+        user_cache.set(User(id=1, email='dead@pool.com', hashed_password='x'))
+        etag = response_cache.etag(CharityProject)
+        await lock.sync(session)
+        assert allocation_pool.warmed and len(user_cache.entries) == 1, test_sync_drops_caches_after_other_process.__doc__
+        async with other.hold(session):
+            pass
+        await lock.sync(session)
+    assert not allocation_pool.warmed, test_sync_drops_caches_after_other_process.__doc__
+    assert not funding_index.built, test_sync_drops_caches_after_other_process.__doc__
+    assert not user_cache.entries, test_sync_drops_caches_after_other_process.__doc__
+    assert response_cache.etag(CharityProject) != etag, test_sync_drops_caches_after_other_process.__doc__
+
+
+async def test_sync_reads_generation_once_per_interval(tmp_path):
+    """Сверка перед запросом должна читать номер не чаще раза в sync_interval: до конца интервала кеши остаются, после — сбрасываются."""
+    lock = FileAllocationLock(tmp_path / 'allocation.lock', sync_interval=60)
+    other = FileAllocationLock(tmp_path / 'allocation.lock')
+    async with TestingSessionLocal() as session:
+        await lock.sync(session)
+        await allocation_pool.warm(session)
+        async with other.hold(session):
+            pass
+        await allocation_pool.warm(session)
+        await lock.sync(session)
+        assert allocation_pool.warmed, test_sync_reads_generation_once_per_interval.__doc__
+        lock.synced_at -= 60
+        await lock.sync(session)
+    assert not allocation_pool.warmed, test_sync_reads_generation_once_per_interval.__doc__
+
+
+async def test_row_lock_counts_generation():
+    """Каждое распределение под блокировкой строки должно увеличивать номер распределения в той же транзакции."""
+    lock = RowAllocationLock()
+    for _ in range(2):
+        async with TestingSessionLocal() as session:
+            async with lock.hold(session):
+                await session.commit()
+    async with TestingSessionLocal() as session:
+        state = await session.get(AllocationState, 1)
+    assert state.generation == 2, test_row_lock_counts_generation.__doc__
+    assert lock.generation == 2, test_row_lock_counts_generation.__doc__
+
+
+def test_stress_file_lock_keeps_fifo(tmp_path):
+    """Три процесса создают проекты и пожертвования под файловой блокировкой. Итог должен совпасть с правилом FIFO."""
+    result = stress(
+        f'sqlite+aiosqlite:///{tmp_path / "stress.db"}', workers=3, count=30,
+        lock='file', lock_path=tmp_path / 'allocation.lock'
+    )
+    assert result['errors'] == 0, test_stress_file_lock_keeps_fifo.__doc__
+    assert result['mismatched'] == 0, test_stress_file_lock_keeps_fifo.__doc__
+
+
+def test_project_delete_moves_generation(file_lock, superuser_client):
+    """Удаление проекта должно идти под блокировкой распределения и увеличивать общий номер записи."""
+    project_id = superuser_client.post('/charity_project/', json={
+        'name': 'first', 'description': 'first', 'full_amount': 100,
+    }).json()['id']
+    generation = int(file_lock.path.read_text())
+    response = superuser_client.delete(f'/charity_project/{project_id}')
+    assert response.status_code == 200, test_project_delete_moves_generation.__doc__
+    assert int(file_lock.path.read_text()) == generation + 1, test_project_delete_moves_generation.__doc__
+
+
+def test_bump_sync_moves_generation(tmp_path):
+    """Сверка с --fix пишет мимо приложения. Синхронное увеличение номера должно менять и файл блокировки, и строку allocationstate."""
+    file_lock = FileAllocationLock(tmp_path / 'allocation.lock')
+    file_lock.bump_sync(None)
+    file_lock.bump_sync(None)
+    assert (tmp_path / 'allocation.lock').read_text() == '2', test_bump_sync_moves_generation.__doc__
+    engine = create_engine(f'sqlite:///{TEST_DB}')
+    with engine.begin() as connection:
+        RowAllocationLock().bump_sync(connection)
+    with engine.connect() as connection:
+        generation = connection.execute(
+            select(AllocationState.generation)
+        ).scalar_one()
+    engine.dispose()
+    assert generation == 1, test_bump_sync_moves_generation.__doc__
@@ -0,0 +1,159 @@
+import sqlite3
+from pathlib import Path
+
+from conftest import TEST_DB, allocation_pool
+
+from app.models import CharityProject, Donation
+from app.services.allocation_lock import FileAllocationLock
+from app.services.investing import allocation_stats
+
+
+def write_as_other_process(lock: FileAllocationLock, *statements: str):
+    """
+    Пишет в БД мимо этого процесса и увеличивает общий номер записи,
+    как это делает распределение в другом процессе.
+    """
+    with sqlite3.connect(TEST_DB) as connection:
+        for statement in statements:
+            connection.execute(statement)
+    path = Path(lock.path)
+    path.write_text(str(int(path.read_text() or 0) + 1))
+
+
+def test_pool_follows_allocation(user_client, charity_project_little_invested, charity_project_nunchaku):
+    """Пожертвование закрывает первый проект. В пуле должен остаться только второй проект, открытых пожертвований быть не должно."""
+    user_client.post('/donation/', json={'full_amount': 999900})
+    projects = allocation_pool.queues[CharityProject]
+    assert [item.id for item in projects] == [2], test_pool_follows_allocation.__doc__
+    assert projects.free_total == 5000000, test_pool_follows_allocation.__doc__
+    assert len(allocation_pool.queues[Donation]) == 0, test_pool_follows_allocation.__doc__
+
+
+def test_pool_keeps_open_donation(user_client, charity_project):
+    """Пожертвование больше проекта. Остаток пожертвования должен ждать в пуле."""
+    user_client.post('/donation/', json={'full_amount': 1000500})
+    donations = allocation_pool.queues[Donation]
+    assert len(allocation_pool.queues[CharityProject]) == 0, test_pool_keeps_open_donation.__doc__
+    assert [(item.id, item.free_amount) for item in donations] == [(1, 500)], test_pool_keeps_open_donation.__doc__
+
+
+def test_pool_falls_back_on_drift(user_client, charity_project, charity_project_nunchaku):
+    """Первый проект закрыт в обход ORM. Пул должен заметить расхождение, и пожертвование должно уйти во второй проект."""
+    user_client.post('/donation/', json={'full_amount': 100})
+    with sqlite3.connect(TEST_DB) as connection:
+        connection.execute(
+            'UPDATE charityproject '
+            'SET invested_amount = full_amount, fully_invested = 1 WHERE id = 1'
+        )
+    user_client.post('/donation/', json={'full_amount': 200})
+    with sqlite3.connect(TEST_DB) as connection:
+        invested_amount, = connection.execute(
+            'SELECT invested_amount FROM charityproject WHERE id = 2'
+        ).fetchone()
+    assert invested_amount == 200, test_pool_falls_back_on_drift.__doc__
+    assert [item.id for item in allocation_pool.queues[CharityProject]] == [2], test_pool_falls_back_on_drift.__doc__
+
+
+def test_allocation_skips_scan_without_free_money(superuser_client, donation):
+    """Деньги пожертвований кончились на втором проекте. Третий проект не должен читать пожертвования, а счетчики должны показать недостающие суммы проектов."""
+    for name in ('first', 'second'):
+        superuser_client.post('/charity_project/', json={
+            'name': name, 'description': name, 'full_amount': 60,
+        })
+    skipped = allocation_stats.scans_skipped
+    superuser_client.post('/charity_project/', json={
+        'name': 'third', 'description': 'third', 'full_amount': 60,
+    })
+    assert allocation_stats.scans_skipped == skipped + 1, test_allocation_skips_scan_without_free_money.__doc__
+    assert allocation_stats.last.rows_fetched == 0, test_allocation_skips_scan_without_free_money.__doc__
+    response = superuser_client.get('/monitoring/allocation')
+    assert response.status_code == 200, test_allocation_skips_scan_without_free_money.__doc__
+    data = response.json()
+    assert data['donation'] == {'open_count': 0, 'free_amount': 0}, test_allocation_skips_scan_without_free_money.__doc__
+    assert data['charityproject'] == {'open_count': 2, 'free_amount': 80}, test_allocation_skips_scan_without_free_money.__doc__
+
+
+def test_monitoring_usual_user(user_client):
+    response = user_client.get('/monitoring/allocation')
+    assert response.status_code == 401, (
+        'Мониторинг распределения должен быть доступен только суперпользователю.'
+    )
+
+
+def test_pool_notices_rows_added_by_other_process(file_lock, user_client, charity_project):
+    """Другой процесс добавил открытый проект и увеличил номер записи. Пул должен прогреться заново, и пожертвование должно дойти до нового проекта."""
+    user_client.post('/donation/', json={'full_amount': 999990})
+    write_as_other_process(
+        file_lock,
+        'INSERT INTO charityproject (name, description, full_amount, invested_amount, fully_invested, create_date) '
+        "VALUES ('late', 'late', 50, 0, 0, '2010-10-11 00:00:00')",
+        'UPDATE allocationstate SET charityproject_open_count = charityproject_open_count + 1, '
+        'charityproject_free_amount = charityproject_free_amount + 50',
+    )
+    user_client.post('/donation/', json={'full_amount': 30})
+    with sqlite3.connect(TEST_DB) as connection:
+        invested_amount, = connection.execute(
+            "SELECT invested_amount FROM charityproject WHERE name = 'late'"
+        ).fetchone()
+    assert invested_amount == 20, test_pool_notices_rows_added_by_other_process.__doc__
+    assert [item.id for item in allocation_pool.queues[CharityProject]] == [2], test_pool_notices_rows_added_by_other_process.__doc__
+
+
+def test_skip_sees_free_money_of_other_process(file_lock, superuser_client, donation):
+    """Другой процесс добавил открытое пожертвование, когда свободных денег по счетчикам не было. Новый проект должен его забрать, а не пропустить чтение."""
+    superuser_client.post('/charity_project/', json={
+        'name': 'first', 'description': 'first', 'full_amount': 100,
+    })
+    write_as_other_process(
+        file_lock,
+        'INSERT INTO donation (full_amount, invested_amount, fully_invested, create_date) '
+        "VALUES (50, 0, 0, '2011-11-12 00:00:00')",
+        'UPDATE allocationstate SET donation_open_count = donation_open_count + 1, '
+        'donation_free_amount = donation_free_amount + 50',
+    )
+    skipped = allocation_stats.scans_skipped
+    response = superuser_client.post('/charity_project/', json={
+        'name': 'second', 'description': 'second', 'full_amount': 30,
+    })
+    assert response.json()['fully_invested'], test_skip_sees_free_money_of_other_process.__doc__
+    assert allocation_stats.scans_skipped == skipped, test_skip_sees_free_money_of_other_process.__doc__
+
+
+def test_cold_pool_skips_scan_by_totals_row(superuser_client, donation):
+    """Пул не прогрет, а свободные деньги пожертвований кончились. Проект должен пропустить чтение по строке итогов, не прогревая пул."""
+    superuser_client.post('/charity_project/', json={
+        'name': 'first', 'description': 'first', 'full_amount': 100,
+    })
+    allocation_pool.invalidate()
+    skipped = allocation_stats.scans_skipped
+    superuser_client.post('/charity_project/', json={
+        'name': 'second', 'description': 'second', 'full_amount': 30,
+    })
+    assert allocation_stats.scans_skipped == skipped + 1, test_cold_pool_skips_scan_by_totals_row.__doc__
+    assert not allocation_pool.warmed, test_cold_pool_skips_scan_by_totals_row.__doc__
+
+
+def test_totals_row_follows_writes(superuser_client, charity_project, donation):
+    """Итоги в allocationstate должны совпадать с открытыми строками после создания, изменения и удаления объектов."""
+    first_id, second_id = (
+        superuser_client.post('/charity_project/', json={
+            'name': name, 'description': name, 'full_amount': 500,
+        }).json()['id']
+        for name in ('first', 'second')
+    )
+    superuser_client.patch(f'/charity_project/{first_id}', json={'full_amount': 600})
+    assert superuser_client.delete(f'/charity_project/{second_id}').status_code == 200, test_totals_row_follows_writes.__doc__
+    with sqlite3.connect(TEST_DB) as connection:
+        totals = connection.execute(
+            'SELECT charityproject_open_count, charityproject_free_amount, '
+            'donation_open_count, donation_free_amount FROM allocationstate'
+        ).fetchone()
+        expected = tuple(
+            value
+            for table in ('charityproject', 'donation')
+            for value in connection.execute(
+                'SELECT count(*), coalesce(sum(full_amount - invested_amount), 0) '
+                f'FROM {table} WHERE fully_invested = 0'
+            ).fetchone()
+        )
+    assert totals == expected == (2, 1000500, 0, 0), test_totals_row_follows_writes.__doc__
@@ -0,0 +1,118 @@
+import asyncio
+from datetime import datetime
+
+from conftest import TestingSessionLocal, allocation_pool
+from fixtures.user import user
+
+from app.crud.charity_project import charity_crud
+from app.crud.donation import donation_crud
+from app.models import CharityProject, Donation
+from app.schemas.charity_project import CharityDB, CharityUpdate
+from app.schemas.donation import DonationCreate, DonationDB, DonationUser
+from app.services.allocation_worker import AllocationWorker
+
+
+async def test_worker_allocates_concurrent_donations_in_one_batch(mixer):
+    """Пять одновременных пожертвований. Воркер должен записать их одной пачкой и распределить по порядку."""
+    for name in ('first', 'second'):
+        mixer.blend(
+            'app.models.charity_project.CharityProject',
+            name=name,
+            full_amount=150,
+            create_date=datetime(2010, 10, 10),
+        )
+    worker = AllocationWorker(TestingSessionLocal, window=0.05)
+    await worker.start()
+    try:
+        responses = await asyncio.gather(*(
+            worker.submit(
+                donation_crud, DonationCreate(full_amount=100),
+                CharityProject, DonationDB, user
+            )
+            for _ in range(5)
+        ))
+    finally:
+        await worker.stop()
+    assert worker.batches == 1, test_worker_allocates_concurrent_donations_in_one_batch.__doc__
+    assert [
+        (response.id, response.invested_amount) for response in responses
+    ] == [(1, 100), (2, 100), (3, 100), (4, 0), (5, 0)], test_worker_allocates_concurrent_donations_in_one_batch.__doc__
+    assert [item.id for item in allocation_pool.queues[Donation]] == [4, 5], test_worker_allocates_concurrent_donations_in_one_batch.__doc__
+
+
+async def test_worker_retries_failed_batch_per_job():
+    """Одна задача пачки падает. Остальные задачи должны записаться, а ошибка — вернуться только своему обработчику."""
+    worker = AllocationWorker(TestingSessionLocal, window=0.05)
+    await worker.start()
+    try:
+        responses = await asyncio.gather(
+            worker.submit(
+                donation_crud, DonationCreate(full_amount=100),
+                CharityProject, DonationUser, user
+            ),
+            worker.submit(
+                donation_crud, DonationCreate(full_amount=100),
+                CharityProject, None, user
+            ),
+            return_exceptions=True,
+        )
+    finally:
+        await worker.stop()
+    assert isinstance(responses[0], DonationUser), test_worker_retries_failed_batch_per_job.__doc__
+    assert isinstance(responses[1], AttributeError), test_worker_retries_failed_batch_per_job.__doc__
+
+
+async def test_worker_writes_donation_batch(mixer):
+    """Пачка пожертвований при запущенном воркере. Пачка должна записаться воркером и покрыть проект по порядку."""
+    mixer.blend(
+        'app.models.charity_project.CharityProject',
+        name='first',
+        full_amount=150,
+        create_date=datetime(2010, 10, 10),
+    )
+    worker = AllocationWorker(TestingSessionLocal, window=0)
+    await worker.start()
+    try:
+        async with TestingSessionLocal() as session:
+            responses = await worker.create_batch_and_invest(
+                donation_crud,
+                [DonationCreate(full_amount=100), DonationCreate(full_amount=100)],
+                CharityProject, DonationDB, session, user
+            )
+    finally:
+        await worker.stop()
+    assert worker.batches == 1, test_worker_writes_donation_batch.__doc__
+    assert [
+        (response.id, response.invested_amount) for response in responses
+    ] == [(1, 100), (2, 50)], test_worker_writes_donation_batch.__doc__
+
+
+async def test_worker_updates_project_full_amount(mixer):
+    """Сумма проекта увеличена при запущенном воркере. Проект должен в воркере забрать разницу из открытого пожертвования."""
+    project = mixer.blend(
+        'app.models.charity_project.CharityProject',
+        name='first',
+        full_amount=100,
+        invested_amount=100,
+        fully_invested=False,
+        create_date=datetime(2010, 10, 10),
+    )
+    mixer.blend(
+        'app.models.donation.Donation',
+        full_amount=300,
+        invested_amount=100,
+        create_date=datetime(2010, 10, 10),
+    )
+    worker = AllocationWorker(TestingSessionLocal, window=0)
+    await worker.start()
+    try:
+        async with TestingSessionLocal() as session:
+            db_obj = await charity_crud.get_object(project.id, session)
+            response = await worker.update_and_invest(
+                charity_crud, db_obj, CharityUpdate(full_amount=250),
+                Donation, CharityDB, session
+            )
+    finally:
+        await worker.stop()
+    assert worker.batches == 1, test_worker_updates_project_full_amount.__doc__
+    assert (response.invested_amount, response.fully_invested) == (250, True), test_worker_updates_project_full_amount.__doc__
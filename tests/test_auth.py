@@ -1,3 +1,9 @@
+import sqlite3
+
+from conftest import TEST_DB, engine, user_cache
+
+from app.services.password_pool import PooledPasswordHelper, password_pool
+from sqlalchemy import event
 
 
 def test_register(test_client):
@@ -40,3 +46,123 @@ def test_register_invalid_pass(user_client):
             'reason': 'Password should be at least 3 characters',
         },
     }, 'При некорректной регистрации пользователя тело ответа API отличается от ожидаемого.'
+
+
+def test_current_user_is_cached_until_update(test_client):
+    test_client.post('/auth/register', json={
+        'email': 'dead@pool.com',
+        'password': 'chimichangas4life',
+    })
+    token = test_client.post('/auth/jwt/login', data={
+        'username': 'dead@pool.com',
+        'password': 'chimichangas4life',
+    }).json()['access_token']
+    headers = {'Authorization': f'Bearer {token}'}
+    for _ in range(3):
+        assert test_client.get('/users/me', headers=headers).status_code == 200
+    assert (user_cache.misses, user_cache.hits) == (1, 2), (
+        'Пользователь должен читаться из БД один раз, а дальше браться из кеша.'
+    )
+    response = test_client.patch('/users/me', headers=headers, json={'email': 'wade@pool.com'})
+    assert response.status_code == 200, (
+        'Пользователь из кеша должен обновляться через `/users/me`.'
+    )
+    assert test_client.get('/users/me', headers=headers).json()['email'] == 'wade@pool.com', (
+        'После обновления пользователь должен удаляться из кеша.'
+    )
+    assert user_cache.misses == 2, (
+        'После обновления пользователь должен заново читаться из БД.'
+    )
+
+
+def test_deleted_user_drops_out_of_cache(test_client):
+    tokens = {}
+    for email in ('dead@pool.com', 'wade@pool.com'):
+        test_client.post('/auth/register', json={
+            'email': email,
+            'password': 'chimichangas4life',
+        })
+        tokens[email] = {'Authorization': 'Bearer ' + test_client.post('/auth/jwt/login', data={
+            'username': email,
+            'password': 'chimichangas4life',
+        }).json()['access_token']}
+    with sqlite3.connect(TEST_DB) as connection:
+        connection.execute(
+            "UPDATE user SET is_superuser = 1 WHERE email = 'dead@pool.com'"
+        )
+    user_id = test_client.get('/users/me', headers=tokens['wade@pool.com']).json()['id']
+    response = test_client.delete(f'/users/{user_id}', headers=tokens['dead@pool.com'])
+    assert response.status_code == 204, (
+        'Суперпользователь должен удалять пользователя через `/users/{id}`.'
+    )
+    assert test_client.get('/users/me', headers=tokens['wade@pool.com']).status_code == 401, (
+        'Удаленный пользователь не должен проходить авторизацию из кеша.'
+    )
+
+
+def test_passwords_are_hashed_in_thread_pool(test_client):
+    password_pool.configure(2)
+    test_client.post('/auth/register', json={
+        'email': 'dead@pool.com',
+        'password': 'chimichangas4life',
+    })
+    login = {'username': 'dead@pool.com', 'password': 'chimichangas4life'}
+    token = test_client.post('/auth/jwt/login', data=login).json()['access_token']
+    headers = {'Authorization': f'Bearer {token}'}
+    response = test_client.patch('/users/me', headers=headers, json={'password': 'maximum-effort'})
+    assert response.status_code == 200, (
+        'Пароль должен меняться через `/users/me`.'
+    )
+    assert test_client.post('/auth/jwt/login', data=login).status_code == 400, (
+        'После смены пароля старый пароль не должен подходить.'
+    )
+    login['password'] = 'maximum-effort'
+    assert test_client.post('/auth/jwt/login', data=login).status_code == 200, (
+        'После смены пароля должен подходить новый пароль.'
+    )
+    counters = password_pool.counters()
+    assert (counters['tasks'], counters['pending']) == (5, 0), (
+        'Регистрация, смена пароля и каждый вход должны считать хеш в пуле потоков.'
+    )
+
+
+def test_rejected_register_and_login_cost(test_client):
+    """Отклоненная регистрация не должна считать хеш, а вход должен читать пользователя одним запросом."""
+    doc = test_rejected_register_and_login_cost.__doc__
+    password_pool.configure(2)
+    test_client.post('/auth/register', json={
+        'email': 'dead@pool.com',
+        'password': 'chimichangas4life',
+    })
+    for password in ('$', 'dead@pool.com!', 'maximum-effort'):
+        response = test_client.post('/auth/register', json={
+            'email': 'dead@pool.com',
+            'password': password,
+        })
+        assert response.status_code == 400, doc
+    assert password_pool.counters()['tasks'] == 1, doc
+    queries = []
+
+    def record(conn, cursor, statement, *args):
+        queries.append(statement)
+
+    event.listen(engine.sync_engine, 'before_cursor_execute', record)
+    try:
+        response = test_client.post('/auth/jwt/login', data={
+            'username': 'dead@pool.com',
+            'password': 'chimichangas4life',
+        })
+    finally:
+        event.remove(engine.sync_engine, 'before_cursor_execute', record)
+    assert response.status_code == 200, doc
+    assert len([query for query in queries if 'FROM user' in query]) == 1, doc
+
+
+async def test_pooled_password_helper_hands_out_prepared_hash():
+    """Хеш, подготовленный в пуле, должен отдаваться синхронному вызову библиотеки один раз."""
+    helper = PooledPasswordHelper()
+    await helper.prepare_hash('maximum-effort')
+    prepared = helper.hashes['maximum-effort']
+    assert helper.hash('maximum-effort') == prepared, test_pooled_password_helper_hands_out_prepared_hash.__doc__
+    assert not helper.hashes, test_pooled_password_helper_hands_out_prepared_hash.__doc__
+    assert helper.verify_and_update('maximum-effort', prepared)[0], test_pooled_password_helper_hands_out_prepared_hash.__doc__
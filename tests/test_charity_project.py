@@ -621,3 +621,111 @@ def test_get_all_charity_project_not_auth_user(test_client, charity_project, cha
             'name': 'nunchaku'
         }
     ]
+
+
+def test_get_charity_project_funding(user_client, mixer):
+    for name, full_amount in (('first', 150), ('second', 100)):
+        mixer.blend(
+            'app.models.charity_project.CharityProject',
+            name=name,
+            full_amount=full_amount,
+            create_date=datetime(2010, 10, 10),
+        )
+    for _ in range(3):
+        user_client.post('/donation/', json={'full_amount': 100})
+    response = user_client.get('/charity_project/1/funding')
+    assert response.status_code == 200, (
+        'При GET-запросе к эндпоинту `/charity_project/{id}/funding` должен возвращаться статус-код 200.'
+    )
+    assert response.json() == [
+        {'donation_id': 1, 'amount': 100},
+        {'donation_id': 2, 'amount': 50},
+    ], 'Первый проект должен быть профинансирован первым пожертвованием и половиной второго.'
+    assert user_client.get('/charity_project/2/funding').json() == [
+        {'donation_id': 2, 'amount': 50},
+        {'donation_id': 3, 'amount': 50},
+    ], 'Второй проект должен быть профинансирован остатком второго пожертвования и половиной третьего.'
+    response = user_client.get('/charity_project/3/funding')
+    assert response.status_code == 404, (
+        'Для несуществующего проекта должен возвращаться статус-код 404.'
+    )
+
+
+def test_get_all_charity_project_etag(superuser_client, charity_project):
+    response = superuser_client.get('/charity_project/')
+    etag = response.headers.get('ETag')
+    assert etag, 'Список проектов должен возвращаться с заголовком `ETag`.'
+    response = superuser_client.get('/charity_project/', headers={'If-None-Match': etag})
+    assert response.status_code == 304, (
+        'При совпадении `If-None-Match` с текущим `ETag` должен возвращаться статус-код 304.'
+    )
+    superuser_client.patch('/charity_project/1', json={'name': 'renamed'})
+    response = superuser_client.get('/charity_project/', headers={'If-None-Match': etag})
+    assert response.status_code == 200, (
+        'После изменения проекта старый `ETag` не должен подходить.'
+    )
+    assert response.json()[0]['name'] == 'renamed', (
+        'После изменения проекта список проектов должен обновиться.'
+    )
+
+
+def test_get_all_charity_project_cache_after_donation(user_client, charity_project):
+    assert user_client.get('/charity_project/').json()[0]['invested_amount'] == 0
+    user_client.post('/donation/', json={'full_amount': 100})
+    assert user_client.get('/charity_project/').json()[0]['invested_amount'] == 100, (
+        'После распределения пожертвования список проектов должен обновиться.'
+    )
+
+
+def test_get_all_charity_project_fields(test_client, charity_project, charity_project_nunchaku):
+    response = test_client.get('/charity_project/', params={'fields': 'name,id'})
+    assert response.json() == [
+        {'name': 'chimichangas4life', 'id': 1},
+        {'name': 'nunchaku', 'id': 2},
+    ], 'В списке проектов должны быть только запрошенные поля.'
+    response = test_client.get(
+        '/charity_project/', params={'fields': 'name'}, headers={'Accept': 'application/x-ndjson'}
+    )
+    assert response.text.splitlines() == ['{"name": "chimichangas4life"}', '{"name": "nunchaku"}'], (
+        'Выбор полей должен работать и для потокового ответа.'
+    )
+
+
+def test_update_charity_project_full_amount_invests_difference(superuser_client, mixer):
+    mixer.blend(
+        'app.models.charity_project.CharityProject',
+        name='raised',
+        full_amount=200,
+        invested_amount=100,
+        create_date=datetime(2010, 10, 10),
+    )
+    mixer.blend(
+        'app.models.donation.Donation',
+        user_id=2,
+        full_amount=300,
+        invested_amount=100,
+        create_date=datetime(2010, 10, 11),
+    )
+    response = superuser_client.patch('/charity_project/1', json={'full_amount': 250})
+    assert response.status_code == 200, (
+        'При увеличении требуемой суммы должен возвращаться статус-код 200.'
+    )
+    data = response.json()
+    assert data['invested_amount'] == 250, (
+        'При увеличении требуемой суммы проект должен забрать разницу из открытых пожертвований.'
+    )
+    assert data['fully_invested'] and data['close_date'], (
+        'Проект, набравший новую требуемую сумму, должен закрыться.'
+    )
+    donation = superuser_client.get('/donation/').json()[0]
+    assert donation['invested_amount'] == 250 and not donation['fully_invested'], (
+        'Из пожертвования должна быть списана только разница требуемых сумм.'
+    )
+
+
+def test_update_charity_project_full_amount_to_invested_closes(superuser_client, charity_project_little_invested):
+    response = superuser_client.patch('/charity_project/1', json={'full_amount': 100})
+    data = response.json()
+    assert data['fully_invested'] and data['close_date'], (
+        'Проект, требуемая сумма которого стала равна внесённой, должен закрыться.'
+    )
@@ -1,4 +1,17 @@
-from conftest import BASE_DIR
+import sqlite3
+from datetime import datetime
+
+import pytest
+from conftest import BASE_DIR, TEST_DB
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from app.core.db import build_engine
+from app.crud.donation import donation_crud
+from app.models import CharityProject, Donation, User
+from app.models.base import open_pool_index
+from app.services.investing import select_not_full_invested
+from app.services.warm_up import warm_up
 
 
 try:
@@ -50,3 +63,113 @@ def test_check_db_url():
             assert 'sqlite+aiosqlite' in attr_value['default'], (
                 'Укажите значение по умолчанию для подключения базы данных sqlite '
             )
+
+
+def query_plan(query) -> str:
+    compiled = query.compile(dialect=sqlite.dialect())
+    params = [compiled.params[name] for name in compiled.positiontup]
+    with sqlite3.connect(TEST_DB) as connection:
+        return ' '.join(
+            row[-1] for row in connection.execute(
+                f'EXPLAIN QUERY PLAN {compiled}', params
+            )
+        )
+
+
+@pytest.mark.parametrize('model', [CharityProject, Donation])
+@pytest.mark.parametrize('after', [None, (datetime(2010, 10, 10), 1)])
+def test_not_full_invested_uses_open_pool_index(model, after):
+    plan = query_plan(select_not_full_invested(model, after, 100))
+    index_name = f'ix_{model.__tablename__}_open_pool'
+    assert f'USING INDEX {index_name}' in plan, (
+        f'Запрос открытых объектов должен использовать индекс `{index_name}`. '
+        f'План запроса: {plan}'
+    )
+    assert 'TEMP B-TREE' not in plan, (
+        f'Запрос открытых объектов не должен сортировать строки. План запроса: {plan}'
+    )
+
+
+@pytest.mark.parametrize('dialect, columns', [
+    ('sqlite', ['create_date', 'id']),
+    ('postgresql', ['create_date', 'id']),
+    ('mysql', ['fully_invested', 'create_date', 'id']),
+])
+def test_open_pool_index_matches_migration(dialect, columns):
+    index = open_pool_index('donation', dialect)
+    assert [str(column) for column in index.expressions] == columns, (
+        'Индекс открытых объектов в модели должен совпадать с индексом из миграции '
+        f'для диалекта {dialect}.'
+    )
+    partial = any(key.endswith('_where') for key in index.dialect_kwargs)
+    assert partial == (dialect != 'mysql'), (
+        'Индекс открытых объектов должен быть частичным только на SQLite и PostgreSQL.'
+    )
+
+
+@pytest.mark.parametrize('after', [None, (datetime(2010, 10, 10), 1)])
+@pytest.mark.parametrize('date_from, date_to', [
+    (None, None),
+    (datetime(2010, 1, 1), datetime(2011, 1, 1)),
+])
+def test_my_donation_uses_user_index(after, date_from, date_to):
+    plan = query_plan(donation_crud.my_donation_query(
+        User(id=1), 100, after, date_from, date_to
+    ))
+    assert 'USING INDEX ix_donation_user_id_create_date' in plan, (
+        'Запрос пожертвований пользователя должен использовать индекс '
+        f'`ix_donation_user_id_create_date`. План запроса: {plan}'
+    )
+    assert 'TEMP B-TREE' not in plan, (
+        f'Запрос пожертвований пользователя не должен сортировать строки. План запроса: {plan}'
+    )
+
+
+async def test_engine_applies_sqlite_pragmas(tmp_path):
+    config = Settings(
+        database_url=f'sqlite+aiosqlite:///{tmp_path / "profile.db"}',
+        sqlite_journal_mode='WAL',
+        sqlite_synchronous='NORMAL',
+        sqlite_busy_timeout=1234,
+        engine_pool_size=2,
+    )
+    engine = build_engine(config)
+    async with engine.connect() as connection:
+        pragmas = [
+            (await connection.exec_driver_sql(f'PRAGMA {name}')).scalar()
+            for name in ('journal_mode', 'synchronous', 'busy_timeout')
+        ]
+    assert engine.pool.size() == 2, (
+        'Размер пула из настроек должен включать пул соединений SQLite.'
+    )
+    await engine.dispose()
+    assert pragmas == ['wal', 1, 1234], (
+        f'Прагмы SQLite из настроек должны выполняться на каждом соединении. Получено: {pragmas}'
+    )
+
+
+async def test_engine_accepts_max_overflow_alone(tmp_path):
+    config = Settings(
+        database_url=f'sqlite+aiosqlite:///{tmp_path / "overflow.db"}',
+        engine_max_overflow=10,
+    )
+    engine = build_engine(config)
+    assert isinstance(engine.pool, AsyncAdaptedQueuePool), (
+        'ENGINE_MAX_OVERFLOW без ENGINE_POOL_SIZE должен включать пул соединений SQLite.'
+    )
+    await engine.dispose()
+
+
+async def test_warm_up_fills_pool_and_statement_cache():
+    config = Settings(
+        database_url=f'sqlite+aiosqlite:///{TEST_DB}', engine_pool_size=3
+    )
+    engine = build_engine(config)
+    await warm_up(engine)
+    assert engine.pool.checkedin() == 3, (
+        'Прогрев должен открыть все соединения пула и вернуть их в пул.'
+    )
+    assert len(engine.sync_engine._compiled_cache) >= 8, (
+        'Прогрев должен скомпилировать частые запросы.'
+    )
+    await engine.dispose()
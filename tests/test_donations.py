@@ -1,6 +1,18 @@
+import csv
+import io
+import json
+import sqlite3
 from datetime import datetime
 
 import pytest
+from conftest import TEST_DB, engine, funding_index
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.core import db
+from app.core.config import settings
+from app.services.response_cache import response_cache
 
 
 @pytest.mark.parametrize('json, keys, expected_data', [
@@ -178,3 +190,307 @@ def test_create_donation_check_create_date(user_client):
     assert response_1.json()['create_date'] != response_2.json()['create_date'], (
         'При создании двух пожертвований с паузой (в 1 секунду, например) у них должны быть разные `create_date`'
     )
+
+
+def test_create_donation_batch(user_client, mixer):
+    for name, full_amount in (('first', 150), ('second', 100)):
+        mixer.blend(
+            'app.models.charity_project.CharityProject',
+            name=name,
+            full_amount=full_amount,
+            create_date=datetime(2010, 10, 10),
+        )
+    response = user_client.post('/donation/batch', json=[
+        {'full_amount': 100, 'comment': 'first'},
+        {'full_amount': 100},
+        {'full_amount': 100},
+    ])
+    assert response.status_code == 200, (
+        'При создании пачки пожертвований должен возвращаться статус-код 200.'
+    )
+    data = response.json()
+    assert [(item['id'], item['full_amount']) for item in data] == [(1, 100), (2, 100), (3, 100)], (
+        'Пачка пожертвований должна возвращаться в порядке запроса.'
+    )
+    assert data[0]['comment'] == 'first' and 'comment' not in data[1], (
+        'При создании пачки пожертвований тело ответа API отличается от ожидаемого.'
+    )
+    donations = user_client.get('/donation/').json()
+    assert [item['invested_amount'] for item in donations] == [100, 100, 50], (
+        'Пачка пожертвований должна покрывать открытые проекты по принципу FIFO.'
+    )
+    assert [item['fully_invested'] for item in donations] == [True, True, False], (
+        'Пачка пожертвований должна покрывать открытые проекты по принципу FIFO.'
+    )
+
+
+def test_create_donation_batch_closes_after_create(user_client, mixer):
+    mixer.blend(
+        'app.models.charity_project.CharityProject',
+        name='first',
+        full_amount=1000,
+        create_date=datetime(2010, 10, 10),
+    )
+    user_client.post('/donation/batch', json=[
+        {'full_amount': 100},
+        {'full_amount': 200},
+    ])
+    with sqlite3.connect(TEST_DB) as connection:
+        rows = connection.execute(
+            'SELECT create_date, close_date FROM donation ORDER BY id'
+        ).fetchall()
+    assert all(close_date >= create_date for create_date, close_date in rows), (
+        'Пожертвование из пачки, закрытое сразу, не может закрыться раньше, чем создано.'
+    )
+
+
+def test_create_donation_batch_inserts_with_executemany(user_client, mixer):
+    """Пачка должна записываться одним executemany INSERT, получать id из БД после уже существующих пожертвований и сразу попадать в индекс /funding и итоги открытых объектов."""
+    mixer.blend(
+        'app.models.charity_project.CharityProject',
+        name='first',
+        full_amount=250,
+        invested_amount=10,
+        create_date=datetime(2010, 10, 10),
+    )
+    mixer.blend(
+        'app.models.donation.Donation',
+        full_amount=10,
+        invested_amount=10,
+        fully_invested=True,
+        create_date=datetime(2010, 10, 9),
+    )
+    user_client.get('/charity_project/1/funding')
+    inserts = []
+
+    def record(connection, cursor, statement, parameters, context, executemany):
+        if statement.startswith('INSERT INTO donation'):
+            inserts.append(executemany)
+
+    event.listen(engine.sync_engine, 'before_cursor_execute', record)
+    try:
+        response = user_client.post('/donation/batch', json=[
+            {'full_amount': 100}, {'full_amount': 100}, {'full_amount': 100},
+        ])
+    finally:
+        event.remove(engine.sync_engine, 'before_cursor_execute', record)
+    doc = test_create_donation_batch_inserts_with_executemany.__doc__
+    assert inserts == [True], doc
+    assert [item['id'] for item in response.json()] == [2, 3, 4], doc
+    assert funding_index.built, doc
+    assert user_client.get('/charity_project/1/funding').json() == [
+        {'donation_id': 1, 'amount': 10},
+        {'donation_id': 2, 'amount': 100},
+        {'donation_id': 3, 'amount': 100},
+        {'donation_id': 4, 'amount': 40},
+    ], doc
+    with sqlite3.connect(TEST_DB) as connection:
+        totals = connection.execute(
+            'SELECT donation_open_count, donation_free_amount FROM allocationstate'
+        ).fetchone()
+    assert totals == (1, 60), doc
+
+
+@pytest.mark.parametrize('json', [
+    [],
+    [{'full_amount': 10}, {'full_amount': -1}],
+    {'full_amount': 10},
+])
+def test_create_donation_batch_invalid(user_client, json):
+    response = user_client.post('/donation/batch', json=json)
+    assert response.status_code == 422, (
+        'При некорректном теле POST-запроса к эндпоинту `/donation/batch` '
+        'должен вернуться статус-код 422.'
+    )
+
+
+def test_get_donations_paginated(user_client):
+    for full_amount in (10, 20, 30):
+        user_client.post('/donation/', json={'full_amount': full_amount})
+    for url in ('/donation/', '/donation/my'):
+        response = user_client.get(url, params={'limit': 2})
+        assert response.status_code == 200, (
+            f'При GET-запросе к `{url}` с параметром limit должен возвращаться статус-код 200.'
+        )
+        assert [item['full_amount'] for item in response.json()] == [10, 20], (
+            'Первая страница должна содержать первые `limit` пожертвований.'
+        )
+        cursor = response.headers.get('X-Next-Cursor')
+        assert cursor, (
+            'Если есть следующая страница, курсор должен передаваться в заголовке `X-Next-Cursor`.'
+        )
+        response = user_client.get(url, params={'limit': 2, 'cursor': cursor})
+        assert [item['full_amount'] for item in response.json()] == [30], (
+            'Следующая страница должна начинаться после строки из курсора.'
+        )
+        assert 'X-Next-Cursor' not in response.headers, (
+            'На последней странице заголовка `X-Next-Cursor` быть не должно.'
+        )
+    assert len(user_client.get('/donation/').json()) == 3, (
+        'Без параметров пагинации должен возвращаться весь список.'
+    )
+    response = user_client.get('/donation/', params={'cursor': 'not-a-cursor'})
+    assert response.status_code == 400, (
+        'При некорректном курсоре должен возвращаться статус-код 400.'
+    )
+
+
+def test_get_donations_stream(user_client, monkeypatch):
+    monkeypatch.setattr(settings, 'stream_chunk_size', 2)
+    for full_amount in (10, 20):
+        user_client.post('/donation/', json={'full_amount': full_amount, 'comment': 'a, b'})
+    user_client.post('/donation/', json={'full_amount': 30})
+    expected = user_client.get('/donation/my').json()
+    assert expected[-1]['comment'] is None, (
+        '`/donation/my` отдает пустые поля как null.'
+    )
+    response = user_client.get('/donation/my', headers={'Accept': 'application/x-ndjson'})
+    assert response.status_code == 200, (
+        'При запросе NDJSON должен возвращаться статус-код 200.'
+    )
+    assert response.headers['content-type'].startswith('application/x-ndjson'), (
+        'При запросе NDJSON ответ должен иметь тип `application/x-ndjson`.'
+    )
+    assert [json.loads(line) for line in response.text.splitlines()] == expected, (
+        'Строки NDJSON должны совпадать с элементами обычного JSON-списка.'
+    )
+    response = user_client.get('/donation/', headers={'Accept': 'text/csv'})
+    assert response.headers['content-type'].startswith('text/csv'), (
+        'При запросе CSV ответ должен иметь тип `text/csv`.'
+    )
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert [row['full_amount'] for row in rows] == ['10', '20', '30'], (
+        'CSV должен содержать все пожертвования по одной строке на каждое.'
+    )
+    assert rows[0]['comment'] == 'a, b' and rows[0]['close_date'] == '', (
+        'Значения CSV должны экранироваться, а пустые поля оставаться пустыми.'
+    )
+
+
+def test_get_user_donation_date_range(user_client, mixer):
+    for day in (datetime(2010, 10, 10), datetime(2011, 11, 11), datetime(2012, 12, 12)):
+        mixer.blend(
+            'app.models.donation.Donation',
+            user_id=2,
+            full_amount=10,
+            create_date=day,
+        )
+    mixer.blend(
+        'app.models.donation.Donation',
+        user_id=1,
+        full_amount=10,
+        create_date=datetime(2011, 11, 11),
+    )
+    response = user_client.get('/donation/my', params={
+        'date_from': '2011-01-01T00:00:00', 'date_to': '2012-12-12T00:00:00',
+    })
+    assert [item['create_date'] for item in response.json()] == [
+        '2011-11-11T00:00:00', '2012-12-12T00:00:00',
+    ], 'Пожертвования пользователя должны фильтроваться по периоду создания включительно.'
+    response = user_client.get('/donation/my', params={'limit': 1, 'date_from': '2011-01-01T00:00:00'})
+    response = user_client.get('/donation/my', params={
+        'limit': 1, 'date_from': '2011-01-01T00:00:00', 'cursor': response.headers['X-Next-Cursor'],
+    })
+    assert [item['create_date'] for item in response.json()] == ['2012-12-12T00:00:00'], (
+        'Курсор пожертвований пользователя должен продолжать список по дате создания.'
+    )
+
+
+def test_get_donations_fields(user_client):
+    for full_amount in (10, 20, 30):
+        user_client.post('/donation/', json={'full_amount': full_amount, 'comment': 'long text'})
+    response = user_client.get('/donation/', params={'fields': 'full_amount,invested_amount', 'limit': 2})
+    assert response.status_code == 200, (
+        'При GET-запросе к `/donation/` с параметром fields должен возвращаться статус-код 200.'
+    )
+    assert response.json() == [
+        {'full_amount': 10, 'invested_amount': 0},
+        {'full_amount': 20, 'invested_amount': 0},
+    ], 'В ответе должны быть только запрошенные поля.'
+    response = user_client.get('/donation/my', params={
+        'fields': 'id', 'limit': 2, 'cursor': response.headers['X-Next-Cursor'],
+    })
+    assert response.status_code == 400, (
+        'Курсор списка всех пожертвований не подходит для списка пожертвований пользователя.'
+    )
+    response = user_client.get('/donation/my', params={'fields': 'id,comment', 'limit': 2})
+    response = user_client.get('/donation/my', params={
+        'fields': 'id,comment', 'limit': 2, 'cursor': response.headers['X-Next-Cursor'],
+    })
+    assert response.json() == [{'id': 3, 'comment': 'long text'}], (
+        'Курсор должен работать и при выборе полей.'
+    )
+    response = user_client.get('/donation/', params={'fields': 'id,password'})
+    assert response.status_code == 400, (
+        'При запросе неизвестного поля должен возвращаться статус-код 400.'
+    )
+
+
+@pytest.mark.parametrize('url, params', [
+    ('/donation/', {}),
+    ('/donation/', {'fields': 'comment,close_date,id', 'limit': 2}),
+    ('/donation/my', {}),
+    ('/charity_project/', {}),
+])
+def test_orjson_responses_match_default(user_client, mixer, monkeypatch, url, params):
+    mixer.blend(
+        'app.models.charity_project.CharityProject',
+        name='Проект',
+        full_amount=150,
+        create_date=datetime(2010, 10, 10),
+    )
+    user_client.post('/donation/', json={'full_amount': 100, 'comment': 'Котикам ❤'})
+    user_client.post('/donation/', json={'full_amount': 100})
+    user_client.post('/donation/', json={'full_amount': 100})
+    monkeypatch.setattr(settings, 'orjson_responses', False)
+    expected = user_client.get(url, params=params)
+    monkeypatch.setattr(settings, 'orjson_responses', True)
+    response_cache.clear()
+    response = user_client.get(url, params=params)
+    assert response.content == expected.content, (
+        'Быстрый путь orjson должен давать тот же ответ, что и обычная сериализация.'
+    )
+    assert response.headers.get('X-Next-Cursor') == expected.headers.get('X-Next-Cursor')
+
+
+@pytest.fixture
+def read_replica(monkeypatch):
+    engine = create_async_engine(f'sqlite+aiosqlite:///file:{TEST_DB}?mode=ro&uri=true')
+    queries = []
+    event.listen(engine.sync_engine, 'before_cursor_execute', lambda *args: queries.append(args[2]))
+    monkeypatch.setattr(db, 'ReadSessionLocal', sessionmaker(
+        engine, class_=AsyncSession, info={db.READ_REPLICA_KEY: True}
+    ))
+    yield queries
+
+
+def test_get_my_donation_reads_replica_until_write(user_client, read_replica, donation):
+    response = user_client.get('/donation/my')
+    assert response.json()[0]['full_amount'] == 100, (
+        'Список пожертвований пользователя должен читаться с реплики.'
+    )
+    assert read_replica, 'Без недавней записи чтение должно идти на реплику.'
+    read_replica.clear()
+    response = user_client.post('/donation/', json={'full_amount': 50})
+    assert response.cookies.get(db.READ_PRIMARY_COOKIE), (
+        'После записи ответ должен выставлять cookie чтения с основной БД.'
+    )
+    assert len(user_client.get('/donation/my').json()) == 2, (
+        'После записи клиент должен видеть свое пожертвование.'
+    )
+    assert not read_replica, 'После записи чтение должно идти на основную БД.'
+    user_client.cookies.clear()
+    user_client.get('/donation/my', headers={db.READ_PRIMARY_HEADER: '1'})
+    assert not read_replica, 'Заголовок `X-Read-Primary` должен направлять чтение на основную БД.'
+
+
+def test_get_all_charity_project_from_replica_has_no_etag(test_client, read_replica, charity_project):
+    response = test_client.get('/charity_project/')
+    assert read_replica, 'Без недавней записи список проектов должен читаться с реплики.'
+    assert response.status_code == 200 and 'etag' not in response.headers, (
+        'Список проектов, прочитанный с реплики, не должен получать ETag основной БД.'
+    )
+    response = test_client.get('/charity_project/', headers={db.READ_PRIMARY_HEADER: '1'})
+    assert 'etag' in response.headers, (
+        'Список проектов с основной БД должен получать ETag.'
+    )
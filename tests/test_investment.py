@@ -1,5 +1,11 @@
+from datetime import datetime
+
 import pytest
 
+from app.core.config import settings
+from app.services.allocation_kernel import allocate, funding, prefix_sums
+from app.services.investing import allocation_stats
+
 
 def test_donation_exist_non_project(superuser_client, donation):
     response_donation = superuser_client.get('/donation/')
@@ -45,3 +51,70 @@ def test_donation_to_little_invest_project(user_client, charity_project_little_i
     assert charity_project_little_invested.invested_amount == 1000, test_donation_to_little_invest_project.__doc__
     assert not charity_project_nunchaku.fully_invested, test_donation_to_little_invest_project.__doc__
     assert charity_project_nunchaku.invested_amount == 0, test_donation_to_little_invest_project.__doc__
+
+
+def test_allocation_stops_when_exhausted(superuser_client, mixer, monkeypatch):
+    """Открыто 5 пожертвований по 10. Проект на 25 должен прочитать из БД только две страницы по 2 пожертвования и затронуть 3 из них."""
+    monkeypatch.setattr(settings, 'allocation_pool', False)
+    monkeypatch.setattr(settings, 'allocation_page_size', 2)
+    for day in range(1, 6):
+        mixer.blend(
+            'app.models.donation.Donation',
+            full_amount=10,
+            create_date=datetime(2011, 11, day),
+        )
+    response = superuser_client.post('/charity_project/', json={
+        'name': 'Cat food',
+        'description': 'Food for cats',
+        'full_amount': 25,
+    })
+    assert response.json()['fully_invested'], test_allocation_stops_when_exhausted.__doc__
+    assert allocation_stats.last.rows_fetched == 4, test_allocation_stops_when_exhausted.__doc__
+    assert allocation_stats.last.rows_touched == 3, test_allocation_stops_when_exhausted.__doc__
+
+
+@pytest.mark.parametrize('donations, projects', [
+    ([100, 100, 100], [150, 100]),
+    ([5, 5], [10, 3]),
+    ([7], [2, 2, 2]),
+])
+def test_allocation_kernel_matches_fifo(donations, projects):
+    """Ядро на накопленных суммах должно давать те же суммы, что и последовательный FIFO."""
+    donation_sums = prefix_sums(donations)
+    project_sums = prefix_sums(projects)
+    donation_left, project_left = list(donations), list(projects)
+    expected = []
+    donation, project = 0, 0
+    while donation < len(donations) and project < len(projects):
+        amount = min(donation_left[donation], project_left[project])
+        expected.append((donation, project, amount))
+        donation_left[donation] -= amount
+        project_left[project] -= amount
+        donation += donation_left[donation] == 0
+        project += project_left[project] == 0
+    assert allocate(donation_sums, project_sums) == expected, test_allocation_kernel_matches_fifo.__doc__
+    for index in range(len(projects)):
+        assert funding(index, project_sums, donation_sums) == [
+            (donation, amount) for donation, project, amount in expected if project == index
+        ], test_allocation_kernel_matches_fifo.__doc__
+
+
+def test_donation_batch_allocated_by_kernel(user_client, mixer):
+    """Пачка пожертвований покрывает три проекта. Суммы проектов и пожертвований должны совпасть с последовательным FIFO."""
+    for name, full_amount in (('first', 150), ('second', 100), ('third', 40)):
+        mixer.blend(
+            'app.models.charity_project.CharityProject',
+            name=name,
+            full_amount=full_amount,
+            create_date=datetime(2010, 10, 10),
+        )
+    user_client.post('/donation/batch', json=[{'full_amount': 120}] * 3)
+    projects = user_client.get('/charity_project/').json()
+    assert [
+        (item['invested_amount'], item['fully_invested']) for item in projects
+    ] == [(150, True), (100, True), (40, True)], test_donation_batch_allocated_by_kernel.__doc__
+    donations = user_client.get('/donation/').json()
+    assert [
+        (item['invested_amount'], item['fully_invested']) for item in donations
+    ] == [(120, True), (120, True), (50, False)], test_donation_batch_allocated_by_kernel.__doc__
+    assert allocation_stats.last.rows_touched == 3, test_donation_batch_allocated_by_kernel.__doc__
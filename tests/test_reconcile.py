@@ -0,0 +1,36 @@
+import sqlite3
+
+import pytest
+from conftest import TEST_DB
+from sqlalchemy import create_engine
+
+pytest.importorskip('numpy')
+
+from app.services.reconcile import reconcile  # noqa
+
+
+def test_reconcile_reports_and_fixes(charity_project_little_invested, donation):
+    """Проект частично инвестирован, а пожертвование не распределено. Сверка должна найти и исправить пожертвование."""
+    engine = create_engine(f'sqlite:///{TEST_DB}')
+    with engine.begin() as connection:
+        report = reconcile(connection)
+    assert report['charityproject']['mismatched'] == 0, test_reconcile_reports_and_fixes.__doc__
+    assert report['donation']['mismatched'] == 1, test_reconcile_reports_and_fixes.__doc__
+    assert report['donation']['sample'] == [1], test_reconcile_reports_and_fixes.__doc__
+
+    with engine.begin() as connection:
+        reconcile(connection, fix=True)
+    with sqlite3.connect(TEST_DB) as connection:
+        row = connection.execute(
+            'SELECT invested_amount, fully_invested, close_date FROM donation'
+        ).fetchone()
+    assert row == (100, 1, '2011-11-11 00:00:00.000000'), test_reconcile_reports_and_fixes.__doc__
+    with sqlite3.connect(TEST_DB) as connection:
+        totals = connection.execute(
+            'SELECT donation_open_count, donation_free_amount FROM allocationstate'
+        ).fetchone()
+    assert totals == (0, 0), test_reconcile_reports_and_fixes.__doc__
+    with engine.begin() as connection:
+        report = reconcile(connection)
+    assert report['donation']['mismatched'] == 0, test_reconcile_reports_and_fixes.__doc__
+    engine.dispose()